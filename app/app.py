@@ -9,6 +9,8 @@ from utils.display import (
 from config_files import (
     config
 )
+from src import metrics
+from src.redis_db import start_warm_up
 
 
 def main():
@@ -17,6 +19,7 @@ def main():
     """
 
     config.setup()
+    metrics.start_exporters()
 
     # --- Page containers --- #
     logo_container = st.container()
@@ -35,6 +38,9 @@ def main():
     with page_content_container:
         main_page.main()
 
+    # Once the page is rendered: load the embedding model and open the redis connection pool in the background
+    start_warm_up()
+
 
 if __name__ == "__main__":
     main()
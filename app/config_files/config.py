@@ -24,15 +24,44 @@ default_val_session_state_vars_dict = {
     'k_similar': 50,
     'year_min': 2000,
     'year_max': datetime.datetime.now().year,
-    'categories': []
+    'categories': [],
+    'diversify': False,
+    'diversify_sub': False,
+    # --- Paper explored with "More like this" --- #
+    'more_like_this_id': '',
+    'more_like_this_title': '',
+    # --- Number of pages displayed in the papers overview --- #
+    'overview_pages': 1,
+    # --- Data of the page sections, for the search they were computed for (see utils.sections) --- #
+    'sections_search_key': None,
+    'sections_cache': {}
 }
 
+# Number of papers per page of the papers overview
+OVERVIEW_PAGE_SIZE = 20
+
+# Number of papers displayed by "More like this"
+MORE_LIKE_THIS_K = 10
+
+# Page sections computed after a search (topic trend, evolution graph, reading list): threads shared by the
+# sessions, and timeout of each section (seconds)
+SECTIONS_MAX_WORKERS = 4
+SECTION_TIMEOUTS = {
+    'topic_trend': 30,
+    'arc_graph': 30,
+    'reading_list': 30
+}
+
+# Maximum number of papers whose details (abstract, authors, categories) are kept in a session
+DETAILS_CACHE_SIZE = 500
+
+# Category label -> category tag, as stored in the DB (exact match)
 arxiv_categories_mapping = {
-    "Machine learning": "cs\\.lg",
-    "Artificial Intelligence": "cs\\.ai",
-    "Computation and language": "cs\\.cl",
-    "Computer Vision and Pattern Recognition": "cs\\.cv",
-    "Neural and Evolutionary Computing": "cs\\.ne",
+    "Machine learning": "cs.lg",
+    "Artificial Intelligence": "cs.ai",
+    "Computation and language": "cs.cl",
+    "Computer Vision and Pattern Recognition": "cs.cv",
+    "Neural and Evolutionary Computing": "cs.ne",
 }
 
 
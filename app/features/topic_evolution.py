@@ -2,10 +2,8 @@ import streamlit as st
 import asyncio
 import calendar
 import datetime
-import pandas as pd
+import functools
 import numpy as np
-import plotly.graph_objects as go
-from matplotlib import pyplot as plt
 
 from utils.widgets import update_session_state_var
 from utils.graph import (
@@ -13,9 +11,23 @@ from utils.graph import (
     get_arc_graph
 )
 from utils.display import display_section_title
-from src.redis_db import execute_user_query
+from utils.sections import Section, render_sections
+from src.redis_db import (
+    execute_user_query,
+    execute_paper_id_query,
+    execute_broad_topic_query,
+    get_paper_details,
+    SLIM_FIELDS,
+    GRAPH_FIELDS
+)
+from src.trends import get_topic_trend, get_broad_topic_trend
+from src.results import ResultSet
+from src.config import CATEGORIES_SEPARATOR, MMR_LAMBDA
+from src.metrics import timer
 from config_files import config
-from statsmodels.tsa.holtwinters import Holt
+
+# pandas, plotly, matplotlib and statsmodels are imported in the functions using them, once a search is made:
+# they are not needed to display the search page.
 
 
 def get_user_search_query():
@@ -98,6 +110,17 @@ def get_search_filters():
             }
         )
 
+    st.checkbox(
+        label="Diversify the results (avoid near-duplicate papers)",
+        value=st.session_state.diversify,
+        key='diversify_checkbox',
+        on_change=update_session_state_var,
+        kwargs={
+            'session_state_var_name': 'diversify',
+            'widget_key': 'diversify_checkbox'
+        }
+    )
+
 
 def update_sub_params():
     """
@@ -109,6 +132,10 @@ def update_sub_params():
     st.session_state.year_min_sub = st.session_state.year_min
     st.session_state.year_max_sub = st.session_state.year_max
     st.session_state.k_similar_sub = st.session_state.k_similar
+    st.session_state.diversify_sub = st.session_state.diversify
+    st.session_state.overview_pages = 1
+    st.session_state.more_like_this_id = ''
+    st.session_state.more_like_this_title = ''
 
 
 def set_submit_button():
@@ -122,8 +149,15 @@ def set_submit_button():
     )
 
 
+def get_mmr_lambda(diversify):
+    """
+    Get the relevance / diversity trade-off of the search: None (most similar papers only) if not diversified.
+    """
+    return MMR_LAMBDA if diversify else None
+
+
 @st.experimental_memo
-def get_search_query_results(user_search_query, k_similar, year_min, year_max, categories):
+def get_search_query_results(user_search_query, k_similar, year_min, year_max, categories, diversify=False):
     """
     Get the search query results based on the user's query and search filters.
 
@@ -137,11 +171,16 @@ def get_search_query_results(user_search_query, k_similar, year_min, year_max, c
         Lower bound of the publication date for the papers to be retrieved
     year_max : int
         Upper bound of the publication date for the papers to be retrieved
+    categories : list(str)
+        Categories of the papers to be retrieved
+    diversify : bool
+        Whether to diversify the results (Maximal Marginal Relevance) instead of returning the most similar papers
 
     Returns
     ----------
-    search_query_results : List(dict)
-        List of search query results
+    search_query_results : ResultSet
+        Search query results (see src.results), with the fields needed by the analysis sections only
+        (see GRAPH_FIELDS)
     """
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
@@ -150,36 +189,272 @@ def get_search_query_results(user_search_query, k_similar, year_min, year_max, c
         k=k_similar,
         year_min=year_min,
         year_max=year_max,
-        categories=[config.arxiv_categories_mapping[category] + "*" for category in categories]
+        categories=[config.arxiv_categories_mapping[category] for category in categories],
+        return_fields=GRAPH_FIELDS,
+        mmr_lambda=get_mmr_lambda(diversify),
+        as_result_set=True
     )
     # Add index based on position in result
-    for i, paper in enumerate(search_query_results):
-        paper['list_index'] = i
+    return search_query_results.with_column('list_index', range(len(search_query_results)))
 
-    return search_query_results
+
+@st.experimental_memo
+def get_search_query_results_page(
+    user_search_query, k_similar, year_min, year_max, categories, page, page_size, diversify=False
+):
+    """
+    Get one page of the search query results: the papers [page * page_size, (page + 1) * page_size) among
+    the k_similar most similar ones. Only this page is retrieved and hydrated, whatever k_similar.
+
+    Parameters
+    ----------
+    user_search_query, k_similar, year_min, year_max, categories, diversify :
+        See get_search_query_results.
+    page : int
+        Page number, starting from 0.
+    page_size : int
+        Number of papers per page.
+
+    Returns
+    ----------
+    search_query_results : ResultSet
+        Page of search query results, without their details (see get_papers_details)
+    """
+    offset = page * page_size
+    search_query_results = execute_user_query(
+        user_text=user_search_query,
+        k=k_similar,
+        year_min=year_min,
+        year_max=year_max,
+        categories=[config.arxiv_categories_mapping[category] for category in categories],
+        offset=offset,
+        page_size=page_size,
+        return_fields=SLIM_FIELDS,
+        mmr_lambda=get_mmr_lambda(diversify),
+        as_result_set=True
+    )
+    # Add index based on position in the whole result
+    return search_query_results.with_column('list_index', range(offset, offset + len(search_query_results)))
 
 
 @st.experimental_memo
-def display_topic_trend(query_results):
+def get_broad_topic(user_search_query, k_similar, year_min, year_max, categories, diversify=False):
     """
-    Display topic trend + optional prediction for the next two years if more than 5 non zero data points are available.
+    Get the summary of a broad search query from the precomputed topics of the corpus (see src.topics): its yearly
+    counts and the top papers of the topics it matches, instead of its k_similar most similar papers.
 
     Parameters
     ----------
-    query_results : list(dict)
-        List of most similar papers
-    """
-    dates = [int(el['year']) for el in query_results]
-    weights = [1 for _ in query_results]
-    all_dates = [year for year in range(min(dates), max(dates) + 1, 1)]
-    zeros = [0] * len(all_dates)
-    time_series_df = pd.DataFrame(
-        {
-            'date': dates + all_dates,
-            'count_papers': weights + zeros
-        }
+    user_search_query, k_similar, year_min, year_max, categories, diversify :
+        See get_search_query_results.
+
+    Returns
+    ----------
+    broad_topic : dict or None
+        Matched 'topic_ids', yearly 'counts' and top 'papers' (a ResultSet with the fields of GRAPH_FIELDS), None
+        if the query is not broad enough (or diversified)
+    """
+    if diversify:
+        return None
+    broad_topic = execute_broad_topic_query(
+        user_text=user_search_query,
+        k=k_similar,
+        year_min=year_min,
+        year_max=year_max,
+        categories=[config.arxiv_categories_mapping[category] for category in categories]
+    )
+    if broad_topic is not None:
+        papers = ResultSet.from_dicts(broad_topic['papers'])
+        broad_topic['papers'] = papers.with_column('list_index', range(len(papers)))
+    return broad_topic
+
+
+def get_submitted_broad_topic():
+    """
+    Get the summary of the submitted search query from the precomputed topics, if it is broad (see get_broad_topic).
+    """
+    return get_broad_topic(
+        user_search_query=st.session_state.user_search_query_sub,
+        k_similar=st.session_state.k_similar_sub,
+        year_min=st.session_state.year_min_sub,
+        year_max=st.session_state.year_max_sub,
+        categories=st.session_state.categories_sub,
+        diversify=st.session_state.diversify_sub
+    )
+
+
+def get_submitted_results_page(page):
+    """
+    Get one page of the results of the submitted search query (see get_search_query_results_page).
+    """
+    return get_search_query_results_page(
+        user_search_query=st.session_state.user_search_query_sub,
+        k_similar=st.session_state.k_similar_sub,
+        year_min=st.session_state.year_min_sub,
+        year_max=st.session_state.year_max_sub,
+        categories=st.session_state.categories_sub,
+        page=page,
+        page_size=config.OVERVIEW_PAGE_SIZE,
+        diversify=st.session_state.diversify_sub
     )
-    time_series_df = time_series_df.groupby('date').sum().reset_index()
+
+
+def get_papers_details(paper_ids):
+    """
+    Get the details (abstract, authors, categories) of papers. They are kept in a per-session cache, holding the
+    details of the last config.DETAILS_CACHE_SIZE papers: only the missing ones are fetched, in a single batch.
+
+    Parameters
+    ----------
+    paper_ids : list(str)
+        Ids of the papers
+
+    Returns
+    ----------
+    papers_details : dict
+        Paper id -> dict of details
+    """
+    if 'paper_details' not in st.session_state:
+        st.session_state.paper_details = {}
+    cache = st.session_state.paper_details
+    missing = [paper_id for paper_id in paper_ids if paper_id not in cache]
+    cache.update(get_paper_details(missing))
+    papers_details = {paper_id: cache[paper_id] for paper_id in paper_ids}
+    # Dicts keep their insertion order: the oldest papers are evicted first
+    for paper_id in list(cache)[:max(0, len(cache) - config.DETAILS_CACHE_SIZE)]:
+        del cache[paper_id]
+    return papers_details
+
+
+def show_more_like_this(paper_id, title):
+    """
+    Explore the papers similar to a given paper (see display_more_like_this).
+    """
+    st.session_state.more_like_this_id = paper_id
+    st.session_state.more_like_this_title = title
+
+
+def close_more_like_this():
+    """
+    Close the "More like this" section.
+    """
+    st.session_state.more_like_this_id = ''
+    st.session_state.more_like_this_title = ''
+
+
+@st.experimental_memo
+def get_more_like_this_results(paper_id, year_min, year_max, categories):
+    """
+    Get the papers most similar to a given paper, from its stored vector (no embedding model inference).
+
+    Parameters
+    ----------
+    paper_id : str
+        Id of the paper
+    year_min, year_max, categories :
+        See get_search_query_results.
+
+    Returns
+    ----------
+    more_like_this_results : ResultSet
+        config.MORE_LIKE_THIS_K most similar papers, the paper itself excluded
+    """
+    return ResultSet.from_dicts(execute_paper_id_query(
+        paper_id=paper_id,
+        k=config.MORE_LIKE_THIS_K,
+        year_min=year_min,
+        year_max=year_max,
+        categories=[config.arxiv_categories_mapping[category] for category in categories]
+    ))
+
+
+def display_more_like_this():
+    """
+    Display the papers most similar to the paper selected with a "More like this" button, with the submitted
+    search filters. Each of them can be explored in turn.
+    """
+    results = get_more_like_this_results(
+        paper_id=st.session_state.more_like_this_id,
+        year_min=st.session_state.year_min_sub,
+        year_max=st.session_state.year_max_sub,
+        categories=st.session_state.categories_sub
+    )
+    st.info(f"Papers similar to: {st.session_state.more_like_this_title}")
+    for i, paper in enumerate(results):
+        title_col, date_col, button_col = st.columns([6, 2, 1])
+        with title_col:
+            st.markdown(
+                f"[{paper['title']}](https://arxiv.org/abs/{paper['paper_id']}) "
+                f"(similarity: {round(paper['similarity_score'], 2)})"
+            )
+        with date_col:
+            st.markdown(f"{calendar.month_name[paper['month']]} {paper['year']}")
+        with button_col:
+            st.button(
+                label='More like this',
+                key=f"more_like_this_hop_{i}",
+                on_click=show_more_like_this,
+                kwargs={'paper_id': paper['paper_id'], 'title': paper['title']}
+            )
+    st.button(
+        label='Close',
+        key='more_like_this_close',
+        on_click=close_more_like_this
+    )
+
+
+def load_more_results():
+    """
+    Display one more page of results in the papers overview.
+    """
+    st.session_state.overview_pages += 1
+
+
+def get_submitted_search_params():
+    """
+    Get the parameters of the submitted search query, as passed to the search and trend functions.
+
+    Returns
+    ----------
+    search_params : dict
+        'user_text', 'k', 'year_min', 'year_max', 'categories' (as stored in the DB) and 'mmr_lambda'
+    """
+    return {
+        'user_text': st.session_state.user_search_query_sub,
+        'k': st.session_state.k_similar_sub,
+        'year_min': st.session_state.year_min_sub,
+        'year_max': st.session_state.year_max_sub,
+        'categories': [config.arxiv_categories_mapping[category] for category in st.session_state.categories_sub],
+        'mmr_lambda': get_mmr_lambda(st.session_state.diversify_sub)
+    }
+
+
+def get_topic_trend_figure(trend):
+    """
+    Get the topic trend figure + optional prediction for the next two years if more than 5 years of history are
+    available. The trend is the share of the papers published each year (in the selected categories) which are
+    among the results, so that it does not follow the overall growth of arXiv.
+
+    Parameters
+    ----------
+    trend : dict
+        Yearly 'counts', 'share' (if the publication counters are available), and 'forecast' (see src.trends)
+
+    Returns
+    ----------
+     : Graph object
+        Topic trend figure.
+    """
+    import plotly.graph_objects as go
+
+    if trend['normalized']:
+        values = 100 * np.asarray(trend['share'])
+        forecast = 100 * np.asarray(trend['forecast'])
+        y_title = "Share of the year's papers (%)"
+    else:
+        values = np.asarray(trend['counts'])
+        forecast = np.asarray(trend['forecast'])
+        y_title = "Papers count"
 
     fig = go.Figure(
         layout=go.Layout(
@@ -187,52 +462,80 @@ def display_topic_trend(query_results):
                 title="Year"
             ),
             yaxis=dict(
-                title="Papers count"
+                title=y_title
             ),
             margin=dict(t=30, b=30, l=1, r=1)
         )
     )
     fig.add_trace(
         go.Scatter(
-            x=time_series_df['date'].values,
-            y=time_series_df['count_papers'].values,
+            x=trend['years'],
+            y=values,
             name='Topic evolution',
             line=dict(color='#0097a7', width=4)
         )
     )
 
-    # Predict topic trend for next 2 years if we have at least 5 year of history
-    if len(all_dates) >= 5:
-        ts_index = pd.date_range(start=str(min(dates)), end=str(max(dates) + 1), freq="A")
-        ts_series = pd.Series(time_series_df['count_papers'].values, ts_index)
-        pred = (
-            Holt(ts_series, damped_trend=True, initialization_method="estimated")
-            .fit(smoothing_level=0.8, smoothing_trend=0.2)
-            .forecast(2)
-        )
+    if len(forecast) > 0:
+        last_year = trend['years'][-1]
         fig.add_trace(
             go.Scatter(
-                x=[year for year in range(max(dates), max(dates) + 3, 1)],
-                y=np.concatenate([time_series_df['count_papers'].values[-1:], pred.values], axis=0),
+                x=[last_year] + trend['forecast_years'],
+                y=np.concatenate([values[-1:], forecast], axis=0),
                 name='Predicted evolution',
                 line=dict(color='#e71869 ', width=4, dash='dash')
             )
         )
+    return fig
+
+
+def compute_topic_trend_section(query_results, search_params, broad_topic=None):
+    """
+    Compute the topic trend figure of the results (see src.trends), without streamlit.
+
+    Parameters
+    ----------
+    query_results : ResultSet
+        Most similar papers
+    search_params : dict
+        Parameters of the search (see get_submitted_search_params)
+    broad_topic : dict
+        Summary of a broad query (see get_broad_topic): the trend is then the one of the papers of its topics
+    """
+    if broad_topic:
+        trend = get_broad_topic_trend(broad_topic)
+    else:
+        trend = get_topic_trend(query_results=query_results, **search_params)
+    return get_topic_trend_figure(trend)
+
 
+def display_topic_trend(fig):
+    """
+    Display the topic trend figure (see compute_topic_trend_section).
+    """
     st.plotly_chart(
         fig,
         use_container_width=True
     )
 
 
-def display_arc_graph(query_results):
+def compute_arc_graph_section(query_results):
     """
-    Display arc graph with citations relationships.
+    Compute the arc graph figure of the citations relationships between the results, without streamlit.
 
     Parameters
     ----------
-    query_results : list(dict)
-        List of most similar papers
+    query_results : ResultSet
+        Most similar papers
+    """
+    # The undecorated functions: the memo caches need the script thread (the section is cached in the session)
+    graph_data = getattr(get_graph_data, "__wrapped__", get_graph_data)(query_results)
+    return getattr(get_arc_graph, "__wrapped__", get_arc_graph)(graph_data)
+
+
+def display_arc_graph(graph_fig):
+    """
+    Display arc graph with citations relationships (see compute_arc_graph_section).
     """
     col, _ = st.columns(2)
     col.info(
@@ -241,56 +544,104 @@ def display_arc_graph(query_results):
         "- The size of a bubble is related to the number of citations of the paper.  \n"
         "- Links between bubbles represent citations."
     )
-    graph_fig = get_arc_graph(get_graph_data(query_results))
     st.plotly_chart(
         figure_or_data=graph_fig,
         use_container_width=True
     )
 
 
-@st.experimental_memo
 def get_reading_list(query_results, K_reading_list):
     """
-    Display arc graph with citations relationships.
+    Get the reading list: the K_reading_list results with the best reading score (number of citations times
+    similarity), ordered by publication date.
 
     Parameters
     ----------
-    query_results : list(dict)
-        List of most similar papers
+    query_results : ResultSet
+        Most similar papers
+    K_reading_list : int
+        Number of papers of the reading list
     """
-    query_results = query_results.copy()
-    for paper in query_results:
-        paper['reading_score'] = len(paper['citations'].split(',')) * paper['similarity_score']
+    query_results = ResultSet.of(query_results)
+    reading_scores = query_results['citation_count'] * query_results['similarity_score']
     # Select top K relevant
-    reading_result = sorted(query_results, key=lambda d: d['reading_score'], reverse=True)[:K_reading_list]
+    reading_result = query_results.take(np.argsort(-reading_scores, kind='stable')[:K_reading_list])
     # Order by date
-    reading_result = sorted(reading_result, key=lambda d: d['year'] + '-' + d['month'])
-    return reading_result
+    return reading_result.take(reading_result.date_order())
 
 
-def display_reading_list(query_results):
+def get_bar_figure(value, max_value):
+    """
+    Get a horizontal bar figure of a value, out of max_value (built without pyplot, so that it is thread safe).
     """
-    Display reading list with title, publication date, similarity score and number of citations.
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=[7.50, 0.9], tight_layout=True)
+    ax = fig.subplots()
+    ax.barh([''], [value], color="#49b6c2")
+    ax.barh([''], [max_value - value], left=[value], color="#939492")
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['bottom'].set_visible(False)
+    ax.spines['left'].set_visible(False)
+    ax.get_xaxis().set_ticks([0, value, max_value])
+    ax.get_yaxis().set_ticks([])
+    return fig
+
+
+def compute_reading_list_section(query_results, K_reading_list):
+    """
+    Compute the reading list, along with the similarity score and number of citations figures of its papers,
+    without streamlit.
 
     Parameters
     ----------
-    query_results : list(dict)
-        List of most similar papers
+    query_results : ResultSet
+        Most similar papers
+    K_reading_list : int
+        Number of papers of the reading list
+
+    Returns
+    ----------
+     : list(tuple)
+        (paper, similarity score figure, number of citations figure) of the papers of the reading list
+    """
+    reading_result = get_reading_list(query_results, K_reading_list)
+    max_citations = int(reading_result['citation_count'].max())
+    with timer("matplotlib_render"):
+        return [
+            (
+                paper,
+                get_bar_figure(paper['similarity_score'], 1),
+                get_bar_figure(paper['citation_count'], max_citations)
+            )
+            for paper in reading_result
+        ]
+
+
+def get_reading_list_size():
+    """
+    Display the input of the size of the reading list, and get its value.
     """
     st.info(
         "The suggested reading list is based on the papers with the highest number of citations and similarity score. "
         "It is ordered by ascending publication date."
     )
     col_1, _, _ = st.columns(3)
-    K_reading_list = col_1.number_input(
+    return col_1.number_input(
         label="Select the number of papers you're willing to read about this topic",
         min_value=1,
         max_value=st.session_state.k_similar,
         value=min(st.session_state.k_similar, 5),
         step=1
     )
-    reading_result = get_reading_list(query_results, K_reading_list)
 
+
+def display_reading_list(reading_list):
+    """
+    Display reading list with title, publication date, similarity score and number of citations
+    (see compute_reading_list_section).
+    """
     ref_col, date_col, sim_col, citations_col = st.columns(4)
     with ref_col:
         display_section_title('Title (link)', 'tab_header')
@@ -301,8 +652,7 @@ def display_reading_list(query_results):
     with citations_col:
         display_section_title('Citations', 'tab_header')
 
-    max_citations = max([len(paper['citations'].split(',')) for paper in reading_result])
-    for paper in reading_result:
+    for paper, similarity_fig, citations_fig in reading_list:
         ref_col, date_col, sim_col, citations_col = st.columns(4)
         with ref_col:
             st.markdown(
@@ -311,38 +661,70 @@ def display_reading_list(query_results):
                 unsafe_allow_html=True
             )
         with date_col:
-            date = f"{calendar.month_name[int(paper['month'])]} {paper['year']}"
+            date = f"{calendar.month_name[paper['month']]} {paper['year']}"
             st.markdown(
                 f"<h6 style='text-align: center; color: #010924; '>{date}</h6>",
                 unsafe_allow_html=True
             )
         with sim_col:
-            plt.rcParams["figure.autolayout"] = True
-            plt.rcParams["figure.figsize"] = [7.50, 0.9]
-            fig, ax = plt.subplots()
-            ax.barh([''], [paper['similarity_score']], color="#49b6c2")
-            ax.barh([''], [1 - paper['similarity_score']], left=[paper['similarity_score']], color="#939492")
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['bottom'].set_visible(False)
-            ax.spines['left'].set_visible(False)
-            ax.get_xaxis().set_ticks([0, paper['similarity_score'], 1])
-            ax.get_yaxis().set_ticks([])
-            st.pyplot(fig)
+            st.pyplot(similarity_fig)
         with citations_col:
-            n_citations = len(paper['citations'].split(','))
-            plt.rcParams["figure.autolayout"] = True
-            plt.rcParams["figure.figsize"] = [7.50, 0.9]
-            fig, ax = plt.subplots()
-            ax.barh([''], [n_citations], color="#49b6c2")
-            ax.barh([''], [max_citations - n_citations], left=[n_citations], color="#939492")
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['bottom'].set_visible(False)
-            ax.spines['left'].set_visible(False)
-            ax.get_xaxis().set_ticks([0, n_citations, max_citations])
-            ax.get_yaxis().set_ticks([])
-            st.pyplot(fig)
+            st.pyplot(citations_fig)
+
+
+def display_result_sections(query_results, containers, broad_topic=None):
+    """
+    Display the sections computed from the search results: topic trend, topic evolution (arc graph) and reading
+    list. They are computed concurrently, each one being displayed as soon as it is ready (see utils.sections).
+
+    Parameters
+    ----------
+    query_results : ResultSet
+        Most similar papers
+    containers : dict
+        Containers of the 'topic_trend', 'arc_graph' and 'reading_list' sections
+    broad_topic : dict
+        Summary of a broad query (see get_broad_topic), the results being its top papers
+    """
+    search_params = get_submitted_search_params()
+    with containers['topic_trend']:
+        display_section_title("Topic trend", "large")
+    with containers['arc_graph']:
+        display_section_title("Topic evolution", "large")
+    with containers['reading_list']:
+        display_section_title("Reading list recommender", "large")
+        K_reading_list = get_reading_list_size()
+
+    sections = [
+        Section(
+            name='topic_trend',
+            key='topic_trend',
+            container=containers['topic_trend'],
+            compute=functools.partial(compute_topic_trend_section, query_results, search_params, broad_topic),
+            render=display_topic_trend,
+            timeout=config.SECTION_TIMEOUTS['topic_trend']
+        ),
+        Section(
+            name='arc_graph',
+            key='arc_graph',
+            container=containers['arc_graph'],
+            compute=functools.partial(compute_arc_graph_section, query_results),
+            render=display_arc_graph,
+            timeout=config.SECTION_TIMEOUTS['arc_graph']
+        ),
+        Section(
+            name='reading_list',
+            key=('reading_list', K_reading_list),
+            container=containers['reading_list'],
+            compute=functools.partial(compute_reading_list_section, query_results, K_reading_list),
+            render=display_reading_list,
+            timeout=config.SECTION_TIMEOUTS['reading_list']
+        ),
+    ]
+    search_key = tuple(
+        tuple(value) if isinstance(value, list) else value for value in search_params.values()
+    ) + (broad_topic is not None,)
+    render_sections(sections, search_key)
 
 
 def display_search_query_results(user_search_query_results):
@@ -351,8 +733,8 @@ def display_search_query_results(user_search_query_results):
 
     Parameters
     ----------
-    query_results : list(dict)
-        List of most similar papers
+    query_results : ResultSet
+        Most similar papers
     """
     st.markdown(
         """
@@ -366,8 +748,9 @@ def display_search_query_results(user_search_query_results):
         """,
         unsafe_allow_html=True,
     )
-    for i in range(len(user_search_query_results)):
-        res = user_search_query_results[i]
+    papers_details = get_papers_details(user_search_query_results['paper_id'].tolist())
+    for res in user_search_query_results:
+        details = papers_details[res['paper_id']]
         st.markdown(
             f"""
             <a id="section-{res['list_index']}">\n</a>
@@ -376,18 +759,50 @@ def display_search_query_results(user_search_query_results):
         )
         expander = st.expander(
             label=(
-                f"{i + 1} - {res['title']}"
+                f"{res['list_index'] + 1} - {res['title']}"
             )
         )
         with expander:
             st.markdown(
                 (
-                    f"**Author(s):** {res['authors']}  \n"
-                    f"**Publication date:** {calendar.month_name[int(res['month'])]} {res['year']}  \n"
-                    f"**Categories:** {res['categories']}  \n"
+                    f"**Author(s):** {details['authors'] or ''}  \n"
+                    f"**Publication date:** {calendar.month_name[res['month']]} {res['year']}  \n"
+                    f"**Categories:** {', '.join((details['categories'] or '').split(CATEGORIES_SEPARATOR))}  \n"
                     f"**Similarity score:** {round(res['similarity_score'], 2)}/1  \n"
-                    f"**Number of citations:** {len(res['citations'].split(','))}  \n"
-                    f"**Abstract:** {res['abstract']}  \n"
+                    f"**Number of citations:** {res['citation_count']}  \n"
+                    f"**Abstract:** {details['abstract'] or ''}  \n"
                     f"[Go to paper](https://arxiv.org/abs/{res['paper_id']})"
                 )
             )
+            st.button(
+                label='More like this',
+                key=f"more_like_this_{res['list_index']}",
+                on_click=show_more_like_this,
+                kwargs={'paper_id': res['paper_id'], 'title': res['title']}
+            )
+
+
+def display_paged_search_query_results(first_page):
+    """
+    Display the papers overview page by page: the pages already requested are displayed, along with a button
+    fetching the next one, as long as there are more results.
+
+    Parameters
+    ----------
+    first_page : ResultSet
+        First page of the most similar papers
+    """
+    display_search_query_results(first_page)
+    last_page = first_page
+    for page in range(1, st.session_state.overview_pages):
+        if len(last_page) < config.OVERVIEW_PAGE_SIZE:
+            break
+        last_page = get_submitted_results_page(page)
+        display_search_query_results(last_page)
+
+    n_displayed = last_page[-1]['list_index'] + 1 if last_page else 0
+    if len(last_page) == config.OVERVIEW_PAGE_SIZE and n_displayed < st.session_state.k_similar_sub:
+        st.button(
+            label='Load more papers',
+            on_click=load_more_results
+        )
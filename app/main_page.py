@@ -8,10 +8,11 @@ from features.topic_evolution import (
     get_search_filters,
     set_submit_button,
     get_search_query_results,
-    display_search_query_results,
-    display_topic_trend,
-    display_arc_graph,
-    display_reading_list
+    get_submitted_broad_topic,
+    get_submitted_results_page,
+    display_paged_search_query_results,
+    display_more_like_this,
+    display_result_sections
 )
 
 
@@ -28,6 +29,7 @@ def main():
     topic_trend_container = st.container()
     topic_arc_graph_container = st.container()
     reading_recommendation_container = st.container()
+    more_like_this_container = st.container()
     search_papers_display_container = st.container()
 
     # --- Page --- #
@@ -43,48 +45,53 @@ def main():
     with submit_button_container:
         set_submit_button()
 
+    with more_like_this_container:
+        if len(st.session_state.user_search_query_sub) > 0 and len(st.session_state.more_like_this_id) > 0:
+            display_section_title("More like this", "large")
+            display_more_like_this()
+
+    # The first page of the papers overview is fetched and displayed first: its latency does not depend on k
+    with search_papers_display_container:
+        if len(st.session_state.user_search_query_sub) > 0:
+            first_page = get_submitted_results_page(0)
+            if len(first_page) > 0:
+                display_section_title("Papers overview (ordered by similarity)", "large")
+                display_paged_search_query_results(first_page)
+
+    # Broad queries are summarized from the precomputed topics: their k most similar papers are not searched
+    broad_topic = None
     with execute_seach_query_container:
         if len(st.session_state.user_search_query_sub) > 0:
+            broad_topic = get_submitted_broad_topic()
+        if broad_topic is not None:
+            st.info(
+                "Broad query: the analysis below covers the papers of the matching topics "
+                f"({broad_topic['size']} papers), and their most representative papers."
+            )
+            st.session_state.user_search_query_results = broad_topic['papers']
+        elif len(st.session_state.user_search_query_sub) > 0:
             st.session_state.user_search_query_results = get_search_query_results(
                 user_search_query=st.session_state.user_search_query_sub,
                 k_similar=st.session_state.k_similar_sub,
                 year_min=st.session_state.year_min_sub,
                 year_max=st.session_state.year_max_sub,
-                categories=st.session_state.categories_sub
+                categories=st.session_state.categories_sub,
+                diversify=st.session_state.diversify_sub
             )
         else:
             st.session_state.user_search_query_results = []
 
-    with topic_trend_container:
-        if len(st.session_state.user_search_query_results) > 1 and len(st.session_state.user_search_query_sub) > 0:
-            display_section_title("Topic trend", "large")
-            display_topic_trend(
-                query_results=st.session_state.user_search_query_results
-            )
-        elif len(st.session_state.user_search_query_sub) == 0:
-            pass
-        else:
+    # Topic trend, evolution graph and reading list: computed concurrently, each displayed once ready
+    if len(st.session_state.user_search_query_results) > 1 and len(st.session_state.user_search_query_sub) > 0:
+        display_result_sections(
+            query_results=st.session_state.user_search_query_results,
+            containers={
+                'topic_trend': topic_trend_container,
+                'arc_graph': topic_arc_graph_container,
+                'reading_list': reading_recommendation_container
+            },
+            broad_topic=broad_topic
+        )
+    elif len(st.session_state.user_search_query_sub) > 0:
+        with topic_trend_container:
             st.warning('Your query has one or less related papers. Please use less restrictive filter or change your query.')
-
-    with topic_arc_graph_container:
-        if len(st.session_state.user_search_query_results) > 1 and len(st.session_state.user_search_query_sub) > 0:
-            display_section_title("Topic evolution", "large")
-            display_arc_graph(
-                query_results=st.session_state.user_search_query_results
-            )
-        else:
-            pass
-
-    with reading_recommendation_container:
-        if len(st.session_state.user_search_query_results) > 1 and len(st.session_state.user_search_query_sub) > 0:
-            display_section_title("Reading list recommender", "large")
-            display_reading_list(
-                query_results=st.session_state.user_search_query_results
-            )
-        else:
-            pass
-
-    with search_papers_display_container:
-        if st.session_state.user_search_query_results is not None and len(st.session_state.user_search_query_results) > 0:
-            display_section_title("Papers overview (ordered by similarity)", "large")
-            display_search_query_results(st.session_state.user_search_query_results)
@@ -1,12 +1,9 @@
 import numpy as np
 import streamlit as st
-import plotly.graph_objs as go
 import calendar
 
-from sklearn.preprocessing import (
-    MinMaxScaler
-)
-from scipy import stats
+from src.metrics import timed
+from src.results import ResultSet
 
 
 def get_b1(b0, b2):
@@ -84,25 +81,27 @@ def Rational_Bezier_curve(a, nr):
 
 
 @st.experimental_memo
+@timed("get_graph_data")
 def get_graph_data(query_results):
     """
     Transform search query results into a dict of two elements: 'nodes' and 'links'.
 
     Parameters
     ----------
-    query_results : list
-        List of most similar papers
+    query_results : ResultSet
+        Most similar papers (see src.results)
     Returns
     ----------
      : dict
         Dict of two elements: 'nodes' and 'links' representing the citations graph.
     """
+    query_results = ResultSet.of(query_results)
     # Sort nodes by ascending date
-    nodes = sorted(query_results, key=lambda d: d['year'] + '-' + d['month'])
+    nodes = query_results.take(query_results.date_order())
     nodes = [
         {
             'title': paper['title'],
-            'nb_citations': len(paper['citations'].split(',')),
+            'nb_citations': paper['citation_count'],
             'year': paper['year'],
             'month': paper['month'],
             'similarity_score': paper['similarity_score'],
@@ -115,15 +114,19 @@ def get_graph_data(query_results):
 
     links = []
     sch_ids = [paper['sch_id'] for paper in nodes]
+    # Position of the first node of each sch_id
+    positions = {}
+    for i, sch_id in enumerate(sch_ids):
+        positions.setdefault(sch_id, i)
 
     for paper in nodes:
         links += [
             {
-                'source': sch_ids.index(sch_id),
-                'target': sch_ids.index(paper['sch_id']),
+                'source': positions[sch_id],
+                'target': positions[paper['sch_id']],
                 'value': 10
             }
-            for sch_id in list(set(sch_ids).intersection(set(paper['citations'].split(','))))
+            for sch_id in list(set(sch_ids).intersection(paper['citations']))
             if sch_id != "None"
         ]
 
@@ -136,6 +139,7 @@ def get_graph_data(query_results):
 
 
 @st.experimental_memo
+@timed("get_arc_graph")
 def get_arc_graph(data):
     """
     Generate arc graph figure based on citations graph data.
@@ -149,6 +153,11 @@ def get_arc_graph(data):
      : Graph object
         Graph object representing the arc graph of the citations.
     """
+    # Heavy imports, only needed once a search is made
+    import plotly.graph_objs as go
+    from scipy import stats
+    from sklearn.preprocessing import MinMaxScaler
+
     papers = data['nodes']
     L = len(data['nodes'])
     values = [item['nb_citations'] for item in data['nodes']]
@@ -165,13 +174,13 @@ def get_arc_graph(data):
         (
             f"<b>{paper['title']}</b><br>"
             f"<b>Citations:</b> {paper['nb_citations']}<br>"
-            f"<b>Date:</b> {calendar.month_name[int(paper['month'])]} {paper['year']}<br>"
+            f"<b>Date:</b> {calendar.month_name[paper['month']]} {paper['year']}<br>"
             f"<b>Similarity score:</b> {round(paper['similarity_score'], 2)}/1 "
         )
         for paper in data['nodes']
     ]
-    year_max = max([int(paper['year']) for paper in data['nodes']])
-    year_min = min([int(paper['year']) for paper in data['nodes']])
+    year_max = max([paper['year'] for paper in data['nodes']])
+    year_min = min([paper['year'] for paper in data['nodes']])
 
     edges = [(item['source'], item['target']) for item in data['links']]
     interact_strength = [item['value'] for item in data['links']]
@@ -187,7 +196,7 @@ def get_arc_graph(data):
         y=[0] * L,
         mode='markers',
         marker=dict(size=values_scaled,
-                    color=[int(paper['year']) for paper in data['nodes']], 
+                    color=[paper['year'] for paper in data['nodes']], 
                     colorscale=color_scale,
                     showscale=False,
                     line=dict(color='rgb(50,50,50)', width=0.75)),
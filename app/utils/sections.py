@@ -0,0 +1,108 @@
+import time
+import logging
+import threading
+import streamlit as st
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, NamedTuple
+from src.metrics import timer
+from config_files import config
+
+logger = logging.getLogger(__name__)
+
+_sections_executor = None
+_sections_lock = threading.Lock()
+
+
+class Section(NamedTuple):
+    """
+    Section of the page computed after a search.
+
+    compute takes no argument and returns the data of the section: it runs on a worker thread, so it must not
+    use streamlit (nor the session state). render displays these data, on the script thread.
+    """
+    name: str
+    key: Any
+    container: Any
+    compute: Callable[[], Any]
+    render: Callable[[Any], None]
+    timeout: float
+
+
+def get_sections_executor():
+    """
+    Get the thread pool computing the page sections, shared by all the sessions of the process.
+    """
+    global _sections_executor
+    with _sections_lock:
+        if _sections_executor is None:
+            _sections_executor = ThreadPoolExecutor(
+                max_workers=config.SECTIONS_MAX_WORKERS,
+                thread_name_prefix="page-section"
+            )
+    return _sections_executor
+
+
+def timed_section(section):
+    """
+    Get the compute function of a section, timed under its name (see src.metrics).
+    """
+    def compute():
+        with timer(f"section_{section.name}"):
+            return section.compute()
+    return compute
+
+
+def render_sections(sections, search_key):
+    """
+    Compute the sections concurrently, and render each one in its container as soon as it is computed: the page
+    takes about as long as its slowest section. A section not computed within its timeout is replaced by a
+    warning (its computation is not interrupted, but its result is dropped), and so is a section whose computation
+    failed: the other sections are still rendered.
+    The data of the sections are kept in the session for the search they were computed for, so that the reruns
+    of the page (e.g. "Load more papers") render them without computing them again.
+
+    Parameters
+    ----------
+    sections : list(Section)
+        Sections of the page.
+    search_key : tuple
+        Parameters of the search the sections are computed for.
+    """
+    if st.session_state.sections_search_key != search_key:
+        st.session_state.sections_search_key = search_key
+        st.session_state.sections_cache = {}
+    cache = st.session_state.sections_cache
+
+    executor = get_sections_executor()
+    start = time.monotonic()
+    pending = {}
+    for section in sections:
+        if section.key in cache:
+            with section.container:
+                section.render(cache[section.key])
+        else:
+            pending[executor.submit(timed_section(section))] = section
+
+    while pending:
+        next_deadline = min(start + section.timeout for section in pending.values())
+        done, _ = wait(pending, timeout=max(0., next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            section = pending.pop(future)
+            try:
+                data = future.result()
+            except Exception:
+                # Not cached: the section is computed again on the next rerun
+                logger.exception(f"Section {section.name} failed")
+                with section.container:
+                    st.warning("This section could not be computed, please try again later.")
+                continue
+            cache[section.key] = data
+            with section.container:
+                section.render(data)
+        for future, section in list(pending.items()):
+            if time.monotonic() - start >= section.timeout:
+                pending.pop(future)
+                future.cancel()
+                with section.container:
+                    st.warning("This section is taking too long to compute, please try again later.")
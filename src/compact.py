@@ -0,0 +1,63 @@
+"""
+Compact encodings of the 'paper_vector:' hashes, enabled at ingestion with COMPACT_ENCODING=1:
+    - the fields the app never reads (config.COMPACT_DROPPED_FIELDS) are not stored
+    - the abstract is stored zstd-compressed, in the 'abstract_zstd' field
+    - the version history (a stringified list of dicts) is replaced by the date of the first version, as YYYYMMDD
+
+The compressed abstracts are decompressed when the papers are read back (see decode_paper).
+"""
+import ast
+import functools
+import src.config as config
+
+from dateutil import parser
+from typing import Dict
+
+COMPRESSED_ABSTRACT_FIELD = "abstract_zstd"
+
+
+@functools.lru_cache()
+def get_compressor():
+    import zstandard
+    return zstandard.ZstdCompressor(level=config.COMPACT_ZSTD_LEVEL)
+
+
+@functools.lru_cache()
+def get_decompressor():
+    import zstandard
+    return zstandard.ZstdDecompressor()
+
+
+def compress_text(text: str) -> bytes:
+    return get_compressor().compress(str(text).encode())
+
+
+def decompress_text(data: bytes) -> str:
+    return get_decompressor().decompress(data).decode()
+
+
+def compact_versions(versions: str) -> str:
+    """"[{'version': 'v1', 'created': 'Mon, 2 Apr 2007 19:18:42 GMT'}, ...]" -> "20070402" (first version)"""
+    try:
+        first_version = ast.literal_eval(str(versions))[0]
+        return parser.parse(first_version["created"]).strftime("%Y%m%d")
+    except (ValueError, SyntaxError, TypeError, KeyError, IndexError, OverflowError):
+        return ""
+
+
+def compact_paper_mapping(mapping: Dict) -> Dict:
+    """Compact version of the mapping of a 'paper_vector:' hash"""
+    mapping = {field: value for field, value in mapping.items() if field not in config.COMPACT_DROPPED_FIELDS}
+    if "abstract" in mapping:
+        mapping[COMPRESSED_ABSTRACT_FIELD] = compress_text(mapping.pop("abstract"))
+    if "version" in mapping:
+        mapping["version"] = compact_versions(mapping["version"])
+    return mapping
+
+
+def decode_paper(paper: Dict) -> Dict:
+    """Decompresses the abstract of a paper read from redis (with raw bytes values), if it was stored compressed"""
+    compressed = paper.pop(COMPRESSED_ABSTRACT_FIELD, None)
+    if compressed is not None:
+        paper["abstract"] = decompress_text(compressed)
+    return paper
@@ -1,17 +1,115 @@
 import os
 
-REDIS_PUBLIC_URL = "redis-10525.c21908.eu-west1-2.gcp.cloud.rlrcp.com"
-REDIS_PORT = 10525
+REDIS_PUBLIC_URL = os.environ.get("REDIS_HOST", "redis-10525.c21908.eu-west1-2.gcp.cloud.rlrcp.com")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 10525))
+# Optional shards holding the papers, as "host:port,host:port,...": each one holds the papers whose id hashes to it,
+# with its own index. The caches and counters used by the app stay on the REDIS_HOST DB.
+REDIS_SHARDS = [shard for shard in os.environ.get("REDIS_SHARDS", "").split(",") if shard]
 
+# The searches go through the INDEX_NAME alias, pointing to the current versioned index ("papers_v<n>"),
+# so that the index can be rebuilt in the background and switched to atomically (see src.redis_db.reindex)
 INDEX_NAME = "papers"
 INDEX_TYPE = "HNSW"
+INDEX_VERSION_KEY = f"{INDEX_NAME}:version"
+INDEX_BUILDS_KEY = f"{INDEX_NAME}:builds"
+INDEX_BUILD_POLL_INTERVAL = 5
 
 VECTOR_NAME = "vector"
 VECTOR_TYPE = "FLOAT32"
 VECTOR_DIM = 768
 EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
 
+# Reduced dimension index (see src.projection): when PROJECTION_PATH is set, the index is built on the papers vectors
+# projected on its components (stored in PROJECTED_VECTOR_NAME), and the query vectors are projected the same way
+PROJECTION_PATH = os.environ.get("PROJECTION_PATH", "")
+PROJECTED_VECTOR_NAME = "vector_reduced"
+SEARCH_VECTOR_NAME = PROJECTED_VECTOR_NAME if PROJECTION_PATH else VECTOR_NAME
+# Two stages search: number of candidates of the (reduced) index reranked exactly on their full vectors (0: disabled)
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 0))
+# Diversified search (Maximal Marginal Relevance): trade-off between relevance (1) and diversity (0), and candidates
+MMR_LAMBDA = 0.7
+MMR_CANDIDATES = 500
+
+# Embedding backend: "fp32", or a CPU-optimized conversion of the model ("int8", "onnx", see src.quantization)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "fp32")
+QUANTIZED_MODEL_PATH = os.environ.get("QUANTIZED_MODEL_PATH", "./models/all-mpnet-base-v2-int8")
+
+# Embedding service (see src.embedding_service): when its URL is set, create_embedding acts as its client
+EMBEDDING_SERVICE_URL = os.environ.get("EMBEDDING_SERVICE_URL", "")
+EMBEDDING_SERVICE_TIMEOUT = 10
+EMBEDDING_BATCH_WINDOW = 0.005
+EMBEDDING_MAX_BATCH_SIZE = 64
+
+CATEGORIES_SEPARATOR = ","
+
+# Shared search results cache (seconds)
+RESULT_CACHE_PREFIX = "search_cache:"
+RESULT_CACHE_TTL = 3600
+RESULT_CACHE_LOCK_TTL = 30
+RESULT_CACHE_POLL_INTERVAL = 0.05
+# Query embeddings, cached by normalized query text (seconds)
+EMBEDDING_CACHE_PREFIX = "embedding_cache:"
+EMBEDDING_CACHE_TTL = 3600
+
+# Semantic cache: reuse the results of a recent query whose embedding is close enough to the new one
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_INDEX_NAME = "query_cache"
+SEMANTIC_CACHE_PREFIX = "query_cache:"
+SEMANTIC_CACHE_METRICS_KEY = "query_cache_metrics"
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_TTL = 3600
+# Share of semantic cache hits checked against a fresh search, and minimum top-k overlap for a hit to be valid
+SEMANTIC_CACHE_AUDIT_RATE = 0.05
+SEMANTIC_CACHE_AUDIT_MIN_OVERLAP = 0.5
+
+# Compact encodings of the papers at ingestion (see src.compact): fields not stored, and abstracts compression
+COMPACT_ENCODING = os.environ.get("COMPACT_ENCODING", "0") == "1"
+COMPACT_DROPPED_FIELDS = ("submitter", "doi", "license")
+COMPACT_ZSTD_LEVEL = 10
+
+# Precomputed nearest neighbours of the papers (see src.neighbours)
+NEIGHBOURS_PREFIX = "neighbours:"
+NEIGHBOURS_N = 20
+
+# Topics of the corpus (see src.topics): mini-batch k-means centroids, stored in a small vector index along with
+# the yearly counts (per shard, maintained at ingestion when TOPICS_PATH is set) and top papers of each topic
+TOPICS_PATH = os.environ.get("TOPICS_PATH", "")
+TOPICS_N = 256
+TOPIC_INDEX_NAME = "topics"
+TOPIC_PREFIX = "topic:"
+TOPIC_COUNTS_PREFIX = "topic_counts:"
+TOPIC_TOP_PAPERS = 100
+# Broad queries: queries for k >= TOPIC_BROAD_MIN_K papers (without category filters) whose nearest centroids have a
+# similarity >= TOPIC_MATCH_THRESHOLD are summarized from (up to TOPIC_MATCH_N of) these topics
+TOPIC_BROAD_MIN_K = 200
+TOPIC_MATCH_THRESHOLD = float(os.environ.get("TOPIC_MATCH_THRESHOLD", 0.6))
+TOPIC_MATCH_N = 3
+
+# Publication counters per year and month (overall, and per category), maintained at ingestion
+PUBLICATION_COUNTS_PREFIX = "publication_counts:"
+PUBLICATION_COUNTS_ALL = "all"
+
+# Cached topic trends (normalized share and forecast), per query and filters (seconds)
+TREND_CACHE_PREFIX = "trend_cache:"
+TREND_CACHE_TTL = 3600
+
 GCS_TOKEN_FILE = ""
 GCS_PROJECT = ""
 REDIS_PASSWORD = os.environ.get("REDIS_PASSWORD", "")
 REDIS_USERNAME = "default"
+
+# Latency metrics (see src.metrics)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0") == "1"
+METRICS_WINDOW = 2048
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_FILE = os.environ.get("METRICS_FILE", "")
+METRICS_FILE_INTERVAL = 15
+
+# App start: import time budget (seconds), and modules which must only be imported on first use
+STARTUP_IMPORT_BUDGET = float(os.environ.get("STARTUP_IMPORT_BUDGET", 3.0))
+STARTUP_LAZY_MODULES = (
+    "torch", "sentence_transformers", "transformers", "aredis_om",
+    "statsmodels", "sklearn", "scipy", "matplotlib", "plotly", "pandas"
+)
+# Dependencies needed on start, whose own imports of the lazy modules are not checked (streamlit imports pandas)
+STARTUP_ALLOWED_IMPORTERS = ("streamlit",)
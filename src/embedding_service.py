@@ -0,0 +1,160 @@
+"""
+Local embedding service: one copy of the embedding model, shared by all the app's worker processes.
+
+Requests arriving within a few milliseconds of each other are gathered into a single batched encode call.
+Start it with:
+    python -m src.embedding_service --port 8765
+and point the app's workers at it (create_embedding then acts as a client):
+    EMBEDDING_SERVICE_URL=http://127.0.0.1:8765 streamlit run app/app.py
+"""
+import json
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+import urllib.request
+import src.config as config
+
+from concurrent.futures import Future
+from typing import List
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.metrics import timer, increment
+from src.vectors import clean_text, load_embedding_model
+
+
+class MicroBatcher:
+    """
+    Gathers the texts submitted from many threads into batches: a batch is encoded as soon as it reaches
+    max_batch_size texts, or batch_window seconds after its first text arrived.
+    """
+
+    def __init__(
+            self,
+            model=None,
+            batch_window: float = config.EMBEDDING_BATCH_WINDOW,
+            max_batch_size: int = config.EMBEDDING_MAX_BATCH_SIZE
+    ):
+        self.model = model or load_embedding_model()
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="embedding-batcher", daemon=True).start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, config.VECTOR_DIM), dtype=np.float32)
+        futures = [self.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures])
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [clean_text(text) for text, _ in batch]
+            try:
+                with timer("embedding_batch"):
+                    embeddings = self.model.encode(texts, batch_size=len(texts))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            increment("embedding_batches")
+            increment("embedding_batched_texts", len(texts))
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(np.asarray(embedding, dtype=np.float32))
+
+
+def parse_texts(body: bytes) -> List[str]:
+    """Texts of an /embed request body, ValueError if it is not {"texts": [str, ...]}"""
+    try:
+        texts = json.loads(body)["texts"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Expected a JSON body {"texts": [...]}')
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise ValueError('"texts" must be a list of strings')
+    return texts
+
+
+def make_handler(batcher: MicroBatcher):
+
+    class EmbeddingHandler(BaseHTTPRequestHandler):
+        """POST /embed {"texts": [...]} -> float32 embeddings, as raw bytes of a (n, dim) array"""
+
+        def do_POST(self):
+            if self.path != "/embed":
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            try:
+                texts = parse_texts(body)
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            try:
+                embeddings = batcher.embed(texts)
+            except Exception as e:
+                self.send_error(500, f"Embedding failed: {e}")
+                return
+            payload = embeddings.astype(np.float32).tobytes()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("X-Embedding-Dim", str(embeddings.shape[1]))
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmbeddingHandler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765):
+    batcher = MicroBatcher()
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"Embedding service listening on http://{host}:{port}")
+    server.serve_forever()
+
+
+def request_embeddings(texts: List[str], url: str = config.EMBEDDING_SERVICE_URL) -> np.ndarray:
+    """Client side: embeds texts through the embedding service"""
+    request = urllib.request.Request(
+        f"{url}/embed",
+        data=json.dumps({"texts": texts}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    with timer("embedding_service_request"):
+        with urllib.request.urlopen(request, timeout=config.EMBEDDING_SERVICE_TIMEOUT) as response:
+            dim = int(response.headers["X-Embedding-Dim"])
+            return np.frombuffer(response.read(), dtype=np.float32).reshape(-1, dim)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Local embedding service, with micro-batching")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    args = arg_parser.parse_args()
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
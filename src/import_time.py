@@ -0,0 +1,96 @@
+"""
+Import-time profile of the app start, failing if it regresses.
+
+The app modules are imported in a fresh interpreter with `python -X importtime`. The check fails when:
+    - one of the heavy modules that should only be imported on first use is imported at start (by the app, not by
+      the dependencies it needs on start, see config.STARTUP_ALLOWED_IMPORTERS)
+    - the total import time goes over the budget
+
+    python -m src.import_time --budget 3.0
+"""
+import os
+import sys
+import argparse
+import subprocess
+import src.config as config
+
+from typing import Dict, List, Tuple
+
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_PATH, "app")
+APP_MODULES = ["app", "main_page"]
+
+
+def profile_imports(modules: List[str] = APP_MODULES) -> List[Tuple[str, int, int]]:
+    """Imports the modules in a fresh interpreter, returns (module, self time, cumulative time) in microseconds"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_PATH, APP_PATH, os.environ.get("PYTHONPATH", "")]))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {module}" for module in modules)],
+        cwd=APP_PATH,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing the app failed:\n{completed.stderr}")
+    profile = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        profile.append((module.rstrip(), int(self_us), int(cumulative_us)))
+    return profile
+
+
+def importers(profile: List[Tuple[str, int, int]]) -> List[List[str]]:
+    """
+    Chain of the modules importing each module of the profile, outermost first. -X importtime prints the nested
+    imports of a module (indented by two more spaces per level) before the module itself.
+    """
+    chains = []
+    stack = []
+    for module, _, _ in reversed(profile):
+        depth = (len(module) - len(module.lstrip()) - 1) // 2
+        stack = stack[:depth] + [module.strip()]
+        chains.append(stack[:depth])
+    return chains[::-1]
+
+
+def check_import_time(budget: float = config.STARTUP_IMPORT_BUDGET, top: int = 15) -> Dict:
+    profile = profile_imports()
+    total = sum(self_us for _, self_us, _ in profile) / 1e6
+    lazy_imported = sorted({
+        module.strip() for (module, _, _), chain in zip(profile, importers(profile))
+        if module.strip().split(".")[0] in config.STARTUP_LAZY_MODULES
+        and not any(importer.split(".")[0] in config.STARTUP_ALLOWED_IMPORTERS for importer in chain)
+    })
+    top_level = sorted(
+        [(module.strip(), cumulative_us) for module, _, cumulative_us in profile if not module.startswith("  ")],
+        key=lambda item: -item[1]
+    )[:top]
+    return {
+        "total_s": total,
+        "budget_s": budget,
+        "lazy_modules_imported": lazy_imported,
+        "top_level": top_level,
+        "ok": total <= budget and not lazy_imported,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Checks the import time of the app start")
+    arg_parser.add_argument("--budget", type=float, default=config.STARTUP_IMPORT_BUDGET, help="Budget in seconds")
+    args = arg_parser.parse_args()
+
+    report = check_import_time(args.budget)
+    print(f"Total import time: {report['total_s']:.2f}s (budget: {report['budget_s']:.2f}s)")
+    for module, cumulative_us in report["top_level"]:
+        print(f"  {cumulative_us / 1e3:>9.1f} ms  {module}")
+    if report["lazy_modules_imported"]:
+        print(f"Modules that should be imported lazily were imported on start: {report['lazy_modules_imported']}")
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
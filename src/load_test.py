@@ -0,0 +1,204 @@
+"""
+Load test of the search path, with concurrent simulated users.
+
+Each user runs a sequence of searches drawn from a fixed query mix, with varied k, year and category filters,
+then processes the results the way the app does (topic trend, citations graph, arc graph, reading list).
+Timings are collected per stage through src.metrics.
+
+Against a local Redis Stack container:
+    docker run -d -p 6379:6379 redis/redis-stack-server:latest
+    REDIS_HOST=localhost REDIS_PORT=6379 REDIS_PASSWORD= python -m src.load_test --users 8 --requests 20
+
+When the redis DB cannot be reached, the searches run on the local search backend, loaded from a vector store
+(or a snapshot, see src.snapshot):
+    python -m src.load_test --users 8 --requests 20 --store ./arxiv_embeddings_300000_completed
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import src.metrics as metrics
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+
+QUERY_MIX = [
+    "machine learning model observability",
+    "observability of large language models",
+    "graph neural networks for molecule property prediction",
+    "contrastive self-supervised learning for images",
+    "reinforcement learning from human feedback",
+    "transformers for time series forecasting",
+    "federated learning privacy",
+    "neural architecture search",
+    "adversarial robustness of image classifiers",
+    "diffusion models for image generation",
+    "explainable artificial intelligence",
+    "speech recognition with end to end models",
+    "question answering over knowledge graphs",
+    "vector similarity search",
+    "evolutionary algorithms for optimization",
+    "causal inference with machine learning",
+]
+K_CHOICES = [10, 25, 50, 100, 250, 500, 1000]
+CATEGORY_CHOICES = ["cs.lg", "cs.ai", "cs.cl", "cs.cv", "cs.ne"]
+YEAR_MIN, YEAR_MAX = 1995, 2022
+
+
+def make_scenario(rng: random.Random) -> Dict:
+    """Draws the parameters of one search: query, k, years range and categories"""
+    year_min = rng.randint(YEAR_MIN, YEAR_MAX - 1)
+    return {
+        "user_text": rng.choice(QUERY_MIX),
+        "k": rng.choice(K_CHOICES),
+        "year_min": year_min,
+        "year_max": rng.randint(year_min + 1, YEAR_MAX),
+        "categories": rng.sample(CATEGORY_CHOICES, rng.randint(0, 2)),
+    }
+
+
+def load_app_processing() -> Callable[[List[Dict]], None]:
+    """
+    Returns the app's processing of a result set, as run after each search (the computation of the page sections,
+    without the streamlit rendering). The streamlit memo caches are bypassed, so that every call is measured.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+    from features.topic_evolution import (
+        compute_arc_graph_section,
+        compute_reading_list_section,
+        get_topic_trend_figure
+    )
+    from src.trends import compute_topic_trend
+    from src.results import ResultSet
+
+    def process(results: List[Dict]):
+        with metrics.timer("result_set"):
+            results = ResultSet.from_dicts(results).with_column("list_index", range(len(results)))
+        if len(results) <= 1:
+            return
+        with metrics.timer("topic_trend"):
+            get_topic_trend_figure(compute_topic_trend(results))
+        compute_arc_graph_section(results)
+        with metrics.timer("reading_list"):
+            compute_reading_list_section(results, 5)
+
+    return process
+
+
+def make_search(store: str = None, use_cache: bool = False) -> Callable[..., List[Dict]]:
+    """Search function of the load test: redis if it can be reached, else the local search backend on store"""
+    from src.redis_db import execute_user_query, is_redis_available, GRAPH_FIELDS
+
+    if is_redis_available():
+        print("Running against redis")
+        return lambda **scenario: execute_user_query(**scenario, use_cache=use_cache, return_fields=GRAPH_FIELDS)
+
+    if not store:
+        raise RuntimeError("The redis DB cannot be reached, and no vector store was given for the local backend")
+    from src.local_search import LocalSearchBackend, execute_local_user_query
+    backend = LocalSearchBackend(store)
+    print(f"Redis unavailable: running against the local search backend ({len(backend)} papers)")
+    return lambda **scenario: execute_local_user_query(backend, **scenario, return_fields=GRAPH_FIELDS)
+
+
+def simulate_user(
+        user_id: int,
+        n_requests: int,
+        search: Callable[..., List[Dict]],
+        process: Callable[[List[Dict]], None] = None,
+        seed: int = 0,
+        think_time: float = 0.0
+):
+    """One simulated user: n_requests searches in a row, with a pause of think_time seconds in between"""
+    rng = random.Random(seed * 100003 + user_id)
+    errors = 0
+    for _ in range(n_requests):
+        scenario = make_scenario(rng)
+        try:
+            with metrics.timer("request"):
+                results = search(**scenario)
+                if process:
+                    process(results)
+        except Exception as e:
+            errors += 1
+            metrics.increment("errors")
+            print(f"user {user_id}: {type(e).__name__}: {e}")
+        if think_time:
+            time.sleep(rng.expovariate(1 / think_time))
+    return errors
+
+
+def run_load_test(
+        n_users: int,
+        n_requests: int,
+        search: Callable[..., List[Dict]],
+        process: Callable[[List[Dict]], None] = None,
+        seed: int = 0,
+        think_time: float = 0.0
+) -> Dict:
+    """Runs n_users concurrent users, and reports the throughput and latency quantiles (in ms) per stage"""
+    metrics.enable()
+    metrics.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_users) as executor:
+        errors = sum(executor.map(
+            lambda user_id: simulate_user(user_id, n_requests, search, process, seed, think_time),
+            range(n_users)
+        ))
+    duration = time.perf_counter() - start
+    stages = {
+        stage: {key: value * 1000 if key != "count" else value for key, value in stats.items()}
+        for stage, stats in metrics.get_stage_stats().items()
+    }
+    return {
+        "users": n_users,
+        "requests": n_users * n_requests,
+        "errors": errors,
+        "duration_s": duration,
+        "throughput_rps": n_users * n_requests / duration,
+        "stages_ms": stages,
+        "counters": metrics.get_counters(),
+    }
+
+
+def print_report(report: Dict):
+    print(
+        f"\n{report['requests']} requests by {report['users']} users in {report['duration_s']:.1f}s: "
+        f"{report['throughput_rps']:.2f} req/s, {report['errors']} errors\n"
+    )
+    print(f"{'stage':<24}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for stage, stats in sorted(report["stages_ms"].items(), key=lambda item: -item[1]["mean"]):
+        print(
+            f"{stage:<24}{stats['count']:>8}{stats['mean']:>10.1f}{stats['p50']:>10.1f}"
+            f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['max']:>10.1f}"
+        )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Load test of the search path with concurrent users")
+    arg_parser.add_argument("--users", type=int, default=4, help="Number of concurrent users")
+    arg_parser.add_argument("--requests", type=int, default=10, help="Number of searches per user")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the queries / filters draws")
+    arg_parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between searches (s)")
+    arg_parser.add_argument(
+        "--store", help="Vector store (or snapshot) used by the local search backend, if redis is unavailable"
+    )
+    arg_parser.add_argument("--use-cache", action="store_true", help="Go through the shared search results caches")
+    arg_parser.add_argument("--search-only", action="store_true", help="Skip the app's processing of the results")
+    arg_parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = arg_parser.parse_args()
+
+    search = make_search(args.store, args.use_cache)
+    process = None if args.search_only else load_app_processing()
+    report = run_load_test(args.users, args.requests, search, process, args.seed, args.think_time)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
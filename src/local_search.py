@@ -0,0 +1,115 @@
+import numpy as np
+import src.config as config
+
+from dateutil import parser
+from typing import Dict, List, Optional
+from src.metrics import timer
+from src.redis_db import make_filters_dict
+from src.vector_store import iter_chunks
+from src.snapshot import is_snapshot, read_snapshot
+from src.vectors import create_embedding, normalize_categories
+
+
+def to_paper_hash(record: Dict) -> Optional[Dict]:
+    """
+    Converts a record of a vector store into the fields of a 'paper_vector:' hash, as loaded in redis.
+    Missing fields default to "None"; None if the publication date of the paper cannot be found.
+    """
+    try:
+        update_date = parser.parse(str(record["update_date"]))
+        year, month = update_date.year, update_date.month
+    except (KeyError, ValueError, OverflowError):
+        if record.get("year") is None:
+            return None
+        year, month = record["year"], record.get("month", 1)
+    paper = {key: str(value) for key, value in record.items()}
+    paper.update({
+        "paper_id": str(record.get("id")),
+        "version": str(record.get("versions")),
+        "categories": normalize_categories(record.get("categories")),
+        "citation_count": str(len(str(record.get("citations")).split(','))),
+        "month": str(month),
+        "year": str(year),
+    })
+    return paper
+
+
+class LocalSearchBackend:
+    """
+    Exact (brute force) similarity search over a vector store (or a snapshot, see src.snapshot), held in memory
+    with numpy.
+
+    It mirrors the redis search (inner product scores, year & categories tag filters, same result fields),
+    so that the app's search path can be run and measured without a redis DB.
+    """
+
+    def __init__(self, path: str):
+        if is_snapshot(path):
+            # The papers of a snapshot are already in their hash form, and its vectors stay memory-mapped
+            papers, self.vectors = read_snapshot(path)
+        else:
+            papers, vectors, skipped = [], [], 0
+            for records, chunk_vectors in iter_chunks(path):
+                chunk_papers = [to_paper_hash(record) for record in records]
+                kept = [i for i, paper in enumerate(chunk_papers) if paper is not None]
+                skipped += len(chunk_papers) - len(kept)
+                papers += [chunk_papers[i] for i in kept]
+                vectors.append(np.asarray(chunk_vectors, dtype=np.float32)[kept])
+            self.vectors = np.concatenate(vectors)
+            if skipped:
+                print(f"{skipped} papers without a publication date were skipped")
+        self.papers = papers
+        self.years = np.array([int(paper.get("year") or 0) for paper in papers])
+        self.categories = [set((paper.get("categories") or "").split(config.CATEGORIES_SEPARATOR)) for paper in papers]
+
+    def __len__(self):
+        return len(self.papers)
+
+    def filter_mask(self, filters_dict: Dict[str, List[str]]) -> np.ndarray:
+        mask = np.ones(len(self.papers), dtype=bool)
+        if "year" in filters_dict:
+            mask &= np.isin(self.years, [int(year) for year in filters_dict["year"]])
+        if "categories" in filters_dict:
+            wanted = set(filters_dict["categories"])
+            mask &= np.array([not wanted.isdisjoint(categories) for categories in self.categories])
+        return mask
+
+    def search(self, vector: np.ndarray, k: int, filters_dict: Dict[str, List[str]] = None) -> List[Dict]:
+        """Top k papers by inner product with the vector, among those matching the filters"""
+        with timer("local_search"):
+            candidates = np.flatnonzero(self.filter_mask(filters_dict or {}))
+            scores = self.vectors[candidates] @ np.asarray(vector, dtype=np.float32)
+            k = min(k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k] if k > 0 else np.array([], dtype=int)
+            top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            dict(self.papers[candidates[i]], similarity_score=float(scores[i]))
+            for i in top
+        ]
+
+
+def execute_local_user_query(
+        backend: LocalSearchBackend,
+        user_text: str,
+        k: int,
+        year_min: int,
+        year_max: int,
+        categories: List[str] = None,
+        offset: int = 0,
+        page_size: int = None,
+        return_fields: List[str] = None
+):
+    """Same as src.redis_db.execute_user_query, on a local search backend"""
+    with timer("search"):
+        results = backend.search(
+            create_embedding(user_text),
+            k,
+            make_filters_dict(year_min, year_max, categories)
+        )
+    results = results[offset:] if page_size is None else results[offset:offset + page_size]
+    if return_fields:
+        results = [
+            dict({field: paper.get(field) for field in return_fields}, similarity_score=paper["similarity_score"])
+            for paper in results
+        ]
+    return results
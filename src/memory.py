@@ -0,0 +1,121 @@
+"""
+Memory footprint of the redis DB, by key type and by field of the papers.
+
+The keys are counted by type (their prefix, e.g. "paper_vector", and redis type), and MEMORY USAGE is sampled
+on up to sample_size keys of each type, to estimate their total. The fields of the sampled 'paper_vector:' hashes
+are measured with HSTRLEN (value bytes, along with the field name bytes):
+    python -m src.memory --sample-size 1000
+
+Run it before and after enabling the compact encodings (COMPACT_ENCODING=1, see src.compact) to compare the
+number of bytes per paper.
+"""
+import json
+import asyncio
+import argparse
+import numpy as np
+
+from typing import Dict
+from redis.asyncio import Redis
+from src.redis_db import get_redis_connexion, try_decode_bytes
+
+# Key type of the redis-om hashes of the papers (see src.models.Paper)
+OM_KEY_TYPE = ":src.models.Paper"
+
+
+def get_key_type(key: str) -> str:
+    """Prefix of a key: "paper_vector:1234" -> "paper_vector", ":src.models.Paper:01G..." -> ":src.models.Paper" """
+    prefix, separator, _ = key.rpartition(":")
+    return prefix if separator else key
+
+
+def get_bytes_per_paper(key_types: Dict, prefix: str = "paper_vector:"):
+    """
+    Mean bytes per paper: its 'paper_vector:' hash, along with its redis-om hash when there is one (the papers
+    ingested with COMPACT_ENCODING=1 have none)
+    """
+    papers = key_types.get(prefix.rstrip(":"))
+    if papers is None:
+        return None
+    total = papers["estimated_total_bytes"] + key_types.get(OM_KEY_TYPE, {}).get("estimated_total_bytes", 0)
+    return total / papers["keys"]
+
+
+async def analyze_memory(redis_conn: Redis, sample_size: int = 1000, prefix: str = "paper_vector:") -> Dict:
+    """Memory usage by key type, and of each field of the papers (mean bytes per paper)"""
+    samples = {}
+    counts = {}
+    async for key in redis_conn.scan_iter(count=1000):
+        key = try_decode_bytes(key)
+        key_type = get_key_type(key)
+        counts[key_type] = counts.get(key_type, 0) + 1
+        if len(samples.setdefault(key_type, [])) < sample_size:
+            samples[key_type].append(key)
+
+    key_types = {}
+    for key_type, keys in samples.items():
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.type(keys[0])
+        for key in keys:
+            pipe.memory_usage(key, samples=0)
+        redis_type, *usages = await pipe.execute()
+        mean_bytes = float(np.mean([usage or 0 for usage in usages]))
+        key_types[key_type] = {
+            "type": try_decode_bytes(redis_type),
+            "keys": counts[key_type],
+            "sampled": len(keys),
+            "mean_bytes": mean_bytes,
+            "estimated_total_bytes": mean_bytes * counts[key_type],
+        }
+
+    fields = {}
+    papers = samples.get(prefix.rstrip(":"), [])
+    for key in papers:
+        paper_fields = await redis_conn.hkeys(key)
+        pipe = redis_conn.pipeline(transaction=False)
+        for field in paper_fields:
+            pipe.hstrlen(key, field)
+        for field, length in zip(paper_fields, await pipe.execute()):
+            fields[try_decode_bytes(field)] = fields.get(try_decode_bytes(field), 0) + len(field) + length
+
+    return {
+        "dbsize": await redis_conn.dbsize(),
+        "used_memory_bytes": (await redis_conn.info("memory"))["used_memory"],
+        "key_types": dict(sorted(key_types.items(), key=lambda item: -item[1]["estimated_total_bytes"])),
+        "bytes_per_paper": get_bytes_per_paper(key_types, prefix),
+        "paper_fields_mean_bytes": dict(sorted(
+            ((field, total / len(papers)) for field, total in fields.items()),
+            key=lambda item: -item[1]
+        )),
+    }
+
+
+def print_report(report: Dict):
+    print(f"{report['dbsize']} keys, {report['used_memory_bytes'] / 2 ** 20:.1f} MiB used\n")
+    print(f"{'key type':<40}{'type':>8}{'keys':>10}{'mean (B)':>12}{'total (MiB)':>14}")
+    for key_type, stats in report["key_types"].items():
+        print(
+            f"{key_type:<40}{stats['type']:>8}{stats['keys']:>10}{stats['mean_bytes']:>12.0f}"
+            f"{stats['estimated_total_bytes'] / 2 ** 20:>14.1f}"
+        )
+    if report["bytes_per_paper"] is not None:
+        print(f"\nBytes per paper (MEMORY USAGE, with its redis-om hash): {report['bytes_per_paper']:.0f}")
+        print(f"{'field':<40}{'mean (B)':>12}")
+        for field, mean_bytes in report["paper_fields_mean_bytes"].items():
+            print(f"{field:<40}{mean_bytes:>12.0f}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Memory footprint of the redis DB, by key type and paper field")
+    arg_parser.add_argument("--sample-size", type=int, default=1000, help="Keys sampled per key type")
+    arg_parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = arg_parser.parse_args()
+
+    report = asyncio.run(analyze_memory(get_redis_connexion(), args.sample_size))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
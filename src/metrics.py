@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import inspect
+import src.config as config
+from collections import deque
+from typing import Dict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logger = logging.getLogger(__name__)
+
+_enabled = config.METRICS_ENABLED
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_exporters_started = False
+
+
+class StageStats:
+    """Timings of one stage: count, sum and max, plus a bounded window of recent samples for the quantiles"""
+
+    def __init__(self, window: int = config.METRICS_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def add(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.samples.append(duration)
+
+    def quantile(self, q: float):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def record(stage: str, duration: float):
+    """
+    Records the duration (in seconds) of one run of a stage, and logs it as a structured (JSON) log line, at DEBUG
+    level: every batch and query stage is recorded, the aggregated stats are exported instead (see start_exporters)
+    """
+    with _lock:
+        if stage not in _stages:
+            _stages[stage] = StageStats()
+        _stages[stage].add(duration)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps({"event": "stage_timing", "stage": stage, "duration_ms": round(duration * 1000, 3)}))
+
+
+def increment(name: str, value: float = 1):
+    """Increments a counter (cache hits, errors...)"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage: str):
+    """
+    Context manager timing a stage:
+
+        with timer("ft_search"):
+            ...
+
+    When metrics are disabled, a shared no-op context manager is returned.
+    """
+    return _Timer(stage) if _enabled else _NULL_TIMER
+
+
+def timed(stage: str = None):
+    """Decorator timing every call of a function (sync or async) as a stage, named after the function by default"""
+    def decorator(func):
+        name = stage or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with _Timer(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_stage_stats() -> Dict[str, Dict[str, float]]:
+    """Snapshot of the timings per stage, in seconds"""
+    with _lock:
+        return {
+            stage: {
+                "count": stats.count,
+                "mean": stats.total / stats.count if stats.count else 0.0,
+                "p50": stats.quantile(0.5),
+                "p95": stats.quantile(0.95),
+                "p99": stats.quantile(0.99),
+                "max": stats.max
+            }
+            for stage, stats in _stages.items()
+        }
+
+
+def get_counters() -> Dict[str, float]:
+    with _lock:
+        return dict(_counters)
+
+
+def render_prometheus() -> str:
+    """Exports the timings (as summaries) and counters in the Prometheus text format"""
+    lines = [
+        "# HELP areyouredis_stage_duration_seconds Duration of the search stages.",
+        "# TYPE areyouredis_stage_duration_seconds summary"
+    ]
+    with _lock:
+        for stage, stats in sorted(_stages.items()):
+            for q in (0.5, 0.95, 0.99):
+                lines.append(
+                    f'areyouredis_stage_duration_seconds{{stage="{stage}",quantile="{q}"}} {stats.quantile(q)}'
+                )
+            lines.append(f'areyouredis_stage_duration_seconds_sum{{stage="{stage}"}} {stats.total}')
+            lines.append(f'areyouredis_stage_duration_seconds_count{{stage="{stage}"}} {stats.count}')
+        lines += [
+            "# HELP areyouredis_events_total Search events counters.",
+            "# TYPE areyouredis_events_total counter"
+        ]
+        for name, value in sorted(_counters.items()):
+            lines.append(f'areyouredis_events_total{{name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path: str = config.METRICS_FILE):
+    """Writes the metrics to a file, e.g. for the node exporter's textfile collector"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    # os.replace is atomic: a scraper never reads a partial file
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = config.METRICS_PORT, host: str = "127.0.0.1"):
+    """Serves the metrics on http://host:port/metrics, from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _write_prometheus_file_periodically(path: str, interval: float):
+    while True:
+        time.sleep(interval)
+        write_prometheus_file(path)
+
+
+def start_exporters():
+    """
+    Starts the exporters set up in the config (METRICS_PORT, METRICS_FILE), once per process.
+    Safe to call on every streamlit rerun.
+    """
+    global _exporters_started
+    with _lock:
+        if _exporters_started or not _enabled:
+            return
+        _exporters_started = True
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_PORT)
+    if config.METRICS_FILE:
+        threading.Thread(
+            target=_write_prometheus_file_periodically,
+            args=(config.METRICS_FILE, config.METRICS_FILE_INTERVAL),
+            daemon=True
+        ).start()
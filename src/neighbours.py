@@ -0,0 +1,259 @@
+"""
+Offline nearest neighbours graph: the top N most similar papers of every paper, for O(1) "related papers" lookups.
+
+The graph is computed over the vectors of one or more vector stores, memory-mapped chunk by chunk, by blocks of
+rows dispatched to a process pool: each block is multiplied with every chunk, keeping the running top N.
+It is saved in a directory holding:
+    - neighbours.npy: (n, N) int32 rows of the neighbours of each paper, by decreasing similarity
+    - scores.npy: (n, N) float16 similarities
+    - graph.json: the stores the graph was computed on, N, and the ids of the papers (in rows order)
+
+    python -m src.neighbours build --store ./arxiv_embeddings_300000_completed --output ./neighbours
+    python -m src.neighbours update --graph ./neighbours --store ./new_papers
+    python -m src.neighbours upload --graph ./neighbours
+
+update adds the papers of a new store: their neighbours are computed over all the stores, and the neighbours of
+the existing papers are only compared with the new ones. upload stores one compact hash per paper in redis
+("neighbours:<paper id>", see get_related_papers).
+"""
+import os
+import json
+import asyncio
+import argparse
+import numpy as np
+import src.config as config
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+from redis.asyncio import Redis
+from src.vector_store import iter_chunks, read_manifest
+
+GRAPH_FILE = "graph.json"
+NEIGHBOURS_FILE = "neighbours.npy"
+SCORES_FILE = "scores.npy"
+
+
+class StoreMatrix:
+    """Rows of several vector stores, seen as a single memory-mapped (n, dim) matrix"""
+
+    def __init__(self, stores: List[str]):
+        # Only the vectors: the metadata of the chunks is not read
+        self.chunks = [
+            np.load(os.path.join(store, chunk["vectors"]), mmap_mode="r")
+            for store in stores
+            for chunk in read_manifest(store)["chunks"]
+        ]
+        self.offsets = np.cumsum([0] + [len(chunk) for chunk in self.chunks])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def iter_blocks(self, start: int = 0) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields (first row, rows) of the chunks, from the row start on"""
+        for offset, chunk in zip(self.offsets, self.chunks):
+            if offset + len(chunk) > start:
+                skipped = max(0, start - offset)
+                yield int(offset + skipped), np.asarray(chunk[skipped:], dtype=np.float32)
+
+    def rows(self, start: int, end: int) -> np.ndarray:
+        return np.concatenate([
+            block[:end - offset] for offset, block in self.iter_blocks(start) if offset < end
+        ])
+
+
+# Matrix of the stores of the pool, opened once per worker process (see init_worker)
+_worker_matrix = None
+
+
+def init_worker(stores: List[str]):
+    global _worker_matrix
+    _worker_matrix = StoreMatrix(stores)
+
+
+def compute_neighbours_block(
+        stores: List[str],
+        start: int,
+        end: int,
+        n_neighbours: int,
+        candidates_start: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top n_neighbours rows (and scores) of the rows [start, end), among the rows from candidates_start on"""
+    matrix = _worker_matrix if _worker_matrix is not None else StoreMatrix(stores)
+    queries = matrix.rows(start, end)
+    top_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    top_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    for offset, block in matrix.iter_blocks(candidates_start):
+        scores = queries @ block.T
+        # A paper is not its own neighbour
+        own = np.arange(start, end)
+        in_block = (own >= offset) & (own < offset + len(block))
+        scores[np.flatnonzero(in_block), own[in_block] - offset] = -np.inf
+        block_rows = np.broadcast_to(np.arange(offset, offset + len(block)), scores.shape)
+        scores = np.concatenate([top_scores, scores], axis=1)
+        rows = np.concatenate([top_rows, block_rows], axis=1)
+        kept = np.argpartition(-scores, min(n_neighbours, scores.shape[1]) - 1, axis=1)[:, :n_neighbours]
+        top_scores = np.take_along_axis(scores, kept, axis=1)
+        top_rows = np.take_along_axis(rows, kept, axis=1)
+    return sort_neighbours(top_rows, top_scores)
+
+
+def sort_neighbours(rows: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def compute_neighbours(
+        stores: List[str],
+        start: int,
+        end: int,
+        n_neighbours: int,
+        candidates_start: int = 0,
+        block_size: int = 2048,
+        max_workers: int = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Neighbours of the rows [start, end), computed by blocks of block_size rows in a process pool"""
+    blocks = [(block_start, min(block_start + block_size, end)) for block_start in range(start, end, block_size)]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(stores,)) as executor:
+        futures = [
+            executor.submit(compute_neighbours_block, stores, block_start, block_end, n_neighbours, candidates_start)
+            for block_start, block_end in blocks
+        ]
+        results = [future.result() for future in futures]
+    return np.concatenate([rows for rows, _ in results]), np.concatenate([scores for _, scores in results])
+
+
+def read_paper_ids(stores: List[str]) -> List[str]:
+    return [str(record["id"]) for store in stores for records, _ in iter_chunks(store) for record in records]
+
+
+def save_graph(path: str, stores: List[str], paper_ids: List[str], rows: np.ndarray, scores: np.ndarray):
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, NEIGHBOURS_FILE), rows.astype(np.int32))
+    np.save(os.path.join(path, SCORES_FILE), scores.astype(np.float16))
+    with open(os.path.join(path, GRAPH_FILE), "w") as f:
+        json.dump({"stores": stores, "n_neighbours": int(rows.shape[1]), "paper_ids": paper_ids}, f)
+
+
+def load_graph(path: str) -> Tuple[Dict, np.ndarray, np.ndarray]:
+    with open(os.path.join(path, GRAPH_FILE)) as f:
+        graph = json.load(f)
+    rows = np.load(os.path.join(path, NEIGHBOURS_FILE), mmap_mode="r")
+    scores = np.load(os.path.join(path, SCORES_FILE), mmap_mode="r")
+    return graph, rows, scores
+
+
+def build_graph(
+        stores: List[str],
+        output: str,
+        n_neighbours: int = config.NEIGHBOURS_N,
+        block_size: int = 2048,
+        max_workers: int = None
+):
+    """Computes the neighbours graph of all the papers of the stores"""
+    n = sum(read_manifest(store)["count"] for store in stores)
+    rows, scores = compute_neighbours(stores, 0, n, n_neighbours, 0, block_size, max_workers)
+    save_graph(output, stores, read_paper_ids(stores), rows, scores)
+    print(f"Neighbours graph of {n} papers saved to {output}")
+
+
+def update_graph(graph_path: str, new_store: str, block_size: int = 2048, max_workers: int = None) -> List[str]:
+    """
+    Adds the papers of a new store to a graph: the new papers get their neighbours among all the papers, the
+    existing ones only compare their neighbours with the new papers. Returns the ids of the papers whose
+    neighbours changed (to be uploaded again).
+    """
+    graph, rows, scores = load_graph(graph_path)
+    # In memory copies: the graph files are rewritten at the end
+    rows, scores = np.array(rows), np.array(scores, dtype=np.float32)
+    stores = graph["stores"] + [new_store]
+    n_neighbours = graph["n_neighbours"]
+    n_old = len(graph["paper_ids"])
+    n = n_old + read_manifest(new_store)["count"]
+
+    new_rows, new_scores = compute_neighbours(stores, n_old, n, n_neighbours, 0, block_size, max_workers)
+    old_candidates, old_candidate_scores = compute_neighbours(
+        stores, 0, n_old, n_neighbours, n_old, block_size, max_workers
+    )
+    merged_scores = np.concatenate([scores, old_candidate_scores], axis=1)
+    merged_rows = np.concatenate([rows.astype(np.int64), old_candidates], axis=1)
+    old_rows, old_scores = sort_neighbours(merged_rows, merged_scores)
+    old_rows, old_scores = old_rows[:, :n_neighbours], old_scores[:, :n_neighbours]
+    changed = np.flatnonzero((old_rows != rows).any(axis=1))
+
+    paper_ids = graph["paper_ids"] + read_paper_ids([new_store])
+    save_graph(
+        graph_path,
+        stores,
+        paper_ids,
+        np.concatenate([old_rows, new_rows]),
+        np.concatenate([old_scores, new_scores])
+    )
+    print(f"{n - n_old} papers added, neighbours of {len(changed)} existing papers updated")
+    return [paper_ids[i] for i in changed] + paper_ids[n_old:]
+
+
+def neighbours_key(paper_id: str) -> str:
+    return f"{config.NEIGHBOURS_PREFIX}{paper_id}"
+
+
+async def upload_graph(redis_conn: Redis, graph_path: str, paper_ids: List[str] = None, batch_size: int = 1000):
+    """
+    Stores the neighbours of the papers (all of them by default) in redis: one hash per paper, holding the ids of its
+    neighbours (comma separated) and their scores (float16 bytes).
+    """
+    graph, rows, scores = load_graph(graph_path)
+    all_ids = graph["paper_ids"]
+    positions = {paper_id: i for i, paper_id in enumerate(all_ids)}
+    selected = [positions[paper_id] for paper_id in paper_ids] if paper_ids is not None else range(len(all_ids))
+    selected = list(selected)
+    for start in range(0, len(selected), batch_size):
+        pipe = redis_conn.pipeline(transaction=False)
+        for i in selected[start:start + batch_size]:
+            pipe.hset(neighbours_key(all_ids[i]), mapping={
+                "ids": ",".join(all_ids[j] for j in rows[i]),
+                "scores": np.asarray(scores[i], dtype=np.float16).tobytes(),
+            })
+        await pipe.execute()
+
+
+async def get_related_papers(redis_conn: Redis, paper_id: str, k: int = None) -> List[Tuple[str, float]]:
+    """Precomputed neighbours of a paper, as (paper id, similarity), in one read (empty if it has none)"""
+    neighbours = await redis_conn.hgetall(neighbours_key(paper_id))
+    if not neighbours:
+        return []
+    ids = neighbours[b"ids"].decode().split(",")
+    scores = np.frombuffer(neighbours[b"scores"], dtype=np.float16)
+    return [(related_id, float(score)) for related_id, score in zip(ids, scores)][:k]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Offline nearest neighbours graph of the papers")
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Compute the graph of the papers of vector stores")
+    build_parser.add_argument("--store", nargs="+", required=True)
+    build_parser.add_argument("--output", required=True)
+    build_parser.add_argument("--neighbours", type=int, default=config.NEIGHBOURS_N)
+    build_parser.add_argument("--block-size", type=int, default=2048)
+    build_parser.add_argument("--workers", type=int)
+    update_parser = subparsers.add_parser("update", help="Add the papers of a new vector store to a graph")
+    update_parser.add_argument("--graph", required=True)
+    update_parser.add_argument("--store", required=True)
+    update_parser.add_argument("--workers", type=int)
+    update_parser.add_argument("--upload", action="store_true", help="Upload the changed neighbours to redis")
+    upload_parser = subparsers.add_parser("upload", help="Store the neighbours of all the papers in redis")
+    upload_parser.add_argument("--graph", required=True)
+    args = arg_parser.parse_args()
+
+    from src.redis_db import get_redis_connexion
+    if args.command == "build":
+        build_graph(args.store, args.output, args.neighbours, args.block_size, args.workers)
+    elif args.command == "update":
+        changed = update_graph(args.graph, args.store, max_workers=args.workers)
+        if args.upload:
+            asyncio.run(upload_graph(get_redis_connexion(), args.graph, changed))
+    else:
+        asyncio.run(upload_graph(get_redis_connexion(), args.graph))
+
+
+if __name__ == "__main__":
+    main()
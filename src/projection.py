@@ -0,0 +1,125 @@
+"""
+Dimensionality reduction of the papers index.
+
+An (uncentered) PCA projection is fitted offline on the vectors of a vector store: its components are the top
+eigenvectors of the second moment matrix of the vectors, i.e. the subspace which best preserves the inner products
+the index ranks papers with. all-mpnet-base-v2 is not trained Matryoshka-style, so its embeddings cannot simply be
+truncated.
+    python -m src.projection report --store ./arxiv_embeddings_300000_completed --dims 128 256 384 512
+    python -m src.projection fit --store ./arxiv_embeddings_300000_completed --dim 256 --output ./models/pca_256.npy
+    PROJECTION_PATH=./models/pca_256.npy python -m src.projection apply
+
+apply stores the projected vectors of the loaded papers (config.PROJECTED_VECTOR_NAME) and rebuilds the index on
+them; the searches then project the query vectors the same way, as long as PROJECTION_PATH is set.
+"""
+import json
+import argparse
+import functools
+import numpy as np
+import src.config as config
+
+from typing import Dict, List
+from src.vector_store import iter_chunks
+
+
+def fit_projection(path: str, dim: int = None) -> np.ndarray:
+    """(dim, VECTOR_DIM) projection matrix, fitted on all the vectors of a store (streamed chunk by chunk)"""
+    second_moment = None
+    n = 0
+    for _, vectors in iter_chunks(path):
+        x = np.asarray(vectors, dtype=np.float64)
+        second_moment = x.T @ x if second_moment is None else second_moment + x.T @ x
+        n += len(x)
+    eigenvalues, eigenvectors = np.linalg.eigh(second_moment / n)
+    order = np.argsort(eigenvalues)[::-1][:dim]
+    return eigenvectors[:, order].T.astype(np.float32)
+
+
+def save_projection(path: str, components: np.ndarray):
+    np.save(path, components)
+
+
+@functools.lru_cache()
+def load_projection(path: str = config.PROJECTION_PATH) -> np.ndarray:
+    return np.load(path)
+
+
+def project_vectors(vectors: np.ndarray, components: np.ndarray = None) -> np.ndarray:
+    """Projects one vector, or a (n, VECTOR_DIM) array of vectors, on the components (by default, PROJECTION_PATH)"""
+    components = load_projection() if components is None else components
+    return np.asarray(vectors, dtype=np.float32) @ components.T
+
+
+def exact_top_k(queries: np.ndarray, path: str, k: int, components: np.ndarray = None) -> np.ndarray:
+    """Indexes of the top k vectors of a store by inner product with each query (after projection, if given)"""
+    top_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    top_indexes = np.zeros((len(queries), 0), dtype=np.int64)
+    start = 0
+    for _, vectors in iter_chunks(path):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if components is not None:
+            vectors = project_vectors(vectors, components)
+        chunk_indexes = np.broadcast_to(np.arange(start, start + len(vectors)), (len(queries), len(vectors)))
+        scores = np.concatenate([top_scores, queries @ vectors.T], axis=1)
+        indexes = np.concatenate([top_indexes, chunk_indexes], axis=1)
+        kept = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, kept, axis=1)
+        top_indexes = np.take_along_axis(indexes, kept, axis=1)
+        start += len(vectors)
+    return top_indexes
+
+
+def sample_vectors(path: str, n: int, seed: int = 0) -> np.ndarray:
+    """n vectors drawn from a store, used as queries"""
+    vectors = np.concatenate([np.asarray(chunk_vectors, dtype=np.float32) for _, chunk_vectors in iter_chunks(path)])
+    return vectors[np.random.default_rng(seed).choice(len(vectors), size=min(n, len(vectors)), replace=False)]
+
+
+def recall_report(path: str, dims: List[int], n_queries: int = 200, k: int = 10, queries: np.ndarray = None) -> Dict:
+    """
+    Recall@k of the search at each reduced dimension: share of the exact (full dimension) top k papers of each
+    query which are found in the top k papers of the reduced search. The queries are drawn from the store,
+    unless given (e.g. the embeddings of a query set).
+    """
+    queries = sample_vectors(path, n_queries) if queries is None else np.asarray(queries, dtype=np.float32)
+    components = fit_projection(path, max(dims))
+    expected = exact_top_k(queries, path, k)
+    report = {"queries": len(queries), "k": k, "full_dim": int(queries.shape[1]), "dims": {}}
+    for dim in sorted(dims):
+        found = exact_top_k(project_vectors(queries, components[:dim]), path, k, components[:dim])
+        recalls = [len(set(e) & set(f)) / k for e, f in zip(expected, found)]
+        report["dims"][dim] = {
+            f"mean_recall_at_{k}": float(np.mean(recalls)),
+            f"min_recall_at_{k}": float(np.min(recalls)),
+            "bytes_per_vector": dim * np.dtype(np.float32).itemsize,
+        }
+    return report
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Dimensionality reduction of the papers index")
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    fit_parser = subparsers.add_parser("fit", help="Fit the projection on a vector store")
+    fit_parser.add_argument("--store", required=True)
+    fit_parser.add_argument("--dim", type=int, required=True)
+    fit_parser.add_argument("--output", required=True)
+    report_parser = subparsers.add_parser("report", help="Recall of the search at several reduced dimensions")
+    report_parser.add_argument("--store", required=True)
+    report_parser.add_argument("--dims", type=int, nargs="+", default=[128, 256, 384, 512])
+    report_parser.add_argument("--queries", type=int, default=200)
+    report_parser.add_argument("--k", type=int, default=10)
+    subparsers.add_parser("apply", help="Store the projected vectors in redis, and rebuild the index on them")
+    args = arg_parser.parse_args()
+
+    if args.command == "fit":
+        save_projection(args.output, fit_projection(args.store, args.dim))
+        print(f"Projection to {args.dim} dimensions saved to {args.output}")
+    elif args.command == "report":
+        print(json.dumps(recall_report(args.store, args.dims, args.queries, args.k), indent=2))
+    else:
+        from src.redis_db import apply_projection
+        apply_projection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Quantized CPU inference for the query embeddings.
+
+Offline conversion of the embedding model, to a dynamically int8-quantized copy or to ONNX:
+    python -m src.quantization convert --backend int8 --output ./models/all-mpnet-base-v2-int8
+    python -m src.quantization convert --backend onnx --output ./models/all-mpnet-base-v2-onnx
+
+Evaluation against the FP32 model, on a query set (cosine drift of the query embeddings, and top-k overlap of
+the search results over a vector store):
+    python -m src.quantization evaluate --backend int8 --path ./models/all-mpnet-base-v2-int8 \
+        --store ./arxiv_embeddings_300000_completed
+
+The app then uses the converted model with EMBEDDING_BACKEND=int8 (or onnx) and QUANTIZED_MODEL_PATH.
+The onnx backend is an optional extra: it needs onnxruntime (pip install onnxruntime).
+"""
+import os
+import json
+import argparse
+import numpy as np
+import src.config as config
+
+from typing import Dict, List, Union
+
+
+BACKEND_FILE = "backend.json"
+INT8_MODEL_FILE = "model_state_dict.pt"
+ONNX_MODEL_FILE = "model.onnx"
+
+
+def quantize_model(model):
+    """Dynamically int8-quantized copy of the linear layers of a model"""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def convert_model(output_path: str, backend: str = "int8", model_name: str = config.EMBEDDING_MODEL):
+    """Converts the embedding model for CPU inference, and saves it to output_path"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    os.makedirs(output_path, exist_ok=True)
+    if backend == "int8":
+        # Only the weights are saved: the quantized module is rebuilt from the model when loaded
+        torch.save(quantize_model(model).state_dict(), os.path.join(output_path, INT8_MODEL_FILE))
+    elif backend == "onnx":
+        transformer = model[0].auto_model.eval()
+        tokenizer = model.tokenizer
+        dummy = tokenizer(["an example query"], return_tensors="pt")
+        torch.onnx.export(
+            transformer,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            os.path.join(output_path, ONNX_MODEL_FILE),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["token_embeddings"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "token_embeddings": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14
+        )
+        tokenizer.save_pretrained(output_path)
+    else:
+        raise ValueError(f"Unknown backend '{backend}', expected 'int8' or 'onnx'")
+
+    with open(os.path.join(output_path, BACKEND_FILE), "w") as f:
+        json.dump({"backend": backend, "model_name": model_name, "max_seq_length": model.max_seq_length}, f)
+    print(f"{backend} model saved to {output_path}")
+
+
+class OnnxEmbeddingModel:
+    """
+    ONNX Runtime version of the sentence transformer: transformer in ONNX, then mean pooling and normalization.
+    Exposes the same encode method as SentenceTransformer, so it can be used by create_embedding.
+    """
+
+    def __init__(self, path: str):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime, which is not installed: pip install onnxruntime")
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(path, BACKEND_FILE)) as f:
+            self.max_seq_length = json.load(f)["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(path, ONNX_MODEL_FILE),
+            providers=["CPUExecutionProvider"]
+        )
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            token_embeddings = self.session.run(
+                ["token_embeddings"],
+                {"input_ids": tokens["input_ids"], "attention_mask": tokens["attention_mask"]}
+            )[0]
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(pooled / np.linalg.norm(pooled, axis=1, keepdims=True))
+        embeddings = np.concatenate(embeddings).astype(np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def load_quantized_model(path: str, backend: str):
+    """Loads a model converted with convert_model"""
+    if backend == "int8":
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        with open(os.path.join(path, BACKEND_FILE)) as f:
+            model_name = json.load(f)["model_name"]
+        model = quantize_model(SentenceTransformer(model_name, device="cpu"))
+        model.load_state_dict(
+            torch.load(os.path.join(path, INT8_MODEL_FILE), map_location="cpu", weights_only=True)
+        )
+        return model
+    if backend == "onnx":
+        return OnnxEmbeddingModel(path)
+    raise ValueError(f"Unknown backend '{backend}', expected 'fp32', 'int8' or 'onnx'")
+
+
+def evaluate_quantized_model(
+        queries: List[str],
+        path: str,
+        backend: str,
+        store: str = None,
+        k: int = 10
+) -> Dict[str, float]:
+    """
+    Compares the converted model to the FP32 one on a query set:
+        - cosine drift: 1 - cosine similarity between the FP32 and converted query embeddings
+        - top-k overlap: share of the FP32 top k papers also returned with the converted embedding (needs a store)
+    """
+    from src.vectors import create_embedding, load_embedding_model
+
+    fp32_model = load_embedding_model(backend="fp32")
+    converted_model = load_quantized_model(path, backend)
+    fp32 = np.stack([create_embedding(query, fp32_model) for query in queries])
+    converted = np.stack([create_embedding(query, converted_model) for query in queries])
+    cosine = (fp32 * converted).sum(axis=1) / (np.linalg.norm(fp32, axis=1) * np.linalg.norm(converted, axis=1))
+    report = {
+        "queries": len(queries),
+        "mean_cosine_drift": float(np.mean(1 - cosine)),
+        "max_cosine_drift": float(np.max(1 - cosine)),
+    }
+    if store:
+        from src.local_search import LocalSearchBackend
+
+        search_backend = LocalSearchBackend(store)
+        overlaps = []
+        for fp32_vector, converted_vector in zip(fp32, converted):
+            expected = {paper["paper_id"] for paper in search_backend.search(fp32_vector, k)}
+            found = {paper["paper_id"] for paper in search_backend.search(converted_vector, k)}
+            overlaps.append(len(expected & found) / max(len(expected), 1))
+        report.update({
+            f"mean_top_{k}_overlap": float(np.mean(overlaps)),
+            f"min_top_{k}_overlap": float(np.min(overlaps)),
+        })
+    return report
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Quantized CPU inference for the query embeddings")
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert the embedding model")
+    convert_parser.add_argument("--backend", choices=["int8", "onnx"], default="int8")
+    convert_parser.add_argument("--output", required=True)
+    evaluate_parser = subparsers.add_parser("evaluate", help="Compare a converted model to the FP32 one")
+    evaluate_parser.add_argument("--backend", choices=["int8", "onnx"], default="int8")
+    evaluate_parser.add_argument("--path", required=True)
+    evaluate_parser.add_argument("--store", help="Vector store used to measure the top-k overlap")
+    evaluate_parser.add_argument("--k", type=int, default=10)
+    args = arg_parser.parse_args()
+
+    if args.command == "convert":
+        convert_model(args.output, args.backend)
+    else:
+        from src.load_test import QUERY_MIX
+        report = evaluate_quantized_model(QUERY_MIX, args.path, args.backend, args.store, args.k)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
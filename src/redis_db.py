@@ -1,20 +1,40 @@
 import src.config as config
+import re
+import json
+import time
+import uuid
+import zlib
+import pickle
 import asyncio
+import heapq
+import random
+import hashlib
+import threading
 import numpy as np
-import pandas as pd
 
 # Set new event loop
 loop = asyncio.new_event_loop()
 asyncio.set_event_loop(loop)
 
 from dateutil import parser
-from typing import List, Dict
-from src.vectors import create_embedding
+from typing import Any, Awaitable, Callable, List, Dict, Tuple, TYPE_CHECKING
+from src.vectors import create_embedding, load_embedding_model, normalize_categories
+from src.vector_store import hash_paper_id, is_vector_store, read_vector_store
+from src.projection import load_projection, project_vectors
+from src.neighbours import get_related_papers
+from src.results import ResultSet
+from src.topics import load_topics, nearest_topic, top_papers
+from src.compact import COMPRESSED_ABSTRACT_FIELD, compact_paper_mapping, compress_text, compact_versions, decode_paper
+from src.metrics import timer, increment
 from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
 from redis.commands.search.query import Query
-from redis.commands.search.field import VectorField, TagField
+from redis.commands.search.field import VectorField, TagField, NumericField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
-from src.models import Paper
+
+# pandas and aredis_om are only needed to load data: they are imported when first needed, not on app start
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 async def gather_with_concurrency(n, redis_conn, *papers):
@@ -33,14 +53,17 @@ async def gather_with_concurrency(n, redis_conn, *papers):
         - update_date: Date of last article's update
         - title: title
         - abstract: text of the abstract
-        - categories: paper categories the article belongs to
+        - categories: paper categories the article belongs to, as a normalized list of tags (e.g. "cs.lg,stat.ml")
         - month: Month of the last update
         - year: Year of the last update
         - sch_id: External data; Semantic Scholar's ID corresponding to the article's doi
         - citations: External data from Semantic Scholar; sch_id of all articles cited in this article.
+        - citation_count: Number of elements of citations, so that it can be read without the citations
         - influential_citation_count: Number of 'important' articles cited in this article / paper
+        - topic_id: Topic of the paper (nearest topic centroid, see src.topics), when TOPICS_PATH is set
 
     """
+    from src.models import Paper
     semaphore = asyncio.Semaphore(n)
 
     async def load_paper(paper):
@@ -48,35 +71,54 @@ async def gather_with_concurrency(n, redis_conn, *papers):
             vector = paper.pop('vector')
             p = Paper(**paper)
             key = "paper_vector:" + str(p.id)
-            # async write data to redis
-            await p.save()
-            await redis_conn.hset(
-                key,
-                mapping={
-                    "paper_pk": p.pk,
-                    "paper_id": p.id,
-                    "submitter": p.submitter,
-                    "authors": p.authors,
-                    "doi": p.doi,
-                    "version": p.versions,
-                    "license": p.license,
-                    "update_date": p.update_date,
-                    "title": p.title,
-                    "abstract": p.abstract,
-                    "categories": p.categories,
-                    "month": parser.parse(p.update_date).month,
-                    "year": parser.parse(p.update_date).year,
-                    "vector": np.array(vector, dtype=np.float32).tobytes(),
-                    "sch_id": p.sch_id,
-                    "citations": p.citations,
-                    "influential_citation_count": p.influential_citation_count
-                })
+            is_new = not await redis_conn.exists(key)
+            # async write data to redis, on the DB (or shard) holding its 'paper_vector:' hash rather than on the
+            # default connection of redis-om. The redis-om hash duplicates the full fields of the paper: it is not
+            # stored with the compact encodings
+            if not config.COMPACT_ENCODING:
+                om_pipe = redis_conn.pipeline(transaction=False)
+                await p.save(pipeline=om_pipe)
+                await om_pipe.execute()
+            mapping = {
+                "paper_pk": p.pk,
+                "paper_id": p.id,
+                "submitter": p.submitter,
+                "authors": p.authors,
+                "doi": p.doi,
+                "version": p.versions,
+                "license": p.license,
+                "update_date": p.update_date,
+                "title": p.title,
+                "abstract": p.abstract,
+                "categories": normalize_categories(p.categories),
+                "month": parser.parse(p.update_date).month,
+                "year": parser.parse(p.update_date).year,
+                "vector": np.array(vector, dtype=np.float32).tobytes(),
+                "sch_id": p.sch_id,
+                "citations": p.citations,
+                "citation_count": len(str(p.citations).split(',')),
+                "influential_citation_count": p.influential_citation_count
+            }
+            if config.PROJECTION_PATH:
+                mapping[config.PROJECTED_VECTOR_NAME] = project_vectors(vector).tobytes()
+            if config.TOPICS_PATH:
+                mapping["topic_id"] = nearest_topic(vector)
+            if config.COMPACT_ENCODING:
+                mapping = compact_paper_mapping(mapping)
+            await redis_conn.hset(key, mapping=mapping)
+            if is_new:
+                update_date = parser.parse(p.update_date)
+                pipe = redis_conn.pipeline(transaction=False)
+                count_publication(pipe, update_date.year, update_date.month, normalize_categories(p.categories))
+                if config.TOPICS_PATH:
+                    pipe.hincrby(topic_counts_key(mapping["topic_id"]), str(update_date.year), 1)
+                await pipe.execute()
 
     # gather with concurrency
     await asyncio.gather(*[load_paper(p) for p in papers])
 
 
-async def load_all_data(redis_conn: Redis, papers: pd.DataFrame):
+async def load_all_data(redis_conn: Redis, papers: "pd.DataFrame"):
     """
     Loads all the data inside the redis DB, and creates a vector index, to query the vectors efficiently.
 
@@ -91,25 +133,299 @@ async def load_all_data(redis_conn: Redis, papers: pd.DataFrame):
         print("papers loaded!")
 
         print("Creating vector search index")
-        # create a search index
-        if config.INDEX_TYPE == "HNSW":
-            await create_hnsw_index(redis_conn, len(papers), prefix="paper_vector:", distance_metric="IP")
-        else:
-            await create_flat_index(redis_conn, len(papers), prefix="paper_vector:", distance_metric="L2")
+        # create a search index, behind the config.INDEX_NAME alias
+        distance_metric = "IP" if config.INDEX_TYPE == "HNSW" else "L2"
+        await reindex(
+            redis_conn, len(papers), config.INDEX_TYPE, prefix="paper_vector:", distance_metric=distance_metric,
+            vector_name=config.SEARCH_VECTOR_NAME, dim=get_search_vector_dim()
+        )
         print("Search index created")
 
 
+async def normalize_stored_categories(
+        redis_conn: Redis,
+        prefix: str = "paper_vector:",
+        batch_size: int = 1000,
+        cache_conn: Redis = None
+):
+    """
+    Rewrites the categories of already loaded papers as normalized tag lists.
+    The index picks up the new values by itself, no re-indexing is needed, but the index version is bumped (on
+    cache_conn, the DB holding the caches, if redis_conn is a shard), so that the cached results, computed with
+    the former categories, are not served anymore.
+    """
+    keys = [key async for key in redis_conn.scan_iter(match=f"{prefix}*", count=batch_size)]
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pipe = redis_conn.pipeline(transaction=False)
+        for key in batch:
+            pipe.hget(key, "categories")
+        categories = await pipe.execute()
+        pipe = redis_conn.pipeline(transaction=False)
+        for key, value in zip(batch, categories):
+            if value is not None:
+                pipe.hset(key, "categories", normalize_categories(try_decode_bytes(value)))
+        await pipe.execute()
+    await bump_index_version(cache_conn or redis_conn)
+
+
+async def add_citation_counts(redis_conn: Redis, prefix: str = "paper_vector:", batch_size: int = 1000):
+    """Adds the citation_count field to papers loaded before it existed"""
+    keys = [key async for key in redis_conn.scan_iter(match=f"{prefix}*", count=batch_size)]
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pipe = redis_conn.pipeline(transaction=False)
+        for key in batch:
+            pipe.hget(key, "citations")
+        citations = await pipe.execute()
+        pipe = redis_conn.pipeline(transaction=False)
+        for key, value in zip(batch, citations):
+            pipe.hset(key, "citation_count", len(try_decode_bytes(value or b"None").split(',')))
+        await pipe.execute()
+
+
+def publication_counts_key(category: str = config.PUBLICATION_COUNTS_ALL):
+    return f"{config.PUBLICATION_COUNTS_PREFIX}{category}"
+
+
+def count_publication(pipe, year: int, month: int, categories: str):
+    """
+    Queues the increments of the publication counters of one paper, on a pipeline.
+    The counters are hashes (overall, and one per category) of "YYYY" and "YYYY-MM" fields.
+    """
+    for category in [config.PUBLICATION_COUNTS_ALL] + [c for c in categories.split(config.CATEGORIES_SEPARATOR) if c]:
+        key = publication_counts_key(category)
+        pipe.hincrby(key, str(year), 1)
+        pipe.hincrby(key, f"{year}-{int(month):02d}", 1)
+
+
+async def rebuild_publication_counts(redis_conn: Redis, prefix: str = "paper_vector:", batch_size: int = 1000):
+    """Recomputes all the publication counters from the loaded papers (e.g. for papers loaded before they existed)"""
+    keys = [key async for key in redis_conn.scan_iter(match=f"{config.PUBLICATION_COUNTS_PREFIX}*")]
+    if keys:
+        await redis_conn.delete(*keys)
+    keys = [key async for key in redis_conn.scan_iter(match=f"{prefix}*", count=batch_size)]
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pipe = redis_conn.pipeline(transaction=False)
+        for key in batch:
+            pipe.hmget(key, ["year", "month", "categories"])
+        papers = await pipe.execute()
+        pipe = redis_conn.pipeline(transaction=False)
+        for year, month, categories in papers:
+            if year is not None and month is not None:
+                count_publication(pipe, int(year), int(month), try_decode_bytes(categories or b""))
+        await pipe.execute()
+
+
+async def get_publication_counts(
+        redis_conn: Redis,
+        categories: List[str] = None,
+        granularity: str = "year"
+) -> Dict[str, int]:
+    """
+    Number of papers published per year ("YYYY") or month ("YYYY-MM"), overall or in the given categories.
+    With several categories, the counters are summed: a paper in two of them is counted twice.
+    """
+    pipe = redis_conn.pipeline(transaction=False)
+    for category in categories or [config.PUBLICATION_COUNTS_ALL]:
+        pipe.hgetall(publication_counts_key(category))
+    counts = {}
+    for category_counts in await pipe.execute():
+        for period, count in category_counts.items():
+            period = try_decode_bytes(period)
+            if (len(period) == 4) == (granularity == "year"):
+                counts[period] = counts.get(period, 0) + int(count)
+    return counts
+
+
+def topic_counts_key(topic_id: int) -> str:
+    return f"{config.TOPIC_COUNTS_PREFIX}{topic_id}"
+
+
+async def create_topic_index(redis_conn: Redis, dim: int):
+    """(Re)creates the small vector index of the topic centroids"""
+    try:
+        await redis_conn.ft(config.TOPIC_INDEX_NAME).dropindex(delete_documents=True)
+    except ResponseError:
+        pass
+    await redis_conn.ft(config.TOPIC_INDEX_NAME).create_index(
+        fields=[
+            TagField("topic_id"),
+            NumericField("size"),
+            VectorField(
+                config.VECTOR_NAME,
+                "FLAT", {
+                    "TYPE": config.VECTOR_TYPE,
+                    "DIM": dim,
+                    "DISTANCE_METRIC": "IP"
+                }
+            )
+        ],
+        definition=IndexDefinition(prefix=[config.TOPIC_PREFIX], index_type=IndexType.HASH)
+    )
+
+
+async def upload_topics(
+        redis_conn: Redis,
+        topics_path: str,
+        shard_conns: List[Redis] = None,
+        batch_size: int = 1000,
+        n_top_papers: int = config.TOPIC_TOP_PAPERS
+):
+    """
+    Uploads fitted topics (see src.topics): tags the loaded papers with their 'topic_id', replaces the yearly counts
+    of each topic (on the shard of the papers, as the publication counters), and recreates the centroids index,
+    each centroid holding the size of its topic and its top papers (with the fields of GRAPH_FIELDS, as JSON).
+    """
+    topics, centroids, labels, scores = load_topics(topics_path)
+    paper_ids = topics["paper_ids"]
+    conns = shard_conns or [redis_conn]
+    loaded = np.zeros(len(paper_ids), dtype=bool)
+    yearly_counts = [{} for _ in conns]
+    for start in range(0, len(paper_ids), batch_size):
+        batch = range(start, min(start + batch_size, len(paper_ids)))
+        owners = [shard_of(paper_ids[i], len(conns)) for i in batch]
+        pipes = [conn.pipeline(transaction=False) for conn in conns]
+        for i, owner in zip(batch, owners):
+            pipes[owner].hget(f"paper_vector:{paper_ids[i]}", "year")
+        years = [iter(shard_years) for shard_years in await asyncio.gather(*[pipe.execute() for pipe in pipes])]
+        pipes = [conn.pipeline(transaction=False) for conn in conns]
+        for i, owner in zip(batch, owners):
+            year = next(years[owner])
+            # Papers of the stores which are not loaded are left out
+            if year is None:
+                continue
+            loaded[i] = True
+            pipes[owner].hset(f"paper_vector:{paper_ids[i]}", "topic_id", int(labels[i]))
+            counter = (int(labels[i]), try_decode_bytes(year))
+            yearly_counts[owner][counter] = yearly_counts[owner].get(counter, 0) + 1
+        await asyncio.gather(*[pipe.execute() for pipe in pipes])
+
+    for conn, counts in zip(conns, yearly_counts):
+        pipe = conn.pipeline(transaction=False)
+        pipe.delete(*[topic_counts_key(topic_id) for topic_id in range(len(centroids))])
+        for (topic_id, year), count in counts.items():
+            pipe.hset(topic_counts_key(topic_id), year, count)
+        await pipe.execute()
+
+    await create_topic_index(redis_conn, centroids.shape[1])
+    sizes = np.bincount(labels[loaded], minlength=len(centroids))
+    rows_by_topic = top_papers(labels[loaded], scores[loaded], len(centroids), n_top_papers)
+    loaded_rows = np.flatnonzero(loaded)
+    for topic_id, rows in enumerate(rows_by_topic):
+        rows = loaded_rows[rows]
+        ids = [paper_ids[row] for row in rows]
+        if shard_conns:
+            details = await fetch_paper_details_on_shards(shard_conns, ids, GRAPH_FIELDS)
+        else:
+            details = await fetch_paper_details(redis_conn, ids, GRAPH_FIELDS)
+        papers = [{**details[paper_id], "similarity_score": float(scores[row])} for paper_id, row in zip(ids, rows)]
+        await redis_conn.hset(f"{config.TOPIC_PREFIX}{topic_id}", mapping={
+            "topic_id": topic_id,
+            "size": int(sizes[topic_id]),
+            "top_papers": json.dumps(papers),
+            config.VECTOR_NAME: np.asarray(centroids[topic_id], dtype=np.float32).tobytes()
+        })
+    print(f"{len(centroids)} topics of {int(loaded.sum())} papers uploaded")
+
+
+async def match_topics(
+        redis_conn: Redis,
+        vector: np.ndarray,
+        n: int = config.TOPIC_MATCH_N,
+        threshold: float = config.TOPIC_MATCH_THRESHOLD
+) -> List[Dict]:
+    """Topics whose centroid is among the n nearest to a vector, with a similarity >= threshold (none if no topics)"""
+    query = (
+        Query(f"*=>[KNN {n} @{config.VECTOR_NAME} $vec_param AS vector_score]")
+        .sort_by("vector_score")
+        .return_fields("topic_id", "size", "top_papers", "vector_score")
+        .dialect(2)
+    )
+    try:
+        results = await redis_conn.ft(config.TOPIC_INDEX_NAME).search(
+            query,
+            query_params={"vec_param": np.asarray(vector, dtype=np.float32).tobytes()}
+        )
+    except ResponseError:
+        return []
+    return [
+        {
+            "topic_id": int(doc.topic_id),
+            "size": int(doc.size),
+            "similarity": 1 - float(doc.vector_score),
+            "top_papers": json.loads(doc.top_papers)
+        }
+        for doc in results.docs if 1 - float(doc.vector_score) >= threshold
+    ]
+
+
+async def get_topic_counts(redis_conn: Redis, topic_ids: List[int], shard_conns: List[Redis] = None) -> Dict[str, int]:
+    """Number of papers of the topics per year ("YYYY"), summed over the topics (and the shards)"""
+    counts = {}
+    for conn in shard_conns or [redis_conn]:
+        pipe = conn.pipeline(transaction=False)
+        for topic_id in topic_ids:
+            pipe.hgetall(topic_counts_key(topic_id))
+        for topic_counts in await pipe.execute():
+            for year, count in topic_counts.items():
+                year = try_decode_bytes(year)
+                counts[year] = counts.get(year, 0) + int(count)
+    return counts
+
+
+async def find_broad_topic(
+        redis_conn: Redis,
+        user_text: str,
+        filters_dict: Dict[str, List[str]],
+        k: int,
+        shard_conns: List[Redis] = None
+):
+    """
+    Summary of a broad query from the precomputed topics, instead of its k most similar papers: the topics it
+    matches (see match_topics), their yearly counts and their top papers, within the years of the filters.
+    Returns None if the query is not broad: less than TOPIC_BROAD_MIN_K papers asked, category filters (the
+    topic counts are over all categories), no matching topic, or less than 2 top papers within the years.
+    """
+    if k < config.TOPIC_BROAD_MIN_K or filters_dict.get("categories"):
+        return None
+    vector = await get_query_embedding(redis_conn, user_text)
+    with timer("topic_match"):
+        topics = await match_topics(redis_conn, vector)
+    if not topics:
+        return None
+    topic_ids = [topic["topic_id"] for topic in topics]
+    counts = await get_topic_counts(redis_conn, topic_ids, shard_conns)
+    # The top papers of the topics are stored with their similarity to the topic centroid: they are rescored
+    # against the query, to be ranked and displayed like search results
+    papers = [paper for topic in topics for paper in topic["top_papers"] if str(paper["year"]) in filters_dict["year"]]
+    with timer("topic_rescore"):
+        papers = await rescore_results(redis_conn, papers, vector, shard_conns)
+    papers = sorted(papers, key=lambda paper: -paper["similarity_score"])[:k]
+    if len(papers) < 2:
+        return None
+    return {
+        "topic_ids": topic_ids,
+        "similarities": [topic["similarity"] for topic in topics],
+        "size": sum(topic["size"] for topic in topics),
+        "counts": {year: count for year, count in counts.items() if year in filters_dict["year"]},
+        "papers": papers,
+    }
+
+
 def make_tag_fields():
     """Tag fields added during the index creation"""
     return [
         TagField('submitter'),
         TagField('authors'),
         TagField('doi'),
-        TagField('categories'),
+        TagField('categories', separator=config.CATEGORIES_SEPARATOR),
         TagField('year'),
         TagField('versions'),
         TagField('license'),
         TagField('update_date'),
+        TagField('topic_id'),
     ]
 
 
@@ -123,13 +439,139 @@ def get_redis_connexion():
     return redis_connexion
 
 
+async def compact_stored_papers(redis_conn: Redis, prefix: str = "paper_vector:", batch_size: int = 1000):
+    """
+    Applies the compact encodings (see src.compact) to already loaded papers, and deletes their redis-om hashes
+    (the duplicate of their full fields, not stored with the compact encodings)
+    """
+    from src.models import Paper
+    keys = [key async for key in redis_conn.scan_iter(match=f"{prefix}*", count=batch_size)]
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pipe = redis_conn.pipeline(transaction=False)
+        for key in batch:
+            pipe.hmget(key, ["abstract", "version", "paper_pk"])
+        papers = await pipe.execute()
+        pipe = redis_conn.pipeline(transaction=False)
+        for key, (abstract, version, paper_pk) in zip(batch, papers):
+            pipe.hdel(key, *config.COMPACT_DROPPED_FIELDS)
+            if paper_pk is not None:
+                pipe.delete(Paper.make_primary_key(try_decode_bytes(paper_pk)))
+            if abstract is not None:
+                pipe.hset(key, COMPRESSED_ABSTRACT_FIELD, compress_text(try_decode_bytes(abstract)))
+                pipe.hdel(key, "abstract")
+            # Papers compacted by a previous run already have a YYYYMMDD version
+            if version is not None and not version.isdigit():
+                pipe.hset(key, "version", compact_versions(try_decode_bytes(version)))
+        await pipe.execute()
+
+
+def get_shard_connexions() -> List[Redis]:
+    """Connection pools of the shards of config.REDIS_SHARDS (empty if the papers are not sharded)"""
+    shard_connexions = []
+    for shard in config.REDIS_SHARDS:
+        host, port = shard.rsplit(":", 1)
+        shard_connexions.append(Redis(host=host, port=int(port), password=config.REDIS_PASSWORD))
+    return shard_connexions
+
+
+def shard_of(paper_id: str, n_shards: int) -> int:
+    """Shard holding a paper: the papers are partitioned on the hash of their id"""
+    return hash_paper_id(paper_id) % n_shards
+
+
+def is_redis_available():
+    """Checks that the redis DB can be reached"""
+    async def ping():
+        conn = get_redis_connexion()
+        try:
+            return await conn.ping()
+        finally:
+            await conn.close()
+
+    try:
+        return asyncio.run(ping())
+    except (RedisError, OSError):
+        return False
+
+
+_shared_loop = None
+_shared_redis_connexion = None
+_shared_shard_connexions = None
+_shared_lock = threading.Lock()
+_warm_up_started = False
+
+
+def get_shared_event_loop():
+    """
+    Event loop running forever in a background thread, shared by all the searches of the process.
+    Its redis connection pool (see get_shared_redis_connexion) is kept open between searches.
+    """
+    global _shared_loop
+    with _shared_lock:
+        if _shared_loop is None:
+            _shared_loop = asyncio.new_event_loop()
+            threading.Thread(target=_shared_loop.run_forever, name="redis-event-loop", daemon=True).start()
+    return _shared_loop
+
+
+def run_on_shared_loop(coroutine):
+    """Runs a coroutine on the shared event loop, and waits for its result (from any thread)"""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_shared_event_loop()).result()
+
+
+def get_shared_redis_connexion():
+    """Redis connection pool of the process, to be used on the shared event loop only"""
+    global _shared_redis_connexion
+    with _shared_lock:
+        if _shared_redis_connexion is None:
+            _shared_redis_connexion = get_redis_connexion()
+    return _shared_redis_connexion
+
+
+def get_shared_shard_connexions() -> List[Redis]:
+    """Shards connection pools of the process (see get_shard_connexions), to be used on the shared event loop only"""
+    global _shared_shard_connexions
+    with _shared_lock:
+        if _shared_shard_connexions is None:
+            _shared_shard_connexions = get_shard_connexions()
+    return _shared_shard_connexions
+
+
+async def create_embedding_async(user_text: str):
+    """Computes the query embedding in a worker thread, so that the event loop is not blocked meanwhile"""
+    return await asyncio.get_running_loop().run_in_executor(None, create_embedding, user_text)
+
+
+def warm_up():
+    """Loads the embedding model and opens the shared redis connection pool, ahead of the first search"""
+    with timer("warm_up"):
+        try:
+            if not config.EMBEDDING_SERVICE_URL:
+                load_embedding_model()
+            run_on_shared_loop(get_shared_redis_connexion().ping())
+        except Exception as e:
+            print(f"Warm-up failed: {type(e).__name__}: {e}")
+
+
+def start_warm_up():
+    """Starts the warm-up in a background thread, once per process (safe to call on every streamlit rerun)"""
+    global _warm_up_started
+    with _shared_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
 async def create_index(
         redis_conn: Redis,
         prefix: str,
-        vector_field: VectorField
+        vector_field: VectorField,
+        index_name: str = config.INDEX_NAME
 ):
     fields = make_tag_fields() + [vector_field]
-    await redis_conn.ft(config.INDEX_NAME).create_index(
+    await redis_conn.ft(index_name).create_index(
         fields=fields,
         definition=IndexDefinition(prefix=[prefix], index_type=IndexType.HASH)
     )
@@ -146,107 +588,581 @@ async def create_flat_index(
     redis_conn: Redis,
     number_of_vectors: int,
     prefix: str,
-    distance_metric: str = 'L2'
+    distance_metric: str = 'L2',
+    index_name: str = config.INDEX_NAME,
+    vector_name: str = config.VECTOR_NAME,
+    dim: int = config.VECTOR_DIM
 ):
     vector_field = VectorField(
-        config.VECTOR_NAME,
+        vector_name,
         "FLAT", {
             "TYPE": config.VECTOR_TYPE,
-            "DIM": config.VECTOR_DIM,
+            "DIM": dim,
             "DISTANCE_METRIC": distance_metric,
             "INITIAL_CAP": number_of_vectors,
             "BLOCK_SIZE": number_of_vectors
         }
     )
-    await create_index(redis_conn, prefix, vector_field)
+    await create_index(redis_conn, prefix, vector_field, index_name)
 
 
 async def create_hnsw_index(
     redis_conn: Redis,
     number_of_vectors: int,
     prefix: str,
-    distance_metric: str = 'COSINE'
+    distance_metric: str = 'COSINE',
+    index_name: str = config.INDEX_NAME,
+    vector_name: str = config.VECTOR_NAME,
+    dim: int = config.VECTOR_DIM,
+    **hnsw_params
 ):
+    """HNSW index; hnsw_params are extra attributes of the vector field (e.g. M=32, EF_CONSTRUCTION=400)"""
     vector_field = VectorField(
-        config.VECTOR_NAME,
+        vector_name,
         "HNSW", {
             "TYPE": config.VECTOR_TYPE,
-            "DIM": config.VECTOR_DIM,
+            "DIM": dim,
             "DISTANCE_METRIC": distance_metric,
             "INITIAL_CAP": number_of_vectors,
+            **hnsw_params
         }
     )
-    await create_index(redis_conn, prefix, vector_field)
+    await create_index(redis_conn, prefix, vector_field, index_name)
+
+
+def decode_info_value(value):
+    return try_decode_bytes(value) if isinstance(value, bytes) else value
+
+
+async def get_aliased_index(redis_conn: Redis, alias: str = config.INDEX_NAME):
+    """Name of the index behind an alias (the alias itself, for an index created before aliases), or None"""
+    try:
+        info = await redis_conn.ft(alias).info()
+    except ResponseError:
+        return None
+    return decode_info_value(info["index_name"])
+
+
+async def wait_for_indexing(
+        redis_conn: Redis,
+        index_name: str,
+        poll_interval: float = config.INDEX_BUILD_POLL_INTERVAL
+):
+    """Polls FT.INFO until the index has indexed all the existing documents of its prefix"""
+    while True:
+        info = await redis_conn.ft(index_name).info()
+        progress = float(decode_info_value(info.get("percent_indexed", 1)))
+        print(f"{index_name}: {progress:.0%} indexed ({decode_info_value(info['num_docs'])} documents)")
+        if not int(decode_info_value(info["indexing"])):
+            return
+        await asyncio.sleep(poll_interval)
+
+
+async def reindex(
+        redis_conn: Redis,
+        number_of_vectors: int,
+        index_type: str = config.INDEX_TYPE,
+        prefix: str = "paper_vector:",
+        distance_metric: str = "IP",
+        alias: str = config.INDEX_NAME,
+        poll_interval: float = config.INDEX_BUILD_POLL_INTERVAL,
+        vector_name: str = config.VECTOR_NAME,
+        dim: int = config.VECTOR_DIM,
+        **hnsw_params
+):
+    """
+    Blue/green rebuild of the papers index, without interrupting the searches:
+        - a new versioned index ("<alias>_v<n>") is created, and built in the background over the prefix
+        - once all the documents are indexed, the alias is switched to it atomically (FT.ALIASUPDATE)
+        - the previous index is dropped afterwards (its documents are kept)
+
+    An index created before aliases holds the alias name itself: it has to be dropped right before the alias
+    is added, so that first switch leaves a short window without an index.
+    """
+    old_index = await get_aliased_index(redis_conn, alias)
+    new_index = f"{alias}_v{await redis_conn.incr(config.INDEX_BUILDS_KEY)}"
+    print(f"Building {new_index} (current index: {old_index})")
+    if index_type == "HNSW":
+        await create_hnsw_index(
+            redis_conn, number_of_vectors, prefix, distance_metric, new_index, vector_name, dim, **hnsw_params
+        )
+    else:
+        await create_flat_index(redis_conn, number_of_vectors, prefix, distance_metric, new_index, vector_name, dim)
+    await wait_for_indexing(redis_conn, new_index, poll_interval)
 
+    if old_index == alias:
+        await remove_index(redis_conn, old_index)
+    if old_index is None or old_index == alias:
+        await redis_conn.ft(new_index).aliasadd(alias)
+    else:
+        await redis_conn.ft(new_index).aliasupdate(alias)
+        await remove_index(redis_conn, old_index)
+    # The new index parameters may change the results: the cached ones become stale
+    await bump_index_version(redis_conn)
+    print(f"{alias} now points to {new_index}")
+    return new_index
+
+
+def get_search_vector_dim() -> int:
+    """Dimension of the indexed vectors: the projection's one if PROJECTION_PATH is set (see src.projection)"""
+    return load_projection().shape[0] if config.PROJECTION_PATH else config.VECTOR_DIM
+
+
+async def store_projected_vectors(redis_conn: Redis, prefix: str = "paper_vector:", batch_size: int = 1000):
+    """Stores the projection of the vectors of already loaded papers (see src.projection)"""
+    keys = [key async for key in redis_conn.scan_iter(match=f"{prefix}*", count=batch_size)]
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pipe = redis_conn.pipeline(transaction=False)
+        for key in batch:
+            pipe.hget(key, config.VECTOR_NAME)
+        vectors = await pipe.execute()
+        batch = [key for key, vector in zip(batch, vectors) if vector is not None]
+        vectors = np.stack([np.frombuffer(vector, dtype=np.float32) for vector in vectors if vector is not None])
+        pipe = redis_conn.pipeline(transaction=False)
+        for key, projected in zip(batch, project_vectors(vectors)):
+            pipe.hset(key, config.PROJECTED_VECTOR_NAME, projected.tobytes())
+        await pipe.execute()
+
+
+def apply_projection(index_type: str = config.INDEX_TYPE, distance_metric: str = "IP", **hnsw_params):
+    """
+    Stores the projected vectors of the loaded papers, then rebuilds the index on them, at the reduced dimension.
+    The searches keep running on the previous index until the new one is built (see reindex).
+    """
+    if not config.PROJECTION_PATH:
+        raise ValueError("PROJECTION_PATH is not set: fit a projection first (see src.projection)")
+
+    async def store_all():
+        conns = get_shard_connexions() or [get_redis_connexion()]
+        await asyncio.gather(*[store_projected_vectors(conn) for conn in conns])
+
+    asyncio.run(store_all())
+    return rebuild_index(index_type, distance_metric, **hnsw_params)
 
-def upload_vectors_to_redis(path: str = "./arxiv_embeddings_300000_completed.json"):
-    papers_df = pd.read_json(path)
+
+def rebuild_index(index_type: str = config.INDEX_TYPE, distance_metric: str = "IP", **hnsw_params):
+    """
+    Rebuilds the papers index with new parameters (see reindex), e.g. rebuild_index(M=32, EF_CONSTRUCTION=400).
+    With shards, the index of every shard is rebuilt.
+    """
+    async def rebuild(conn):
+        number_of_vectors = len([key async for key in conn.scan_iter(match="paper_vector:*", count=1000)])
+        return await reindex(
+            conn, number_of_vectors, index_type, distance_metric=distance_metric,
+            vector_name=config.SEARCH_VECTOR_NAME, dim=get_search_vector_dim(), **hnsw_params
+        )
+
+    async def rebuild_all():
+        shard_conns = get_shard_connexions()
+        if not shard_conns:
+            return await rebuild(get_redis_connexion())
+        new_indexes = await asyncio.gather(*[rebuild(shard_conn) for shard_conn in shard_conns])
+        await bump_index_version(get_redis_connexion())
+        return new_indexes
+
+    return asyncio.run(rebuild_all())
+
+
+def upload_vectors_to_redis(path: str = "./arxiv_embeddings_300000_completed"):
+    """Uploads papers to redis, from a binary vector store (see src.vector_store)"""
+    if not is_vector_store(path):
+        raise ValueError(
+            f"{path} is not a vector store: convert it first with src.vectors.embeddings_to_vector_store"
+        )
+    papers_df = read_vector_store(path)
     conn = get_redis_connexion()
     for col in papers_df.columns:
         if col != "vector":
             papers_df[col] = papers_df[col].astype(str)
 
-    asyncio.run(
-        load_all_data(conn, papers_df)
-    )
+    shard_conns = get_shard_connexions()
+    if not shard_conns:
+        asyncio.run(
+            load_all_data(conn, papers_df)
+        )
+        return
+
+    # Routing: each paper is loaded on the shard its id hashes to, which indexes it
+    shards = papers_df["id"].map(lambda paper_id: shard_of(paper_id, len(shard_conns)))
+
+    async def load_shards():
+        await asyncio.gather(*[
+            load_all_data(shard_conn, papers_df[shards == i])
+            for i, shard_conn in enumerate(shard_conns)
+        ])
+        await bump_index_version(conn)
+
+    asyncio.run(load_shards())
+
+
+TAG_SPECIAL_CHARACTERS = re.compile(r"([,.<>{}\[\]\"':;!@#$%^&*()\-+=~|/\\ ])")
+
+
+def escape_tag_value(value: str):
+    """Escapes punctuation and spaces in a tag value, so that it is matched exactly (e.g. 'cs.lg' -> 'cs\\.lg')"""
+    return TAG_SPECIAL_CHARACTERS.sub(r"\\\1", str(value))
 
 
 def format_tags(tag_dict: Dict[str, List[str]]):
-    """Formats tags to query tag fields"""
+    """Formats tags to query tag fields, with exact matches on the (escaped) tag values"""
     tags = ""
     for tag_name, tag_list in tag_dict.items():
         if tag_name in ['submitter', 'authors', 'doi', 'categories',
                         'year', 'versions', 'license', 'update_date'
                         ]:
-            tag_list = " | ".join(tag_list)
+            tag_list = " | ".join(escape_tag_value(tag) for tag in tag_list)
             tags += f"@{tag_name}:{{{tag_list}}}"
     return f"({tags})"
 
 
+# Projections of the papers returned by a search, instead of their whole hash:
+# - SLIM_FIELDS: what is needed to list papers
+# - GRAPH_FIELDS: what is needed to build the citations graph and reading list
+# - DETAIL_FIELDS: the heavy fields, fetched separately (see fetch_paper_details)
+SLIM_FIELDS = ["paper_id", "title", "year", "month", "citation_count"]
+GRAPH_FIELDS = SLIM_FIELDS + ["sch_id", "citations"]
+DETAIL_FIELDS = ["abstract", "authors", "categories"]
+
+
 def create_query(
     tag_dict: Dict[str, List[str]] = None,
     search_type: str = "KNN",
     number_of_results: int = 15,
+    offset: int = 0,
+    page_size: int = None,
+    return_fields: List[str] = None,
+    vector_field: str = config.SEARCH_VECTOR_NAME
 ) -> Query:
+    """
+    KNN query over the number_of_results most similar papers. With a page_size, only the papers
+    [offset, offset + page_size) of this (stable) KNN result are returned, and hydrated.
+    With return_fields, these fields are returned by the search itself (see find_similar_papers_given_vector).
+    """
     tags = format_tags(tag_dict) if tag_dict else "*"
-    base_query = f'{tags}=>[{search_type} {number_of_results} @vector $vec_param AS vector_score]'
+    base_query = f'{tags}=>[{search_type} {number_of_results} @{vector_field} $vec_param AS vector_score]'
+    if page_size is None:
+        page_size = number_of_results - offset
     return Query(base_query)\
         .sort_by("vector_score")\
-        .paging(0, number_of_results)\
-        .return_fields("id", "paper_pk", "vector_score")\
+        .paging(offset, max(0, min(page_size, number_of_results - offset)))\
+        .return_fields(*(return_fields or ["id", "paper_pk"]), "vector_score")\
         .dialect(2)
 
 
 async def find_similar_papers_given_user_text(
         redis_conn: Redis,
         user_text: str,
-        query: Query
+        query: Query,
+        return_fields: List[str] = None,
+        rerank_candidates: int = None,
+        k: int = None,
+        as_result_set: bool = False
 ):
     """
     Queries the DB using a similarity search, retrieves and processes the results.
+
+    With rerank_candidates, the search runs in two stages (see find_similar_papers_on_shards): the query, created
+    with number_of_results=rerank_candidates, gives the candidates, which are reranked exactly on their full vectors.
+    The top k of them are kept (all of them by default).
+    With as_result_set, the results are returned as a typed columnar ResultSet (see src.results) instead of a list
+    of dicts.
+    """
+    vector = await create_embedding_async(user_text)
+    if rerank_candidates:
+        results = await find_similar_papers_on_shards(
+            [redis_conn], vector, query, k or rerank_candidates, return_fields, rerank_candidates=rerank_candidates
+        )
+    else:
+        results = await find_similar_papers_given_vector(
+            redis_conn=redis_conn,
+            vector=vector,
+            query=query,
+            return_fields=return_fields
+        )
+    return ResultSet.from_dicts(results) if as_result_set else results
+
+
+async def find_similar_papers_given_paper_id(
+        redis_conn: Redis,
+        paper_id: str,
+        query: Query,
+        k: int,
+        return_fields: List[str] = None,
+        shard_conns: List[Redis] = None
+):
+    """
+    "More like this" search: runs the query around the stored vector of a paper, without going through the
+    embedding model, and leaves the paper itself out of the k results.
+    The query must ask for k + 1 papers (the paper itself being the first one), and return their paper_id.
+    With shard_conns, the vector is read from the paper's shard, and the search runs on all of them.
+    """
+    owner = shard_conns[shard_of(paper_id, len(shard_conns))] if shard_conns else redis_conn
+    vector = await owner.hget(f"paper_vector:{paper_id}", config.VECTOR_NAME)
+    if vector is None:
+        raise KeyError(f"Unknown paper {paper_id}")
+    vector = np.frombuffer(vector, dtype=np.float32)
+    if shard_conns:
+        results = await find_similar_papers_on_shards(shard_conns, vector, query, k + 1, return_fields)
+    else:
+        results = await find_similar_papers_given_vector(redis_conn, vector, query, return_fields)
+    return [paper for paper in results if str(paper.get("paper_id")) != str(paper_id)][:k]
+
+
+async def find_precomputed_similar_papers(
+        redis_conn: Redis,
+        paper_id: str,
+        filters_dict: Dict[str, List[str]],
+        k: int,
+        return_fields: List[str] = None,
+        shard_conns: List[Redis] = None
+):
+    """
+    "More like this" from the precomputed neighbours graph (see src.neighbours): one read for the neighbours, one
+    pipeline for their fields. The neighbours are not filtered beforehand, so the filters are applied here; returns
+    None if the paper has no precomputed neighbours, or if less than k of them pass the filters.
     """
-    # Execute query
+    related = await get_related_papers(redis_conn, paper_id)
+    if len(related) < k:
+        return None
+    return_fields = return_fields or SLIM_FIELDS + DETAIL_FIELDS
+    fields = list(dict.fromkeys(return_fields + ["year", "categories"]))
+    related_ids = [related_id for related_id, _ in related]
+    if shard_conns:
+        details = await fetch_paper_details_on_shards(shard_conns, related_ids, fields)
+    else:
+        details = await fetch_paper_details(redis_conn, related_ids, fields)
+    categories = set(filters_dict.get("categories", []))
+    results = []
+    for related_id, score in related:
+        paper = details[related_id]
+        paper_categories = set((paper["categories"] or "").split(config.CATEGORIES_SEPARATOR))
+        if paper["year"] in filters_dict["year"] and (not categories or categories & paper_categories):
+            results.append({**{field: paper[field] for field in return_fields}, "similarity_score": score})
+    return results[:k] if len(results) >= k else None
+
+
+async def search_documents(redis_conn: Redis, vector: np.ndarray, query: Query):
+    """
+    Runs a similarity search query around a vector, returns the matching documents.
+    With a reduced dimension index (PROJECTION_PATH set), the vector is projected first.
+    """
+    if config.PROJECTION_PATH:
+        vector = project_vectors(vector)
     # noinspection PyUnresolvedReferences
     results = await redis_conn.ft(config.INDEX_NAME).search(
         query,
         query_params={
-            "vec_param": create_embedding(user_text).tobytes()
+            "vec_param": np.asarray(vector, dtype=np.float32).tobytes()
         }
     )
+    return results.docs
 
-    results = results.docs
-    clean_score = [1 - float(doc.vector_score) for doc in results]
-    processed_results = [await redis_conn.hgetall(doc.id) for doc in results]
-    processed_results = [
-        {try_decode_bytes(key): try_decode_bytes(value) for key, value in obj.items()}
-        for obj in processed_results
+
+async def hydrate_documents(redis_conn: Redis, docs) -> List[Dict]:
+    """Fetches the whole hashes of the documents returned by a search, in one pipeline"""
+    pipe = redis_conn.pipeline(transaction=False)
+    for doc in docs:
+        pipe.hgetall(doc.id)
+    return [
+        {
+            key: try_decode_bytes(value)
+            for key, value in decode_paper({try_decode_bytes(key): value for key, value in obj.items()}).items()
+        }
+        for obj in await pipe.execute()
     ]
+
+
+def project_documents(docs, return_fields: List[str]) -> List[Dict]:
+    return [{field: getattr(doc, field, None) for field in return_fields} for doc in docs]
+
+
+async def find_similar_papers_given_vector(
+        redis_conn: Redis,
+        vector: np.ndarray,
+        query: Query,
+        return_fields: List[str] = None
+):
+    """
+    Queries the DB using a similarity search around an already computed vector, retrieves and processes the results.
+
+    With return_fields (the fields the query was created with), the papers are projected on these fields
+    directly from the search results. Otherwise, their whole hashes are fetched, in one pipeline.
+    """
+    with timer("ft_search"):
+        results = await search_documents(redis_conn, vector, query)
+
+    clean_score = [1 - float(doc.vector_score) for doc in results]
+    if return_fields:
+        processed_results = project_documents(results, return_fields)
+    else:
+        with timer("hydration"):
+            processed_results = await hydrate_documents(redis_conn, results)
     for p, score in zip(processed_results, clean_score):
         p.update({"similarity_score": score})
 
     return processed_results
 
 
+def merge_shard_results(shard_results: List[List]) -> List[Tuple[float, int, object]]:
+    """
+    (distance, shard, document) of the documents returned by the shards, by ascending distance: each shard returns
+    its documents by ascending distance, so a k-way heap merge keeps the global order.
+    """
+    return list(heapq.merge(
+        *[[(float(doc.vector_score), shard, doc) for doc in docs] for shard, docs in enumerate(shard_results)],
+        key=lambda item: item[0]
+    ))
+
+
+async def find_similar_papers_on_shards(
+        shard_conns: List[Redis],
+        vector: np.ndarray,
+        query: Query,
+        k: int,
+        return_fields: List[str] = None,
+        offset: int = 0,
+        page_size: int = None,
+        rerank_candidates: int = None,
+        mmr_lambda: float = None
+):
+    """
+    Scatter-gather similarity search over the shards: the query runs concurrently on every shard, the top k of
+    each shard are merged by score, and only the papers kept are hydrated, from the shard holding them.
+    A single DB is searched the same way, as one shard.
+
+    The query must return the first offset + page_size papers of each shard (create_query with offset=0):
+    the page [offset, offset + page_size) is taken from the merged results.
+
+    With rerank_candidates, the query must return rerank_candidates papers per shard instead: the top
+    rerank_candidates of the merged results are reranked on their full precision vectors, before the page is taken.
+    With mmr_lambda, the results are diversified: the top k are selected among the candidates by Maximal
+    Marginal Relevance (see maximal_marginal_relevance), on the same full precision vectors.
+    """
+    with timer("ft_search"):
+        shard_results = await asyncio.gather(*[
+            search_documents(shard_conn, vector, query) for shard_conn in shard_conns
+        ])
+    end = k if page_size is None else min(k, offset + page_size)
+    merged = merge_shard_results(shard_results)
+    if (rerank_candidates or mmr_lambda is not None) and merged:
+        candidates = merged[:rerank_candidates] if rerank_candidates else merged
+        with timer("rerank"):
+            candidate_vectors = await fetch_candidate_vectors(shard_conns, candidates)
+            scores = candidate_vectors @ np.asarray(vector, dtype=np.float32)
+            if mmr_lambda is not None:
+                order = maximal_marginal_relevance(vector, candidate_vectors, end, mmr_lambda)
+            else:
+                order = np.argsort(-scores, kind="stable")
+        # The distances become 1 - the exact scores
+        merged = [(1 - float(scores[i]), candidates[i][1], candidates[i][2]) for i in order]
+    merged = merged[offset:end]
+
+    if return_fields:
+        processed_results = project_documents([doc for _, _, doc in merged], return_fields)
+    else:
+        with timer("hydration"):
+            shard_docs = [[doc for _, shard, doc in merged if shard == i] for i in range(len(shard_conns))]
+            hydrated = await asyncio.gather(*[
+                hydrate_documents(shard_conn, docs) for shard_conn, docs in zip(shard_conns, shard_docs)
+            ])
+            hydrated = [iter(papers) for papers in hydrated]
+            processed_results = [next(hydrated[shard]) for _, shard, _ in merged]
+    for p, (distance, _, _) in zip(processed_results, merged):
+        p.update({"similarity_score": 1 - distance})
+
+    return processed_results
+
+
+async def fetch_candidate_vectors(shard_conns: List[Redis], candidates: List[Tuple]) -> np.ndarray:
+    """
+    Full precision vectors of (distance, shard, document) search candidates, fetched in one pipeline per shard.
+
+    The vectors cannot be returned by FT.SEARCH itself: redis-py decodes the returned fields as text.
+    """
+    pipes = [shard_conn.pipeline(transaction=False) for shard_conn in shard_conns]
+    for _, shard, doc in candidates:
+        pipes[shard].hget(doc.id, config.VECTOR_NAME)
+    fetched = [iter(vectors) for vectors in await asyncio.gather(*[pipe.execute() for pipe in pipes])]
+    return np.stack([np.frombuffer(next(fetched[shard]), dtype=np.float32) for _, shard, _ in candidates])
+
+
+def maximal_marginal_relevance(
+        query_vector: np.ndarray,
+        vectors: np.ndarray,
+        k: int,
+        mmr_lambda: float = config.MMR_LAMBDA
+) -> np.ndarray:
+    """
+    Indexes of k diverse vectors, in selection order, by Maximal Marginal Relevance: each step selects the vector
+    maximizing mmr_lambda * similarity to the query - (1 - mmr_lambda) * max similarity to the selected ones.
+    The similarities between candidates are computed at once, each step only updates the max similarities.
+    """
+    vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    relevance = vectors @ (query_vector / max(np.linalg.norm(query_vector), 1e-12))
+    similarities = vectors @ vectors.T
+    max_similarity = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    selected = []
+    for _ in range(min(k, len(vectors))):
+        redundancy = np.where(np.isinf(max_similarity), 0, max_similarity)
+        scores = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarities[:, best])
+    return np.array(selected, dtype=np.int64)
+
+
+async def fetch_paper_details(
+        redis_conn: Redis,
+        paper_ids: List[str],
+        fields: List[str] = DETAIL_FIELDS
+) -> Dict[str, Dict]:
+    """Fetches some fields (by default the heavy ones, left out of the search results) of papers, in one pipeline"""
+    # The abstract may be stored compressed (see src.compact)
+    stored_fields = fields + [COMPRESSED_ABSTRACT_FIELD] if "abstract" in fields else fields
+    pipe = redis_conn.pipeline(transaction=False)
+    for paper_id in paper_ids:
+        pipe.hmget(f"paper_vector:{paper_id}", stored_fields)
+    with timer("details_fetch"):
+        values = await pipe.execute()
+    details = {}
+    for paper_id, row in zip(paper_ids, values):
+        paper = decode_paper(dict(zip(stored_fields, row)))
+        details[paper_id] = {
+            field: try_decode_bytes(paper[field]) if paper[field] is not None else None for field in fields
+        }
+    return details
+
+
+async def fetch_paper_details_on_shards(
+        shard_conns: List[Redis],
+        paper_ids: List[str],
+        fields: List[str] = DETAIL_FIELDS
+) -> Dict[str, Dict]:
+    """Same as fetch_paper_details, each paper being fetched from the shard holding it"""
+    shard_ids = [[] for _ in shard_conns]
+    for paper_id in paper_ids:
+        shard_ids[shard_of(paper_id, len(shard_conns))].append(paper_id)
+    details = {}
+    for shard_details in await asyncio.gather(*[
+        fetch_paper_details(shard_conn, ids, fields) for shard_conn, ids in zip(shard_conns, shard_ids) if ids
+    ]):
+        details.update(shard_details)
+    return details
+
+
+def get_paper_details(paper_ids: List[str], fields: List[str] = DETAIL_FIELDS) -> Dict[str, Dict]:
+    """Batched fetch of papers details (see fetch_paper_details), on the shared redis connection pools"""
+    if not paper_ids:
+        return {}
+    shard_conns = get_shared_shard_connexions()
+    if shard_conns:
+        return run_on_shared_loop(fetch_paper_details_on_shards(shard_conns, paper_ids, fields))
+    return run_on_shared_loop(fetch_paper_details(get_shared_redis_connexion(), paper_ids, fields))
+
+
 def try_decode_bytes(data: bytes):
     """Converts bytes result from the query result into strings"""
     try:
@@ -256,32 +1172,521 @@ def try_decode_bytes(data: bytes):
     return decoded
 
 
-def execute_user_query(
+async def get_index_version(redis_conn: Redis) -> int:
+    """Version of the papers index, bumped by every ingestion (it is part of the search results cache keys)"""
+    version = await redis_conn.get(config.INDEX_VERSION_KEY)
+    return int(version) if version is not None else 0
+
+
+async def bump_index_version(redis_conn: Redis) -> int:
+    """Bumps the index version: all the cached search results become stale at once"""
+    return await redis_conn.incr(config.INDEX_VERSION_KEY)
+
+
+def normalize_query_text(user_text: str):
+    """Case and spacing insensitive version of the user's query, used in the cache keys"""
+    return " ".join(user_text.lower().split())
+
+
+def make_result_cache_key(
+        index_version: int,
         user_text: str,
+        filters_dict: Dict[str, List[str]],
         k: int,
-        year_min: int,
-        year_max: int,
-        categories: List[str] = None
+        prefix: str = config.RESULT_CACHE_PREFIX,
+        **extra
 ):
-    """Complete process: connects to the redis db, creates & runs the query."""
+    """Cache key of a search: (index version, normalized query, filters, k, any extra search parameter)"""
+    payload = json.dumps(
+        [normalize_query_text(user_text), make_filters_signature(filters_dict), k, extra],
+        sort_keys=True
+    )
+    return f"{prefix}{index_version}:{hashlib.sha1(payload.encode()).hexdigest()}"
 
-    r_conn = get_redis_connexion()
+
+def strip_results(results: List[Dict]) -> List[Dict]:
+    """Papers of a result set, as cached: the raw vectors are not needed by the app and are left out"""
+    return [{key: value for key, value in paper.items() if key != "vector"} for paper in results]
+
+
+def serialize_results(results: List[Dict]) -> bytes:
+    """Compact serialization of a result set (see strip_results)"""
+    return zlib.compress(pickle.dumps(strip_results(results), protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def deserialize_results(data: bytes) -> List[Dict]:
+    return pickle.loads(zlib.decompress(data))
+
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def get_or_compute(
+        redis_conn: Redis,
+        cache_key: str,
+        compute: Callable[[], Awaitable],
+        serialize: Callable[[Any], bytes],
+        deserialize: Callable[[bytes], Any],
+        ttl: int,
+        lock_ttl: int = config.RESULT_CACHE_LOCK_TTL
+):
+    """
+    Returns a cached value, or computes and caches it.
+
+    Concurrent misses on the same key are single-flighted, across processes: the first caller takes a lock
+    (SET NX with expiry) and computes the value, the others wait for it to land in the cache.
+    If the lock holder dies, the lock expires and one of the waiting callers takes over.
+    """
+    cached = await redis_conn.get(cache_key)
+    if cached is not None:
+        return deserialize(cached)
+
+    lock_key = cache_key + ":lock"
+    token = uuid.uuid4().hex
+    while True:
+        if await redis_conn.set(lock_key, token, nx=True, px=lock_ttl * 1000):
+            try:
+                value = await compute()
+                await redis_conn.set(cache_key, serialize(value), ex=ttl)
+                return value
+            finally:
+                await redis_conn.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+        deadline = time.monotonic() + lock_ttl
+        while time.monotonic() < deadline:
+            await asyncio.sleep(config.RESULT_CACHE_POLL_INTERVAL)
+            cached = await redis_conn.get(cache_key)
+            if cached is not None:
+                return deserialize(cached)
+            if not await redis_conn.exists(lock_key):
+                break
+
+
+async def get_or_compute_results(
+        redis_conn: Redis,
+        cache_key: str,
+        search: Callable[[], Awaitable[List[Dict]]],
+        ttl: int = config.RESULT_CACHE_TTL,
+        lock_ttl: int = config.RESULT_CACHE_LOCK_TTL
+):
+    """
+    Returns the cached results of a search, or runs it and caches its results (single-flighted, see get_or_compute).
+    Whoever computed them, the results are returned as cached (see strip_results).
+    """
+    async def compute():
+        return strip_results(await search())
+
+    return await get_or_compute(redis_conn, cache_key, compute, serialize_results, deserialize_results, ttl, lock_ttl)
+
+
+async def get_query_embedding(redis_conn: Redis, user_text: str) -> np.ndarray:
+    """
+    Embedding of a user query, cached by normalized query text (and embedding model) so that it is computed once
+    for concurrent or repeated queries, whatever their filters or page
+    """
+    payload = json.dumps([normalize_query_text(user_text), config.EMBEDDING_MODEL, config.EMBEDDING_BACKEND])
+    cache_key = config.EMBEDDING_CACHE_PREFIX + hashlib.sha1(payload.encode()).hexdigest()
+    async def compute():
+        return np.asarray(await create_embedding_async(user_text), dtype=np.float32)
+
+    return await get_or_compute(
+        redis_conn,
+        cache_key,
+        compute,
+        lambda vector: vector.tobytes(),
+        lambda cached: np.frombuffer(cached, dtype=np.float32),
+        config.EMBEDDING_CACHE_TTL
+    )
+
+
+# Connections (host, port, db) on which the semantic cache index is known to exist
+_semantic_cache_indexes = set()
+
+
+def connexion_id(redis_conn: Redis) -> Tuple:
+    kwargs = redis_conn.connection_pool.connection_kwargs
+    return kwargs.get("host"), kwargs.get("port"), kwargs.get("db", 0)
+
+
+async def create_semantic_cache_index(redis_conn: Redis):
+    """
+    Creates the small vector index of recent queries, used by the semantic cache, if it does not exist yet.
+    Its existence is only checked once per DB and process, not on every query.
+    """
+    if connexion_id(redis_conn) in _semantic_cache_indexes:
+        return
+    try:
+        await redis_conn.ft(config.SEMANTIC_CACHE_INDEX_NAME).info()
+    except ResponseError:
+        await redis_conn.ft(config.SEMANTIC_CACHE_INDEX_NAME).create_index(
+            fields=[
+                TagField("filters"),
+                TagField("index_version"),
+                NumericField("k"),
+                VectorField(
+                    config.VECTOR_NAME,
+                    "FLAT", {
+                        "TYPE": config.VECTOR_TYPE,
+                        "DIM": config.VECTOR_DIM,
+                        "DISTANCE_METRIC": "COSINE"
+                    }
+                )
+            ],
+            definition=IndexDefinition(prefix=[config.SEMANTIC_CACHE_PREFIX], index_type=IndexType.HASH)
+        )
+    _semantic_cache_indexes.add(connexion_id(redis_conn))
+
+
+def make_filters_signature(filters_dict: Dict[str, List[str]]):
+    """Filters are only compatible when equal: they are compared through a hash of their normalized form"""
+    payload = json.dumps(
+        {tag_name: sorted(str(tag) for tag in tag_list) for tag_name, tag_list in filters_dict.items()},
+        sort_keys=True
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+async def find_semantic_cache_entry(
+        redis_conn: Redis,
+        vector: np.ndarray,
+        filters_dict: Dict[str, List[str]],
+        k: int,
+        index_version: int,
+        threshold: float = config.SEMANTIC_CACHE_THRESHOLD,
+        exact_k: bool = False
+):
+    """
+    Looks for a recent query close to the given vector (cosine similarity >= threshold), run with the same
+    filters and at least k results, on the same index version. Returns the cache key of its results, or None.
+    With exact_k, the query must have been run with exactly k results: the first k results of a reranked or
+    diversified search are not the results of the same search with a lower k.
+    """
+    k_range = f"[{k} {k}]" if exact_k else f"[{k} +inf]"
+    query = Query(
+        f"(@filters:{{{make_filters_signature(filters_dict)}}} @index_version:{{{index_version}}} @k:{k_range})"
+        f"=>[KNN 1 @{config.VECTOR_NAME} $vec_param AS vector_score]"
+    ).sort_by("vector_score").return_fields("results_key", "vector_score").dialect(2)
+    results = await redis_conn.ft(config.SEMANTIC_CACHE_INDEX_NAME).search(
+        query,
+        query_params={"vec_param": np.asarray(vector, dtype=np.float32).tobytes()}
+    )
+    if not results.docs or 1 - float(results.docs[0].vector_score) < threshold:
+        return None
+    return try_decode_bytes(results.docs[0].results_key)
+
+
+async def add_semantic_cache_entry(
+        redis_conn: Redis,
+        vector: np.ndarray,
+        filters_dict: Dict[str, List[str]],
+        k: int,
+        index_version: int,
+        results_key: str
+):
+    """Registers a query's embedding in the semantic cache, pointing at its cached results"""
+    key = config.SEMANTIC_CACHE_PREFIX + results_key
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.hset(
+        key,
+        mapping={
+            "filters": make_filters_signature(filters_dict),
+            "index_version": index_version,
+            "k": k,
+            "results_key": results_key,
+            config.VECTOR_NAME: np.asarray(vector, dtype=np.float32).tobytes()
+        }
+    )
+    pipe.expire(key, config.SEMANTIC_CACHE_TTL)
+    await pipe.execute()
+
+
+async def rescore_results(
+        redis_conn: Redis,
+        results: List[Dict],
+        vector: np.ndarray,
+        shard_conns: List[Redis] = None
+) -> List[Dict]:
+    """
+    Similarity scores of reused results (a semantic cache hit) against the current query vector, instead of the
+    scores of the query they were computed for. The papers keep their order; their vectors are fetched in one
+    pipeline per shard.
+    """
+    conns = shard_conns or [redis_conn]
+    pipes = [conn.pipeline(transaction=False) for conn in conns]
+    owners = [shard_of(paper["paper_id"], len(conns)) for paper in results]
+    for paper, owner in zip(results, owners):
+        pipes[owner].hget(f"paper_vector:{paper['paper_id']}", config.VECTOR_NAME)
+    fetched = [iter(vectors) for vectors in await asyncio.gather(*[pipe.execute() for pipe in pipes])]
+    vector = np.asarray(vector, dtype=np.float32)
+    rescored = []
+    for paper, owner in zip(results, owners):
+        paper_vector = next(fetched[owner])
+        score = float(np.frombuffer(paper_vector, dtype=np.float32) @ vector) if paper_vector else None
+        rescored.append(dict(paper, similarity_score=score) if score is not None else paper)
+    return rescored
+
+
+def results_overlap(results: List[Dict], other_results: List[Dict]):
+    """Share of the papers of other_results that are also in results"""
+    if not other_results:
+        return 1.0
+    paper_ids = {paper["paper_id"] for paper in results}
+    return sum(paper["paper_id"] in paper_ids for paper in other_results) / len(other_results)
+
+
+async def get_semantic_cache_metrics(redis_conn: Redis):
+    """
+    Semantic cache counters, shared by all the app workers, along with:
+        - hit_rate: share of the lookups answered with a near-duplicate query's results
+        - false_reuse_rate: share of the audited hits whose results differ too much from a fresh search
+    """
+    counters = await redis_conn.hgetall(config.SEMANTIC_CACHE_METRICS_KEY)
+    counters = {try_decode_bytes(key): int(value) for key, value in counters.items()}
+    lookups, hits, audits = counters.get("lookups", 0), counters.get("hits", 0), counters.get("audits", 0)
+    counters["hit_rate"] = hits / lookups if lookups else 0.0
+    counters["false_reuse_rate"] = counters.get("false_reuses", 0) / audits if audits else 0.0
+    return counters
+
+
+async def run_user_query(
+        redis_conn: Redis,
+        user_text: str,
+        query: Query,
+        filters_dict: Dict[str, List[str]],
+        k: int,
+        use_cache: bool = True,
+        offset: int = 0,
+        page_size: int = None,
+        return_fields: List[str] = None,
+        shard_conns: List[Redis] = None,
+        rerank_candidates: int = None,
+        mmr_lambda: float = None
+):
+    """
+    Runs a similarity search, through the search results caches if use_cache is set:
+        - the exact cache, keyed on the normalized query (and page, for paged queries)
+        - the semantic cache, reusing the results of a near-duplicate query (see find_semantic_cache_entry), rescored
+          against the query vector (see rescore_results).
+          Only whole result sets go through it, not pages.
+    With shard_conns, the search runs on the shards (see find_similar_papers_on_shards); the caches stay on redis_conn.
+    With rerank_candidates, the query gives the candidates of a two stages search, reranked exactly
+    (and diversified, with mmr_lambda).
+    """
+    async def search_vector(vector):
+        if shard_conns or rerank_candidates or mmr_lambda is not None:
+            return await find_similar_papers_on_shards(
+                shard_conns or [redis_conn], vector, query, k, return_fields, offset, page_size,
+                rerank_candidates, mmr_lambda
+            )
+        return await find_similar_papers_given_vector(
+            redis_conn=redis_conn,
+            vector=vector,
+            query=query,
+            return_fields=return_fields
+        )
+
+    if not use_cache:
+        return await search_vector(await create_embedding_async(user_text))
+
+    index_version = await get_index_version(redis_conn)
+    page = {"offset": offset, "page_size": page_size} if page_size is not None else {}
+    projection = {"fields": return_fields} if return_fields else {}
+    if rerank_candidates:
+        projection["rerank_candidates"] = [str(rerank_candidates)]
+    if mmr_lambda is not None:
+        projection["mmr_lambda"] = [str(mmr_lambda)]
+    cache_key = make_result_cache_key(index_version, user_text, filters_dict, k, **page, **projection)
+    # Cached results are only reused for the same projection and search mode
+    filters_dict = dict(filters_dict, **projection)
+    cached = await redis_conn.get(cache_key)
+    if cached is not None:
+        increment("result_cache_hits")
+        return deserialize_results(cached)
+    increment("result_cache_misses")
+
+    # The embedding is computed within the single-flighted search, or through its own cache when the semantic
+    # lookup needs it beforehand, so that concurrent misses of a query do not all run the model
+    async def search():
+        return await search_vector(await get_query_embedding(redis_conn, user_text))
+
+    if not config.SEMANTIC_CACHE_ENABLED or page_size is not None:
+        return await get_or_compute_results(redis_conn, cache_key, search)
+
+    vector = await get_query_embedding(redis_conn, user_text)
+    await create_semantic_cache_index(redis_conn)
+    await redis_conn.hincrby(config.SEMANTIC_CACHE_METRICS_KEY, "lookups", 1)
+    with timer("semantic_cache_lookup"):
+        results_key = await find_semantic_cache_entry(
+            redis_conn, vector, filters_dict, k, index_version,
+            exact_k=bool(rerank_candidates) or mmr_lambda is not None
+        )
+        cached = await redis_conn.get(results_key) if results_key else None
+    if cached is not None:
+        increment("semantic_cache_hits")
+        await redis_conn.hincrby(config.SEMANTIC_CACHE_METRICS_KEY, "hits", 1)
+        with timer("semantic_cache_rescore"):
+            results = await rescore_results(redis_conn, deserialize_results(cached)[:k], vector, shard_conns)
+        if random.random() >= config.SEMANTIC_CACHE_AUDIT_RATE:
+            return results
+        # Audit: compare the reused results to a fresh search
+        fresh_results = await get_or_compute_results(redis_conn, cache_key, search)
+        await redis_conn.hincrby(config.SEMANTIC_CACHE_METRICS_KEY, "audits", 1)
+        if results_overlap(results, fresh_results) < config.SEMANTIC_CACHE_AUDIT_MIN_OVERLAP:
+            increment("semantic_cache_false_reuses")
+            await redis_conn.hincrby(config.SEMANTIC_CACHE_METRICS_KEY, "false_reuses", 1)
+        return fresh_results
+
+    results = await get_or_compute_results(redis_conn, cache_key, search)
+    await add_semantic_cache_entry(redis_conn, vector, filters_dict, k, index_version, cache_key)
+    return results
+
+
+def make_filters_dict(year_min: int, year_max: int, categories: List[str] = None):
+    """Tag filters of a user query: publication years and (optionally) categories"""
     filters_dict = {
         'year': [str(year) for year in range(year_min, year_max + 1, 1)]
     }
     if categories and len(categories) > 0:
         filters_dict['categories'] = categories
+    return filters_dict
+
+
+def execute_user_query(
+        user_text: str,
+        k: int,
+        year_min: int,
+        year_max: int,
+        categories: List[str] = None,
+        use_cache: bool = True,
+        offset: int = 0,
+        page_size: int = None,
+        return_fields: List[str] = None,
+        rerank_candidates: int = config.RERANK_CANDIDATES,
+        mmr_lambda: float = None,
+        as_result_set: bool = False
+):
+    """
+    Complete process: creates & runs the query, on the shared redis connection pool of the process.
+    With a page_size, only the page [offset, offset + page_size) of the k most similar papers is retrieved.
+    With return_fields (e.g. SLIM_FIELDS), the papers are only retrieved with these fields.
+    With rerank_candidates, max(k, rerank_candidates) candidates are retrieved, then reranked exactly.
+    With mmr_lambda, the k papers are diversified among max(k, config.MMR_CANDIDATES) candidates (see
+    maximal_marginal_relevance), instead of being the k most similar ones.
+    With as_result_set, the results are returned as a typed columnar ResultSet (see src.results).
+    """
+
+    r_conn = get_shared_redis_connexion()
+    shard_conns = get_shared_shard_connexions()
+    filters_dict = make_filters_dict(year_min, year_max, categories)
 
+    if mmr_lambda is not None:
+        rerank_candidates = rerank_candidates or config.MMR_CANDIDATES
+    if rerank_candidates:
+        # Two stages search: the candidates are reranked (or diversified), then the page is taken
+        rerank_candidates = max(k, rerank_candidates)
+        q = create_query(
+            tag_dict=filters_dict,
+            number_of_results=rerank_candidates,
+            return_fields=return_fields
+        )
+    elif shard_conns:
+        # Every shard returns its first offset + page_size papers, the page is taken after the merge
+        q = create_query(
+            tag_dict=filters_dict,
+            number_of_results=k,
+            page_size=None if page_size is None else offset + page_size,
+            return_fields=return_fields
+        )
+    else:
+        q = create_query(
+            tag_dict=filters_dict,
+            number_of_results=k,
+            offset=offset,
+            page_size=page_size,
+            return_fields=return_fields
+        )
+    with timer("search"):
+        result = run_on_shared_loop(run_user_query(
+            redis_conn=r_conn,
+            user_text=user_text,
+            query=q,
+            filters_dict=filters_dict,
+            k=k,
+            use_cache=use_cache,
+            offset=offset,
+            page_size=page_size,
+            return_fields=return_fields,
+            shard_conns=shard_conns,
+            rerank_candidates=rerank_candidates,
+            mmr_lambda=mmr_lambda
+        ))
+    return ResultSet.from_dicts(result) if as_result_set else result
+
+
+def execute_paper_id_query(
+        paper_id: str,
+        k: int,
+        year_min: int,
+        year_max: int,
+        categories: List[str] = None,
+        return_fields: List[str] = SLIM_FIELDS
+):
+    """
+    "More like this" search from a paper, with the same filters as a user query, on the shared redis connection
+    pool of the process: read from the precomputed neighbours graph when it has enough neighbours passing the
+    filters (see find_precomputed_similar_papers), else searched around the paper's vector
+    (see find_similar_papers_given_paper_id).
+    """
+    shard_conns = get_shared_shard_connexions()
+    filters_dict = make_filters_dict(year_min, year_max, categories)
+    with timer("more_like_this_precomputed"):
+        results = run_on_shared_loop(find_precomputed_similar_papers(
+            redis_conn=get_shared_redis_connexion(),
+            paper_id=paper_id,
+            filters_dict=filters_dict,
+            k=k,
+            return_fields=return_fields,
+            shard_conns=shard_conns
+        ))
+    if results is not None:
+        return results
     q = create_query(
         tag_dict=filters_dict,
-        number_of_results=k
+        number_of_results=k + 1,
+        return_fields=return_fields
     )
-    result = asyncio.run(find_similar_papers_given_user_text(
-        redis_conn=r_conn,
-        user_text=user_text,
-        query=q
-    ))
-    return result
+    with timer("more_like_this"):
+        return run_on_shared_loop(find_similar_papers_given_paper_id(
+            redis_conn=get_shared_redis_connexion(),
+            paper_id=paper_id,
+            query=q,
+            k=k,
+            return_fields=return_fields,
+            shard_conns=shard_conns
+        ))
+
+
+def execute_broad_topic_query(
+        user_text: str,
+        k: int,
+        year_min: int,
+        year_max: int,
+        categories: List[str] = None
+):
+    """Summary of a broad user query from the precomputed topics (see find_broad_topic), None if it is not broad"""
+    with timer("broad_topic"):
+        return run_on_shared_loop(find_broad_topic(
+            redis_conn=get_shared_redis_connexion(),
+            user_text=user_text,
+            filters_dict=make_filters_dict(year_min, year_max, categories),
+            k=k,
+            shard_conns=get_shared_shard_connexions()
+        ))
 
 
 def execute_user_query_example():
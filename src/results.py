@@ -0,0 +1,119 @@
+"""
+Columnar result sets: the papers returned by a search as typed NumPy columns, parsed once, instead of a list of
+dicts of decoded strings.
+
+    results = ResultSet.from_dicts(papers)
+    results["year"]          # int16 column
+    results.date_order()     # chronological order of the papers
+    results[0]               # first paper, as a dict of typed values
+    results.to_dicts()       # list of dicts, as returned before (list fields joined back into strings)
+"""
+import numpy as np
+
+from typing import Any, Dict, Iterator, List, Union
+
+# Types of the numeric fields: the other fields are kept as object columns
+FIELD_TYPES = {
+    "year": np.int16,
+    "month": np.int8,
+    "similarity_score": np.float32,
+    "citation_count": np.int32,
+    "influential_citation_count": np.int32,
+    "list_index": np.int32,
+}
+# Fields holding a separated list of values, split once into tuples
+LIST_FIELDS = {"citations": ","}
+
+
+def parse_number(value, dtype):
+    """Numeric value of a field as read from redis (str, bytes or number), 0 if it is missing or not a number"""
+    try:
+        return dtype(float(value))
+    except (TypeError, ValueError):
+        return dtype(0)
+
+
+def parse_column(field: str, values: List) -> np.ndarray:
+    if field in FIELD_TYPES:
+        dtype = FIELD_TYPES[field]
+        return np.array([parse_number(value, dtype) for value in values], dtype=dtype)
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        # Assigned one by one: numpy would unpack the tuples of the list fields
+        if field in LIST_FIELDS:
+            column[i] = tuple(str(value).split(LIST_FIELDS[field])) if value is not None else ()
+        else:
+            column[i] = value
+    return column
+
+
+def to_python(value) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ResultSet:
+    """Papers of a search, as typed columns of the same length (see FIELD_TYPES and LIST_FIELDS)"""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+
+    @classmethod
+    def from_dicts(cls, papers: List[Dict]) -> "ResultSet":
+        """Parses the papers returned by a search (missing fields are None, or 0 for the numeric fields)"""
+        fields = list(dict.fromkeys(field for paper in papers for field in paper))
+        columns = {field: parse_column(field, [paper.get(field) for paper in papers]) for field in fields}
+        # The number of citations of the papers loaded before 'citation_count' is the length of their citations
+        if "citations" in columns:
+            counts = np.array([len(citations) for citations in columns["citations"]], dtype=np.int32)
+            if "citation_count" not in columns:
+                columns["citation_count"] = counts
+            else:
+                missing = np.array([paper.get("citation_count") is None for paper in papers], dtype=bool)
+                columns["citation_count"][missing] = counts[missing]
+        return cls(columns)
+
+    @classmethod
+    def of(cls, results: Union["ResultSet", List[Dict]]) -> "ResultSet":
+        """The results as a ResultSet (parsed if they are a list of dicts)"""
+        return results if isinstance(results, ResultSet) else cls.from_dicts(results)
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.columns)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, key: Union[str, int]):
+        """A column (by field name), or a paper (by position) as a dict of typed values"""
+        if isinstance(key, str):
+            return self.columns[key]
+        return {field: to_python(column[key]) for field, column in self.columns.items()}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def take(self, indexes) -> "ResultSet":
+        """Papers at the given positions (or boolean mask), in this order"""
+        return ResultSet({field: column[indexes] for field, column in self.columns.items()})
+
+    def with_column(self, field: str, values) -> "ResultSet":
+        """Result set sharing these columns, with one more (or replaced) column"""
+        return ResultSet({**self.columns, field: parse_column(field, list(values))})
+
+    def date_order(self) -> np.ndarray:
+        """Positions of the papers by ascending publication date (stable)"""
+        dates = self.columns["year"].astype(np.int32) * 12 + self.columns["month"]
+        return np.argsort(dates, kind="stable")
+
+    def to_dicts(self) -> List[Dict]:
+        """Papers as a list of dicts, the list fields being joined back into strings"""
+        papers = list(self)
+        for paper in papers:
+            for field, separator in LIST_FIELDS.items():
+                if field in paper:
+                    paper[field] = separator.join(paper[field])
+        return papers
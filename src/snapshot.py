@@ -0,0 +1,307 @@
+"""
+Snapshots of the papers: all the 'paper_vector:' hashes in a compact on-disk bundle, to restore a redis DB (disaster
+recovery, new environments) or feed the local search backend, without going through the JSON files.
+
+A snapshot is a directory holding:
+    - <vector field>.npy: (n, dim) float32 vectors of each vector field of the papers ("vector", and
+      "vector_reduced" with PROJECTION_PATH, see src.projection), read memory-mapped
+    - metadata.parquet: the other fields of the papers, in the same order (strings, the compressed abstracts
+      being kept as binary, see src.compact)
+    - snapshot.json: number of papers, vector files, and the definition of the papers index
+
+    python -m src.snapshot export --output ./snapshots/papers
+    python -m src.snapshot restore --input ./snapshots/papers
+
+Both stream the papers by batches (pipelined HGETALL / HSET); with REDIS_SHARDS, the papers of all the shards are
+exported, and restored on the shard their id hashes to. The papers whose vectors are missing or do not have the
+expected dimension (see get_vector_dims) are skipped, and counted in snapshot.json. The restore then rebuilds the papers index with the
+exported definition, and the publication counters. The redis-om ':src.models.Paper:' keys are not part of a
+snapshot: the app only reads the 'paper_vector:' hashes.
+"""
+import os
+import json
+import asyncio
+import argparse
+import datetime
+import numpy as np
+import src.config as config
+
+from typing import Dict, List, Optional, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+from src.compact import COMPRESSED_ABSTRACT_FIELD, decode_paper
+from src.redis_db import (
+    bump_index_version,
+    decode_info_value,
+    get_redis_connexion,
+    get_search_vector_dim,
+    get_shard_connexions,
+    rebuild_publication_counts,
+    reindex,
+    shard_of
+)
+
+PAPER_PREFIX = "paper_vector:"
+METADATA_FILE = "metadata.parquet"
+SNAPSHOT_FILE = "snapshot.json"
+# Fields of the papers, as loaded at ingestion (see src.redis_db.gather_with_concurrency)
+PAPER_FIELDS = [
+    "paper_pk", "paper_id", "submitter", "authors", "doi", "version", "license", "update_date", "title",
+    "abstract", COMPRESSED_ABSTRACT_FIELD, "categories", "month", "year", "sch_id", "citations", "citation_count",
+    "influential_citation_count", "topic_id"
+]
+BINARY_FIELDS = (COMPRESSED_ABSTRACT_FIELD,)
+
+
+def is_snapshot(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, SNAPSHOT_FILE))
+
+
+def read_snapshot_info(path: str) -> Dict:
+    with open(os.path.join(path, SNAPSHOT_FILE)) as f:
+        return json.load(f)
+
+
+def metadata_schema():
+    import pyarrow as pa
+    return pa.schema([(field, pa.binary() if field in BINARY_FIELDS else pa.string()) for field in PAPER_FIELDS])
+
+
+def decode_info(value):
+    """FT.INFO value, with its (nested) bytes decoded"""
+    if isinstance(value, list):
+        return [decode_info(item) for item in value]
+    return decode_info_value(value)
+
+
+async def read_index_definition(redis_conn: Redis, alias: str = config.INDEX_NAME) -> Dict:
+    """
+    Parameters of the papers index, as expected by src.redis_db.reindex: read from FT.INFO when it lists them,
+    the defaults of the app otherwise. The raw attributes are kept for reference.
+    """
+    definition = {
+        "index_type": config.INDEX_TYPE,
+        "distance_metric": "IP",
+        "prefix": PAPER_PREFIX,
+        "vector_name": config.SEARCH_VECTOR_NAME,
+        "hnsw_params": {},
+        "attributes": [],
+    }
+    try:
+        info = await redis_conn.ft(alias).info()
+    except ResponseError:
+        return definition
+    index_definition = decode_info(info.get("index_definition", []))
+    index_definition = dict(zip(index_definition[::2], index_definition[1::2]))
+    if index_definition.get("prefixes"):
+        definition["prefix"] = index_definition["prefixes"][0]
+    definition["attributes"] = decode_info(info.get("attributes", []))
+    for attribute in definition["attributes"]:
+        params = dict(zip(attribute[::2], attribute[1::2]))
+        if str(params.get("type")).upper() != "VECTOR":
+            continue
+        definition["vector_name"] = params.get("identifier", definition["vector_name"])
+        definition["index_type"] = str(params.get("algorithm", definition["index_type"])).upper()
+        definition["distance_metric"] = str(params.get("distance_metric", definition["distance_metric"])).upper()
+        definition["hnsw_params"] = {
+            key.upper(): int(value) for key, value in params.items() if key.upper() in ("M", "EF_CONSTRUCTION")
+        }
+    return definition
+
+
+def decode_text(value: bytes) -> str:
+    return value.decode("utf-8", errors="replace")
+
+
+def get_vector_dims() -> Dict[str, int]:
+    """
+    Vector fields exported, with their dimension: the vectors of the papers, and their projection when
+    PROJECTION_PATH is set (see src.projection)
+    """
+    dims = {config.VECTOR_NAME: config.VECTOR_DIM}
+    if config.PROJECTION_PATH:
+        dims[config.PROJECTED_VECTOR_NAME] = get_search_vector_dim()
+    return dims
+
+
+def read_paper_vectors(paper: Dict, dims: Dict[str, int]) -> Optional[Dict[str, np.ndarray]]:
+    """Vectors of a paper (raw hash fields), or None if one of them is missing or does not have its dimension"""
+    paper_vectors = {}
+    for field, dim in dims.items():
+        value = paper.get(field)
+        if value is None or len(value) != dim * np.dtype(np.float32).itemsize:
+            return None
+        paper_vectors[field] = np.frombuffer(value, dtype=np.float32)
+    return paper_vectors
+
+
+def truncate_vectors(path: str, count: int, batch_size: int = 100000):
+    """Keeps the first count rows of a .npy file, copied by batches into a new file replacing it"""
+    vectors = np.load(path, mmap_mode="r")
+    truncated = np.lib.format.open_memmap(
+        path + ".tmp", mode="w+", dtype=vectors.dtype, shape=(count,) + vectors.shape[1:]
+    )
+    for start in range(0, count, batch_size):
+        end = min(start + batch_size, count)
+        truncated[start:end] = vectors[start:end]
+    truncated.flush()
+    del vectors, truncated
+    os.replace(path + ".tmp", path)
+
+
+async def export_snapshot(redis_conns: List[Redis], output: str, batch_size: int = 1000):
+    """Streams all the papers of the DBs (the shards, or the main DB) into a snapshot"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(output, exist_ok=True)
+    dims = get_vector_dims()
+    definition = await read_index_definition(redis_conns[0])
+    if definition["vector_name"] not in dims:
+        raise RuntimeError(
+            f"The papers index is built on {definition['vector_name']}, which is only exported with PROJECTION_PATH"
+        )
+    keys = []
+    for conn in redis_conns:
+        keys += [(conn, key) async for key in conn.scan_iter(match=f"{PAPER_PREFIX}*", count=batch_size)]
+    n = len(keys)
+    schema = metadata_schema()
+    # Sized for all the papers, and truncated to the exported ones if some of them are skipped
+    vectors = {
+        field: np.lib.format.open_memmap(
+            os.path.join(output, f"{field}.npy"), mode="w+", dtype=np.float32, shape=(n, dim)
+        )
+        for field, dim in dims.items()
+    }
+    count = 0
+    skipped = 0
+    ignored_fields = set()
+    writer = pq.ParquetWriter(os.path.join(output, METADATA_FILE), schema)
+    try:
+        for start in range(0, n, batch_size):
+            batch = keys[start:start + batch_size]
+            pipes = {id(conn): conn.pipeline(transaction=False) for conn in redis_conns}
+            for conn, key in batch:
+                pipes[id(conn)].hgetall(key)
+            results = {conn_id: iter(await pipe.execute()) for conn_id, pipe in pipes.items()}
+            columns = {field: [] for field in PAPER_FIELDS}
+            for conn, _ in batch:
+                paper = {decode_text(field): value for field, value in next(results[id(conn)]).items()}
+                paper_vectors = read_paper_vectors(paper, dims)
+                if paper_vectors is None:
+                    skipped += 1
+                    continue
+                for field, vector in paper_vectors.items():
+                    vectors[field][count] = vector
+                count += 1
+                for field in PAPER_FIELDS:
+                    value = paper.get(field)
+                    columns[field].append(value if value is None or field in BINARY_FIELDS else decode_text(value))
+                ignored_fields.update(set(paper) - set(PAPER_FIELDS) - set(dims))
+            writer.write_table(pa.table(columns, schema=schema))
+    finally:
+        writer.close()
+    for field_vectors in vectors.values():
+        field_vectors.flush()
+    del vectors
+    if skipped:
+        for field in dims:
+            truncate_vectors(os.path.join(output, f"{field}.npy"), count)
+
+    with open(os.path.join(output, SNAPSHOT_FILE), "w") as f:
+        json.dump({
+            "count": count,
+            "skipped": skipped,
+            "vectors": {field: f"{field}.npy" for field in dims},
+            "index": definition,
+            "created_at": datetime.datetime.utcnow().isoformat(),
+        }, f, indent=2)
+    print(f"{count} papers exported to {output}")
+    if skipped:
+        print(f"{skipped} papers skipped: missing vectors, or vectors without the expected dimension")
+    if ignored_fields:
+        print(f"Fields not exported: {', '.join(sorted(ignored_fields))}")
+
+
+async def restore_snapshot(redis_conn: Redis, path: str, shard_conns: List[Redis] = None, batch_size: int = 1000):
+    """
+    Loads a snapshot into an empty DB (or empty shards, each paper going to the shard its id hashes to), then
+    rebuilds the papers index with the exported definition, and the publication counters.
+    """
+    import pyarrow.parquet as pq
+
+    info = read_snapshot_info(path)
+    conns = shard_conns or [redis_conn]
+    for conn in conns:
+        async for _ in conn.scan_iter(match=f"{PAPER_PREFIX}*"):
+            raise RuntimeError("A snapshot can only be restored into a DB without papers")
+
+    vectors = {field: np.load(os.path.join(path, file), mmap_mode="r") for field, file in info["vectors"].items()}
+    counts = [0] * len(conns)
+    row = 0
+    for batch in pq.ParquetFile(os.path.join(path, METADATA_FILE)).iter_batches(batch_size=batch_size):
+        pipes = [conn.pipeline(transaction=False) for conn in conns]
+        for i, paper in enumerate(batch.to_pylist(), start=row):
+            if paper["paper_id"] is None:
+                continue
+            mapping = {field: value for field, value in paper.items() if value is not None}
+            for field, field_vectors in vectors.items():
+                mapping[field] = np.asarray(field_vectors[i], dtype=np.float32).tobytes()
+            owner = shard_of(paper["paper_id"], len(conns))
+            pipes[owner].hset(f"{PAPER_PREFIX}{paper['paper_id']}", mapping=mapping)
+            counts[owner] += 1
+        await asyncio.gather(*[pipe.execute() for pipe in pipes])
+        row += batch.num_rows
+    print(f"{sum(counts)} papers restored")
+
+    definition = info["index"]
+    dim = vectors[definition["vector_name"]].shape[1]
+    for conn, count in zip(conns, counts):
+        await reindex(
+            conn,
+            count,
+            definition["index_type"],
+            definition["prefix"],
+            definition["distance_metric"],
+            vector_name=definition["vector_name"],
+            dim=dim,
+            **definition["hnsw_params"]
+        )
+        await rebuild_publication_counts(conn)
+    if shard_conns:
+        await bump_index_version(redis_conn)
+
+
+def read_snapshot(path: str) -> Tuple[List[Dict], np.ndarray]:
+    """Papers of a snapshot (their hash fields, with the abstracts decompressed) and their vectors (memory-mapped)"""
+    import pyarrow.parquet as pq
+
+    info = read_snapshot_info(path)
+    papers = [
+        decode_paper({field: value for field, value in paper.items() if value is not None})
+        for paper in pq.read_table(os.path.join(path, METADATA_FILE)).to_pylist()
+    ]
+    vectors = np.load(os.path.join(path, info["vectors"][config.VECTOR_NAME]), mmap_mode="r")
+    return papers, vectors
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Snapshot export and restore of the papers")
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export all the papers into a snapshot")
+    export_parser.add_argument("--output", required=True)
+    export_parser.add_argument("--batch-size", type=int, default=1000)
+    restore_parser = subparsers.add_parser("restore", help="Restore a snapshot into an empty DB, and index it")
+    restore_parser.add_argument("--input", required=True)
+    restore_parser.add_argument("--batch-size", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    shard_conns = get_shard_connexions()
+    if args.command == "export":
+        asyncio.run(export_snapshot(shard_conns or [get_redis_connexion()], args.output, args.batch_size))
+    else:
+        asyncio.run(restore_snapshot(get_redis_connexion(), args.input, shard_conns, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Topics of the corpus: an offline (spherical) mini-batch k-means over the vectors of all the papers.
+
+Each paper is assigned the topic of its nearest centroid (its 'topic_id' tag), and the centroids are stored in a
+small vector index, along with the precomputed timeline of each topic (papers per year) and its top papers (the
+nearest to its centroid). A broad query matching a topic is then summarized from these, instead of searching and
+hydrating its k most similar papers (see src.redis_db.find_broad_topic).
+    python -m src.topics fit --store ./arxiv_embeddings_300000_completed --topics 256 --output ./topics
+    python -m src.topics upload --topics-path ./topics
+
+Once uploaded, set TOPICS_PATH so that the papers loaded afterwards are assigned a topic (and counted) at ingestion,
+and rebuild the papers index (make reindex) so that it indexes their 'topic_id'.
+"""
+import os
+import json
+import asyncio
+import argparse
+import functools
+import numpy as np
+import src.config as config
+
+from typing import Dict, List, Tuple
+from src.neighbours import StoreMatrix, read_paper_ids
+
+CENTROIDS_FILE = "centroids.npy"
+ASSIGNMENTS_FILE = "assignments.npy"
+SCORES_FILE = "scores.npy"
+TOPICS_FILE = "topics.json"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def take_rows(matrix: StoreMatrix, indexes: np.ndarray) -> np.ndarray:
+    """Rows of the matrix at the given (sorted) indexes"""
+    rows = []
+    for offset, block in matrix.iter_blocks():
+        selected = indexes[(indexes >= offset) & (indexes < offset + len(block))]
+        if len(selected):
+            rows.append(block[selected - offset])
+    return np.concatenate(rows)
+
+
+def fit_topics(
+        stores: List[str],
+        n_topics: int = config.TOPICS_N,
+        batch_size: int = 4096,
+        n_epochs: int = 2,
+        seed: int = 0
+) -> np.ndarray:
+    """
+    (n_topics, dim) unit centroids, fitted by mini-batch k-means on the inner product: each batch of papers is
+    assigned to its nearest centroids, which move to the running mean of all the papers assigned to them so far.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = StoreMatrix(stores)
+    n = len(matrix)
+    centroids = normalize_rows(take_rows(matrix, np.sort(rng.choice(n, size=n_topics, replace=False))))
+    counts = np.zeros(n_topics)
+    for _ in range(n_epochs):
+        permutation = rng.permutation(n)
+        for start in range(0, n, batch_size):
+            batch = take_rows(matrix, np.sort(permutation[start:start + batch_size]))
+            labels = np.argmax(batch @ centroids.T, axis=1)
+            batch_counts = np.bincount(labels, minlength=n_topics)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, batch)
+            counts += batch_counts
+            updated = batch_counts > 0
+            centroids[updated] += (
+                (sums[updated] - batch_counts[updated, None] * centroids[updated]) / counts[updated, None]
+            )
+            centroids = normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+
+def assign_topics(stores: List[str], centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Topic of each paper of the stores (its nearest centroid), and its similarity with it"""
+    labels, scores = [], []
+    for _, block in StoreMatrix(stores).iter_blocks():
+        similarities = block @ centroids.T
+        labels.append(np.argmax(similarities, axis=1))
+        scores.append(np.max(similarities, axis=1))
+    return np.concatenate(labels).astype(np.int32), np.concatenate(scores).astype(np.float32)
+
+
+def save_topics(
+        path: str,
+        stores: List[str],
+        paper_ids: List[str],
+        centroids: np.ndarray,
+        labels: np.ndarray,
+        scores: np.ndarray
+):
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, CENTROIDS_FILE), centroids)
+    np.save(os.path.join(path, ASSIGNMENTS_FILE), labels)
+    np.save(os.path.join(path, SCORES_FILE), scores)
+    with open(os.path.join(path, TOPICS_FILE), "w") as f:
+        json.dump({"stores": stores, "n_topics": int(len(centroids)), "paper_ids": paper_ids}, f)
+
+
+def load_topics(path: str) -> Tuple[Dict, np.ndarray, np.ndarray, np.ndarray]:
+    with open(os.path.join(path, TOPICS_FILE)) as f:
+        topics = json.load(f)
+    centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+    labels = np.load(os.path.join(path, ASSIGNMENTS_FILE))
+    scores = np.load(os.path.join(path, SCORES_FILE))
+    return topics, centroids, labels, scores
+
+
+@functools.lru_cache()
+def load_centroids(path: str = config.TOPICS_PATH) -> np.ndarray:
+    return np.load(os.path.join(path, CENTROIDS_FILE))
+
+
+def nearest_topic(vector: np.ndarray, centroids: np.ndarray = None) -> int:
+    """Topic of a paper vector (by default, among the centroids of TOPICS_PATH)"""
+    centroids = load_centroids() if centroids is None else centroids
+    return int(np.argmax(centroids @ np.asarray(vector, dtype=np.float32)))
+
+
+def top_papers(labels: np.ndarray, scores: np.ndarray, n_topics: int, n_papers: int) -> List[np.ndarray]:
+    """Rows of the n_papers papers nearest to the centroid of each topic, by decreasing similarity"""
+    order = np.lexsort((-scores, labels))
+    starts = np.searchsorted(labels[order], np.arange(n_topics + 1))
+    return [order[starts[topic]:starts[topic + 1]][:n_papers] for topic in range(n_topics)]
+
+
+def build_topics(stores: List[str], output: str, n_topics: int = config.TOPICS_N, batch_size: int = 4096):
+    """Fits the topics of the papers of the stores, and assigns each paper its topic"""
+    centroids = fit_topics(stores, n_topics, batch_size)
+    labels, scores = assign_topics(stores, centroids)
+    save_topics(output, stores, read_paper_ids(stores), centroids, labels, scores)
+    sizes = np.bincount(labels, minlength=n_topics)
+    print(f"{n_topics} topics of {len(labels)} papers saved to {output} (sizes: {sizes.min()} to {sizes.max()})")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Topics of the corpus (mini-batch k-means of the papers)")
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    fit_parser = subparsers.add_parser("fit", help="Fit the topics of the papers of vector stores")
+    fit_parser.add_argument("--store", nargs="+", required=True)
+    fit_parser.add_argument("--output", required=True)
+    fit_parser.add_argument("--topics", type=int, default=config.TOPICS_N)
+    fit_parser.add_argument("--batch-size", type=int, default=4096)
+    upload_parser = subparsers.add_parser(
+        "upload", help="Tag the papers with their topic, and store the centroids index and topic timelines in redis"
+    )
+    upload_parser.add_argument("--topics-path", required=True)
+    args = arg_parser.parse_args()
+
+    if args.command == "fit":
+        build_topics(args.store, args.output, args.topics, args.batch_size)
+    else:
+        from src.redis_db import get_redis_connexion, get_shard_connexions, upload_topics
+        asyncio.run(upload_topics(get_redis_connexion(), args.topics_path, get_shard_connexions()))
+
+
+if __name__ == "__main__":
+    main()
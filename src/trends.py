@@ -0,0 +1,165 @@
+"""
+Topic trends normalized by the overall publication volume.
+
+The raw number of similar papers per year mostly follows the growth of arXiv itself. The topic share divides it
+by the number of papers published that year (overall, or in the selected categories), read from the publication
+counters maintained at ingestion (see src.redis_db.count_publication): no documents are scanned at query time.
+The fitted forecast is cached per (query, filters, k), next to the search results.
+The trend of a broad query can also be computed from the precomputed yearly counts of the topics it matches
+(see get_broad_topic_trend).
+"""
+import json
+import asyncio
+import numpy as np
+import src.config as config
+
+from collections import Counter
+from typing import Dict, List, Union
+from redis.asyncio import Redis
+from src.metrics import timer
+from src.results import ResultSet
+from src.redis_db import (
+    get_index_version,
+    get_publication_counts,
+    get_shared_redis_connexion,
+    get_shared_shard_connexions,
+    make_filters_dict,
+    make_result_cache_key,
+    run_on_shared_loop
+)
+
+
+def fit_trend_forecast(years: List[int], values: List[float], horizon: int = 2):
+    """Holt (damped trend) forecast of a yearly series for the next horizon years, if it has 5 years or more"""
+    if len(years) < 5:
+        return None
+    import pandas as pd
+    from statsmodels.tsa.holtwinters import Holt
+
+    ts_index = pd.date_range(start=str(years[0]), end=str(years[-1] + 1), freq="A")
+    ts_series = pd.Series(np.asarray(values, dtype=float), ts_index)
+    with timer("holt_fit"):
+        forecast = (
+            Holt(ts_series, damped_trend=True, initialization_method="estimated")
+            .fit(smoothing_level=0.8, smoothing_trend=0.2)
+            .forecast(horizon)
+        )
+    return [float(value) for value in forecast.values]
+
+
+def compute_yearly_trend(yearly_counts: Dict[int, int], publication_counts: Dict[str, int] = None) -> Dict:
+    """
+    Yearly number of papers, from the first to the last year of yearly_counts, along with:
+        - share: this number divided by the number of papers published that year (when publication_counts are
+          given, see src.redis_db.get_publication_counts)
+        - forecast: the forecast of the share (or of the raw counts, without publication_counts) for the next
+          two years, if 5 years of history or more are available
+    The trend of empty yearly_counts has no years.
+    """
+    if not yearly_counts:
+        return {
+            "years": [],
+            "counts": [],
+            "normalized": bool(publication_counts),
+            "share": [] if publication_counts else None,
+            "forecast_years": [],
+            "forecast": [],
+        }
+    years = list(range(min(yearly_counts), max(yearly_counts) + 1))
+    counts = np.array([yearly_counts.get(year, 0) for year in years])
+    normalized = bool(publication_counts)
+    if normalized:
+        totals = np.array([publication_counts.get(str(year), 0) for year in years], dtype=float)
+        share = np.divide(counts, totals, out=np.zeros(len(years)), where=totals > 0)
+    forecast = fit_trend_forecast(years, share if normalized else counts)
+    return {
+        "years": years,
+        "counts": counts.tolist(),
+        "normalized": normalized,
+        "share": share.tolist() if normalized else None,
+        "forecast_years": list(range(years[-1] + 1, years[-1] + 3)) if forecast is not None else [],
+        "forecast": forecast or [],
+    }
+
+
+def compute_topic_trend(
+        query_results: Union[ResultSet, List[Dict]],
+        publication_counts: Dict[str, int] = None
+) -> Dict:
+    """Trend of the yearly number of papers of the results (see compute_yearly_trend)"""
+    return compute_yearly_trend(Counter(ResultSet.of(query_results)["year"].tolist()), publication_counts)
+
+
+async def sum_publication_counts(redis_conns: List[Redis], categories: List[str] = None) -> Dict[str, int]:
+    """Publication counters, summed over several DBs (the shards)"""
+    publication_counts = {}
+    for conn_counts in await asyncio.gather(*[get_publication_counts(conn, categories) for conn in redis_conns]):
+        for period, count in conn_counts.items():
+            publication_counts[period] = publication_counts.get(period, 0) + count
+    return publication_counts
+
+
+async def get_topic_trend_async(
+        redis_conn: Redis,
+        user_text: str,
+        filters_dict: Dict[str, List[str]],
+        k: int,
+        query_results: Union[ResultSet, List[Dict]],
+        ttl: int = config.TREND_CACHE_TTL,
+        shard_conns: List[Redis] = None,
+        **search_options
+) -> Dict:
+    """
+    Topic trend of the results of a query (see compute_topic_trend), cached per (query, filters, k) and
+    search_options (the options the results were searched with, e.g. mmr_lambda).
+    With shard_conns, the publication counters of all the shards are summed.
+    """
+    index_version = await get_index_version(redis_conn)
+    cache_key = make_result_cache_key(
+        index_version, user_text, filters_dict, k, prefix=config.TREND_CACHE_PREFIX, **search_options
+    )
+    cached = await redis_conn.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
+
+    publication_counts = await sum_publication_counts(shard_conns or [redis_conn], filters_dict.get("categories"))
+    trend = compute_topic_trend(query_results, publication_counts)
+    await redis_conn.set(cache_key, json.dumps(trend), ex=ttl)
+    return trend
+
+
+def get_topic_trend(
+        user_text: str,
+        k: int,
+        year_min: int,
+        year_max: int,
+        categories: List[str],
+        query_results: Union[ResultSet, List[Dict]],
+        mmr_lambda: float = None
+) -> Dict:
+    """Topic trend of the results of a user query, on the shared redis connection pool of the process"""
+    return run_on_shared_loop(get_topic_trend_async(
+        redis_conn=get_shared_redis_connexion(),
+        user_text=user_text,
+        filters_dict=make_filters_dict(year_min, year_max, categories),
+        k=k,
+        query_results=query_results,
+        shard_conns=get_shared_shard_connexions(),
+        mmr_lambda=mmr_lambda
+    ))
+
+
+async def get_broad_topic_trend_async(redis_conn: Redis, broad_topic: Dict, shard_conns: List[Redis] = None) -> Dict:
+    """Topic trend of a broad query, from the yearly counts of its topics (see src.redis_db.find_broad_topic)"""
+    publication_counts = await sum_publication_counts(shard_conns or [redis_conn])
+    yearly_counts = {int(year): count for year, count in broad_topic["counts"].items()}
+    return compute_yearly_trend(yearly_counts, publication_counts)
+
+
+def get_broad_topic_trend(broad_topic: Dict) -> Dict:
+    """Topic trend of a broad query, on the shared redis connection pool of the process"""
+    return run_on_shared_loop(get_broad_topic_trend_async(
+        redis_conn=get_shared_redis_connexion(),
+        broad_topic=broad_topic,
+        shard_conns=get_shared_shard_connexions()
+    ))
@@ -0,0 +1,259 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE_TEMPLATE = "vectors-{:05d}.npy"
+METADATA_FILE_TEMPLATE = "metadata-{:05d}.jsonl"
+ID_INDEX_FILE = "id-index.npy"
+METADATA_OFFSETS_FILE = "metadata-offsets.npy"
+# Sorted (hashed id, row) pairs: 16 bytes per paper, whatever the size of its record and vector
+ID_INDEX_DTYPE = np.dtype([("key", np.uint64), ("row", np.int64)])
+
+
+def hash_paper_id(paper_id: str) -> int:
+    """Hashes a paper id to a 64 bits integer, used as key of the id indexes"""
+    digest = hashlib.blake2b(str(paper_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class VectorStoreWriter:
+    """
+    Writes papers to a chunked binary store, without keeping the whole dataset in memory.
+
+    The store is a directory holding, for each chunk:
+        - vectors-XXXXX.npy: a (n, dim) array of embeddings (float32, or float16 to halve its size)
+        - metadata-XXXXX.jsonl: one JSON record per vector, in the same order
+    along with, written when the writer is closed:
+        - id-index.npy: the rows of the papers by hashed id (see find in VectorStore)
+        - metadata-offsets.npy: the byte offset of the record of each row in its metadata file
+        - manifest.json: the chunks of the store
+    """
+
+    def __init__(
+            self,
+            path: str,
+            dim: int,
+            dtype: str = "float32",
+            chunk_size: int = 10000,
+            id_field: str = "id"
+    ):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.id_field = id_field
+        self.chunks = []
+        self._records = []
+        self._vectors = []
+        self._keys = []
+        self._offsets = []
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, record: Dict, vector) -> None:
+        self.extend([record], np.asarray(vector)[None])
+
+    def extend(self, records: List[Dict], vectors) -> None:
+        """Appends a batch of papers, e.g. the output of an embedding model, in slices of the (n, dim) vectors"""
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        if vectors.shape != (len(records), self.dim):
+            raise ValueError(f"Expected {len(records)} vectors of dimension {self.dim}, got shape {vectors.shape}")
+        start = 0
+        while start < len(records):
+            end = min(len(records), start + self.chunk_size - len(self._records))
+            self._records += records[start:end]
+            self._vectors.append(vectors[start:end])
+            if len(self._records) >= self.chunk_size:
+                self.flush()
+            start = end
+
+    def flush(self) -> None:
+        if not self._records:
+            return
+        chunk_id = len(self.chunks)
+        vectors_file = VECTORS_FILE_TEMPLATE.format(chunk_id)
+        metadata_file = METADATA_FILE_TEMPLATE.format(chunk_id)
+        np.save(os.path.join(self.path, vectors_file), np.concatenate(self._vectors))
+        offset = 0
+        with open(os.path.join(self.path, metadata_file), "wb") as f:
+            for record in self._records:
+                line = (json.dumps(record) + "\n").encode()
+                f.write(line)
+                self._keys.append(hash_paper_id(record.get(self.id_field)))
+                self._offsets.append(offset)
+                offset += len(line)
+        self.chunks.append({"vectors": vectors_file, "metadata": metadata_file, "count": len(self._records)})
+        self._records = []
+        self._vectors = []
+
+    def close(self) -> None:
+        self.flush()
+        manifest = {
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "count": sum(chunk["count"] for chunk in self.chunks),
+            "chunks": self.chunks,
+            **save_id_index(self.path, np.array(self._keys, dtype=np.uint64), np.array(self._offsets, dtype=np.int64))
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def save_id_index(path: str, keys: np.ndarray, offsets: np.ndarray) -> Dict:
+    """Saves the id index (sorted by hashed id) and the metadata offsets of a store, returns their manifest entries"""
+    index = np.empty(len(keys), dtype=ID_INDEX_DTYPE)
+    index["key"] = keys
+    index["row"] = np.arange(len(keys))
+    index = index[np.argsort(keys, kind="stable")]
+    np.save(os.path.join(path, ID_INDEX_FILE), index)
+    np.save(os.path.join(path, METADATA_OFFSETS_FILE), offsets)
+    return {"id_index": ID_INDEX_FILE, "metadata_offsets": METADATA_OFFSETS_FILE}
+
+
+def build_id_index(path: str, id_field: str = "id") -> None:
+    """Adds the id index and the metadata offsets to a store written without them"""
+    manifest = read_manifest(path)
+    keys, offsets = [], []
+    for chunk in manifest["chunks"]:
+        offset = 0
+        with open(os.path.join(path, chunk["metadata"]), "rb") as f:
+            for line in f:
+                keys.append(hash_paper_id(json.loads(line).get(id_field)))
+                offsets.append(offset)
+                offset += len(line)
+    manifest.update(save_id_index(path, np.array(keys, dtype=np.uint64), np.array(offsets, dtype=np.int64)))
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def is_vector_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def read_manifest(path: str) -> Dict:
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def iter_chunks(path: str) -> Iterator[Tuple[List[Dict], np.ndarray]]:
+    """Yields (metadata records, memory-mapped vectors) for every chunk of the store."""
+    for chunk in read_manifest(path)["chunks"]:
+        vectors = np.load(os.path.join(path, chunk["vectors"]), mmap_mode="r")
+        with open(os.path.join(path, chunk["metadata"])) as f:
+            records = [json.loads(line) for line in f]
+        yield records, vectors
+
+
+def read_vector_store(path: str) -> "pd.DataFrame":
+    """Loads a whole store as a dataframe, the embeddings in a 'vector' column (views of the memory-mapped chunks)."""
+    import pandas as pd
+    frames = []
+    for records, vectors in iter_chunks(path):
+        frame = pd.DataFrame.from_records(records)
+        frame["vector"] = list(np.asarray(vectors))
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+class VectorStore:
+    """
+    Read side of a store, for the stages of the pipeline: its vectors stay memory-mapped chunk by chunk (slices
+    within a chunk are views, not copies), its records are read on demand at their offset in the metadata files,
+    and its papers are found by id through the id index.
+
+        with VectorStore("./arxiv_embeddings_300000") as store:
+            row = store.find("2106.01345")
+            store.record(row), store.vector(row)
+            store.vectors(0, 1000)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest = read_manifest(path)
+        self.chunks = [
+            np.load(os.path.join(path, chunk["vectors"]), mmap_mode="r") for chunk in self.manifest["chunks"]
+        ]
+        self.offsets = np.cumsum([0] + [chunk["count"] for chunk in self.manifest["chunks"]])
+        if "id_index" not in self.manifest:
+            # Store written before the id index existed: it is added to the store once
+            build_id_index(path)
+            self.manifest = read_manifest(path)
+        self.id_index = np.load(os.path.join(path, self.manifest["id_index"]), mmap_mode="r")
+        self.metadata_offsets = np.load(os.path.join(path, self.manifest["metadata_offsets"]), mmap_mode="r")
+        self._metadata_files = {}
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def dim(self) -> int:
+        return self.manifest["dim"]
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.manifest["dtype"])
+
+    def locate(self, row: int) -> Tuple[int, int]:
+        """(chunk, row in the chunk) of a row of the store"""
+        chunk_id = int(np.searchsorted(self.offsets, row, side="right")) - 1
+        return chunk_id, int(row - self.offsets[chunk_id])
+
+    def vector(self, row: int) -> np.ndarray:
+        chunk_id, chunk_row = self.locate(row)
+        return self.chunks[chunk_id][chunk_row]
+
+    def vectors(self, start: int = 0, end: int = None) -> np.ndarray:
+        """Vectors of the rows [start, end): a memory-mapped view within a chunk, a copy across chunks"""
+        end = len(self) if end is None else min(end, len(self))
+        blocks = []
+        for chunk_id, chunk in enumerate(self.chunks):
+            offset = self.offsets[chunk_id]
+            if offset < end and offset + len(chunk) > start:
+                blocks.append(chunk[max(0, start - offset):end - offset])
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate(blocks) if blocks else np.empty((0, self.dim), dtype=self.dtype)
+
+    def record(self, row: int) -> Dict:
+        chunk_id, _ = self.locate(row)
+        if chunk_id not in self._metadata_files:
+            metadata_file = self.manifest["chunks"][chunk_id]["metadata"]
+            self._metadata_files[chunk_id] = open(os.path.join(self.path, metadata_file), "rb")
+        f = self._metadata_files[chunk_id]
+        f.seek(int(self.metadata_offsets[row]))
+        return json.loads(f.readline())
+
+    def find(self, paper_id: str, id_field: str = "id") -> Optional[int]:
+        """Row of a paper, None if it is not in the store (the records of colliding hashes are compared)"""
+        keys = self.id_index["key"]
+        key = np.uint64(hash_paper_id(paper_id))
+        start = np.searchsorted(keys, key, side="left")
+        end = np.searchsorted(keys, key, side="right")
+        for row in self.id_index["row"][start:end]:
+            if str(self.record(row).get(id_field)) == str(paper_id):
+                return int(row)
+        return None
+
+    def close(self) -> None:
+        for f in self._metadata_files.values():
+            f.close()
+        self._metadata_files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
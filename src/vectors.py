@@ -2,13 +2,19 @@ import re
 import json
 import pickle
 import string
-import pandas as pd
+import threading
+import numpy as np
 import src.config as config
-import sentence_transformers
 from tqdm import tqdm
+from typing import Dict, Iterable, TYPE_CHECKING
 from src.categories import _map
-from sentence_transformers import SentenceTransformer
-tqdm.pandas()
+from src.vector_store import VectorStore, VectorStoreWriter
+from src.metrics import timer
+
+# pandas and sentence_transformers (torch) are heavy to import: they are only imported when first needed
+if TYPE_CHECKING:
+    import pandas as pd
+    import sentence_transformers
 
 
 def save_pickle(obj, path: str) -> None:
@@ -31,32 +37,132 @@ def load_raw_data(path: str = "./../lib/data/arxiv-metadata-oai-snapshot.json"):
     return arxiv_list
 
 
-def map_categories_to_value(categories: pd.Series):
-    mapping = {key.lower(): value.lower() for key, value in _map.items()}
-    categories = categories.str.lower()
-    return categories.replace(mapping)
+# Precomputed token dictionary: arXiv category codes and names (lower case) -> normalized category tags.
+# A few names are shared by several codes (e.g. "Machine Learning" is both cs.LG and stat.ML): they map to all of them
+CATEGORY_TOKENS = {}
+for _code, _name in _map.items():
+    CATEGORY_TOKENS[_name.lower()] = CATEGORY_TOKENS.get(_name.lower(), ()) + (_code.lower(),)
+CATEGORY_TOKENS.update({code.lower(): (code.lower(),) for code in _map.keys()})
+CATEGORY_SPLIT_PATTERN = re.compile(r"[\s,|]+")
 
 
-def add_missing_columns_to_embedding_file(
-        embeddings_path: str = "./arxiv_embeddings_300000.json",
-        raw_data_path: str = "./arxiv-metadata-oai-snapshot.json",
-        save_to: str = "./arxiv_embeddings_300000_completed.json",
-        sample_raw_data: int = None
+def normalize_categories(categories: str) -> str:
+    """
+    Converts raw categories ("cs.LG stat.ML", "cs.lg, stat.ml", ...) into a normalized list of category tags,
+    delimited by config.CATEGORIES_SEPARATOR (e.g. "cs.lg,stat.ml"), so that they can be matched exactly.
+    A category name shared by several codes (e.g. "Machine Learning") is converted into all of them.
+    """
+    if not categories or categories == "None":
+        return ""
+    categories = str(categories).lower()
+    if categories in CATEGORY_TOKENS:
+        return config.CATEGORIES_SEPARATOR.join(CATEGORY_TOKENS[categories])
+    tags = []
+    for token in CATEGORY_SPLIT_PATTERN.split(categories):
+        for tag in CATEGORY_TOKENS.get(token, (token,)):
+            if tag and tag not in tags:
+                tags.append(tag)
+    return config.CATEGORIES_SEPARATOR.join(tags)
+
+
+def save_embeddings(
+        papers: "pd.DataFrame",
+        vectors: np.ndarray,
+        save_to: str = "./arxiv_embeddings_300000",
+        dtype: str = "float32",
+        chunk_size: int = 10000
+):
+    """
+    Saves the output of the embedding stage as a binary vector store (see src.vector_store): the (n, dim) vectors
+    of the model, and the other columns of the papers as their metadata (the 'vector' column, if any, is dropped).
+    """
+    records = papers.drop(columns=["vector"], errors="ignore").to_dict("records")
+    with VectorStoreWriter(save_to, dim=vectors.shape[1], dtype=dtype, chunk_size=chunk_size) as writer:
+        writer.extend(records, vectors)
+    print(f"{len(records)} embeddings saved to {save_to}")
+
 
+def embeddings_to_vector_store(
+        embeddings_path: str = "./arxiv_embeddings_300000.json",
+        save_to: str = "./arxiv_embeddings_300000",
+        dtype: str = "float32"
 ):
-    embeddings = pd.read_json(embeddings_path)
-    embeddings.categories = map_categories_to_value(embeddings.categories)
+    """One-off conversion of an embeddings file of the former pipeline (JSON or pickled DataFrame) to a vector store"""
+    import pandas as pd
+    if embeddings_path.endswith(".pkl"):
+        papers = load_pickle(embeddings_path)
+    else:
+        papers = pd.read_json(embeddings_path, dtype={"id": str}, lines=embeddings_path.endswith(".jsonl"))
+    save_embeddings(papers, np.stack(papers["vector"].values), save_to, dtype)
+
+
+def join_vector_store(
+        embeddings_path: str,
+        records: Iterable[Dict],
+        save_to: str,
+        chunk_size: int = 10000
+) -> int:
+    """
+    Streaming hash join on 'id' of a vector store with records (e.g. the raw arXiv snapshot, read line by line):
+    each record is probed in the id index of the store, and the matched papers are written, with the columns of
+    the record they miss, to a new store at save_to. Returns the number of matched papers.
+
+    Only the id index of the embeddings and one chunk of output are held in memory, and the vectors are copied
+    from their memory-mapped chunks, without being parsed.
+    """
+    n_matched = 0
+    with VectorStore(embeddings_path) as embeddings:
+        writer = VectorStoreWriter(save_to, dim=embeddings.dim, dtype=embeddings.dtype.name, chunk_size=chunk_size)
+        with writer:
+            for record in records:
+                row = embeddings.find(record["id"])
+                if row is None:
+                    continue
+                embedding = embeddings.record(row)
+                if "categories" in embedding:
+                    embedding["categories"] = normalize_categories(embedding["categories"])
+                writer.append(merge_records(embedding, record), embeddings.vector(row))
+                n_matched += 1
+    return n_matched
 
-    raw_data = load_raw_data(raw_data_path)
-    raw_data = pd.DataFrame.from_records(raw_data)
-    if sample_raw_data:
-        raw_data = raw_data.loc[:sample_raw_data]
-    raw_data = raw_data[['id']+list(set(raw_data.columns) - set(embeddings.columns))]
 
-    data = pd.merge(embeddings, raw_data, on="id", how="inner")
-    data = data.fillna("None")
-    data.to_json(save_to)
-    print(f"File saved to {save_to}")
+def add_missing_columns_to_embedding_file(
+        embeddings_path: str = "./arxiv_embeddings_300000",
+        raw_data_path: str = "./arxiv-metadata-oai-snapshot.json",
+        save_to: str = "./arxiv_embeddings_300000_completed",
+        sample_raw_data: int = None,
+        chunk_size: int = 10000
+):
+    """
+    Enriches the embeddings (a vector store, see save_embeddings) with the raw arXiv snapshot's columns: the raw
+    snapshot is streamed line by line through the id index of the embeddings (see join_vector_store), and the
+    matched papers are written to the vector store at save_to.
+    """
+    def raw_records():
+        with open(raw_data_path) as raw_file:
+            for i, line in enumerate(tqdm(raw_file)):
+                if sample_raw_data is not None and i > sample_raw_data:
+                    break
+                yield json.loads(line)
+
+    n_matched = join_vector_store(embeddings_path, raw_records(), save_to, chunk_size)
+    print(f"{n_matched} papers saved to {save_to}")
+
+
+def merge_records(left: Dict, right: Dict) -> Dict:
+    """
+    Inner join of two matched records: right only brings the columns missing from left. Missing values become 'None'
+    """
+    record = dict(left)
+    for key, value in right.items():
+        if key not in record:
+            record[key] = value
+    return {key: "None" if value is None else value for key, value in record.items()}
+
+
+# Embedding models loaded in the process, by (model name, backend)
+_embedding_models = {}
+_embedding_models_lock = threading.Lock()
 
 
 def clean_text(text: str):
@@ -81,11 +187,38 @@ def clean_text(text: str):
     return text.lower()
 
 
+def load_embedding_model(model_name: str = config.EMBEDDING_MODEL, backend: str = config.EMBEDDING_BACKEND):
+    """
+    Loads the embedding model once per process: the FP32 model, or its int8 / ONNX conversion from
+    config.QUANTIZED_MODEL_PATH (see src.quantization).
+    The load is locked, so that the background warm-up and a concurrent first search share a single load.
+    """
+    key = (model_name, backend)
+    if key not in _embedding_models:
+        with _embedding_models_lock:
+            if key not in _embedding_models:
+                with timer("model_load"):
+                    if backend == "fp32":
+                        from sentence_transformers import SentenceTransformer
+                        _embedding_models[key] = SentenceTransformer(model_name)
+                    else:
+                        from src.quantization import load_quantized_model
+                        _embedding_models[key] = load_quantized_model(config.QUANTIZED_MODEL_PATH, backend)
+    return _embedding_models[key]
+
+
 def create_embedding(
         text: str,
-        model: sentence_transformers.SentenceTransformer = None
+        model: "sentence_transformers.SentenceTransformer" = None
 ):
+    if not model and config.EMBEDDING_SERVICE_URL:
+        # Client mode: the model runs in the embedding service, which batches concurrent requests
+        from src.embedding_service import request_embeddings
+        return request_embeddings([text])[0]
     if not model:
-        model = SentenceTransformer(config.EMBEDDING_MODEL)
-    embedding = model.encode(clean_text(text))
+        model = load_embedding_model()
+    with timer("clean_text"):
+        text = clean_text(text)
+    with timer("embedding"):
+        embedding = model.encode(text)
     return embedding
@@ -0,0 +1,14 @@
+from src.memory import OM_KEY_TYPE, get_bytes_per_paper, get_key_type
+
+
+def test_get_key_type():
+    assert get_key_type("paper_vector:1234") == "paper_vector"
+    assert get_key_type(":src.models.Paper:01G") == OM_KEY_TYPE
+
+
+def test_bytes_per_paper_include_redis_om_hashes():
+    papers = {"keys": 10, "estimated_total_bytes": 10000}
+    assert get_bytes_per_paper({"paper_vector": papers}) == 1000
+    om_hashes = {"keys": 10, "estimated_total_bytes": 6000}
+    assert get_bytes_per_paper({"paper_vector": papers, OM_KEY_TYPE: om_hashes}) == 1600
+    assert get_bytes_per_paper({}) is None
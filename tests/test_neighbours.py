@@ -0,0 +1,35 @@
+import numpy as np
+
+from src.neighbours import compute_neighbours_block
+from src.vector_store import VectorStoreWriter
+
+
+def write_store(path, vectors, chunk_size=3):
+    with VectorStoreWriter(str(path), dim=vectors.shape[1], chunk_size=chunk_size) as writer:
+        writer.extend([{"id": str(i)} for i in range(len(vectors))], vectors)
+    return str(path)
+
+
+def test_compute_neighbours_block_matches_brute_force(tmp_path):
+    vectors = np.random.default_rng(0).normal(size=(10, 4)).astype(np.float32)
+    stores = [write_store(tmp_path / "first", vectors[:7]), write_store(tmp_path / "second", vectors[7:])]
+    rows, scores = compute_neighbours_block(stores, 2, 8, n_neighbours=3)
+
+    similarities = vectors @ vectors.T
+    np.fill_diagonal(similarities, -np.inf)
+    expected = np.argsort(-similarities, axis=1, kind="stable")[:, :3]
+    np.testing.assert_array_equal(rows, expected[2:8])
+    np.testing.assert_allclose(scores, np.take_along_axis(similarities, expected, axis=1)[2:8], rtol=1e-5)
+
+
+def test_a_paper_is_not_its_own_neighbour(tmp_path):
+    vectors = np.ones((4, 2), dtype=np.float32)
+    rows, _ = compute_neighbours_block([write_store(tmp_path, vectors)], 0, 4, n_neighbours=3)
+    for row, neighbours in enumerate(rows):
+        assert row not in neighbours
+
+
+def test_candidates_start_restricts_the_neighbours(tmp_path):
+    vectors = np.random.default_rng(1).normal(size=(6, 3)).astype(np.float32)
+    rows, _ = compute_neighbours_block([write_store(tmp_path, vectors)], 0, 3, n_neighbours=2, candidates_start=3)
+    assert (rows >= 3).all()
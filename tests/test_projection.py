@@ -0,0 +1,27 @@
+import numpy as np
+
+from src.projection import exact_top_k, fit_projection, project_vectors
+from src.vector_store import VectorStoreWriter
+
+
+def test_projection_preserves_the_inner_products_of_a_subspace(tmp_path):
+    rng = np.random.default_rng(0)
+    basis = np.linalg.qr(rng.normal(size=(8, 3)))[0].T
+    vectors = (rng.normal(size=(50, 3)) @ basis).astype(np.float32)
+    with VectorStoreWriter(str(tmp_path), dim=8, chunk_size=20) as writer:
+        writer.extend([{"id": str(i)} for i in range(len(vectors))], vectors)
+
+    components = fit_projection(str(tmp_path), 3)
+    assert components.shape == (3, 8)
+    np.testing.assert_allclose(components @ components.T, np.eye(3), atol=1e-5)
+
+    projected = project_vectors(vectors, components)
+    np.testing.assert_allclose(projected @ projected.T, vectors @ vectors.T, atol=1e-4)
+    # Back to the full dimension, the vectors are unchanged
+    np.testing.assert_allclose(projected @ components, vectors, atol=1e-4)
+
+    queries = vectors[:5]
+    np.testing.assert_array_equal(
+        np.sort(exact_top_k(project_vectors(queries, components), str(tmp_path), 4, components), axis=1),
+        np.sort(exact_top_k(queries, str(tmp_path), 4), axis=1)
+    )
@@ -0,0 +1,24 @@
+import numpy as np
+
+from src.redis_db import maximal_marginal_relevance
+
+
+def test_mmr_with_lambda_1_ranks_by_relevance():
+    query = np.array([1, 0], dtype=np.float32)
+    vectors = np.array([[0.5, 0.5], [1, 0], [0, 1], [0.9, 0.1]], dtype=np.float32)
+    order = maximal_marginal_relevance(query, vectors, 4, mmr_lambda=1.0)
+    assert order.tolist() == [1, 3, 0, 2]
+
+
+def test_mmr_skips_near_duplicates():
+    query = np.array([1, 0], dtype=np.float32)
+    vectors = np.array([[1, 0.3], [1, 0.32], [1, -0.5]], dtype=np.float32)
+    assert maximal_marginal_relevance(query, vectors, 2, mmr_lambda=1.0).tolist() == [0, 1]
+    assert maximal_marginal_relevance(query, vectors, 2, mmr_lambda=0.5).tolist() == [0, 2]
+
+
+def test_mmr_returns_at_most_the_candidates():
+    query = np.array([1, 0], dtype=np.float32)
+    vectors = np.array([[1, 0], [0, 1]], dtype=np.float32)
+    order = maximal_marginal_relevance(query, vectors, 5)
+    assert sorted(order.tolist()) == [0, 1]
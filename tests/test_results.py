@@ -0,0 +1,50 @@
+import numpy as np
+
+from src.results import ResultSet
+
+PAPERS = [
+    {"paper_id": "b", "year": "2021", "month": "3", "similarity_score": "0.9", "citations": "x,y"},
+    {"paper_id": "a", "year": "2019", "month": "11", "similarity_score": "0.8", "citations": "x"},
+    {"paper_id": "c", "year": "2021", "month": "1", "citation_count": "7"},
+]
+
+
+def test_columns_are_typed():
+    results = ResultSet.from_dicts(PAPERS)
+    assert len(results) == 3
+    assert results["year"].dtype == np.int16
+    assert results["year"].tolist() == [2021, 2019, 2021]
+    assert results["similarity_score"].dtype == np.float32
+    # Missing numeric values are 0, missing list fields are empty
+    assert results["similarity_score"][2] == 0
+    assert results["citations"].tolist() == [("x", "y"), ("x",), ()]
+
+
+def test_citation_count_defaults_to_the_number_of_citations():
+    results = ResultSet.from_dicts(PAPERS)
+    assert results["citation_count"].tolist() == [2, 1, 7]
+
+
+def test_rows_and_order():
+    results = ResultSet.from_dicts(PAPERS)
+    assert results[1]["paper_id"] == "a"
+    assert isinstance(results[1]["year"], int)
+    assert [paper["paper_id"] for paper in results.take(results.date_order())] == ["a", "c", "b"]
+    assert ResultSet.of(results) is results
+
+
+def test_to_dicts_joins_the_list_fields_back():
+    papers = ResultSet.from_dicts(PAPERS).to_dicts()
+    assert papers[0]["citations"] == "x,y"
+    assert papers[0]["year"] == 2021
+
+
+def test_with_column():
+    results = ResultSet.from_dicts(PAPERS).with_column("list_index", ["1", "2", "3"])
+    assert results["list_index"].tolist() == [1, 2, 3]
+
+
+def test_empty_result_set():
+    results = ResultSet.from_dicts([])
+    assert len(results) == 0
+    assert results.to_dicts() == []
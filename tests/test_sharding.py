@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+from src.redis_db import merge_shard_results, shard_of
+
+
+def make_doc(paper_id, distance):
+    return SimpleNamespace(paper_id=paper_id, vector_score=str(distance))
+
+
+def test_shard_of_is_stable_and_in_range():
+    for paper_id in ["2106.01345", "1706.03762", "hep-th/9901001"]:
+        shard = shard_of(paper_id, 4)
+        assert 0 <= shard < 4
+        assert shard_of(paper_id, 4) == shard
+
+
+def test_shard_of_spreads_the_papers_over_all_the_shards():
+    shards = [shard_of(f"2201.{i:05d}", 3) for i in range(300)]
+    assert set(shards) == {0, 1, 2}
+    assert min(shards.count(shard) for shard in range(3)) > 50
+
+
+def test_merge_shard_results_orders_the_documents_by_distance():
+    shard_results = [
+        [make_doc("a", 0.1), make_doc("b", 0.4)],
+        [make_doc("c", 0.2), make_doc("d", 0.3), make_doc("e", 0.9)],
+        [],
+    ]
+    merged = merge_shard_results(shard_results)
+    assert [doc.paper_id for _, _, doc in merged] == ["a", "c", "d", "b", "e"]
+    assert [distance for distance, _, _ in merged] == [0.1, 0.2, 0.3, 0.4, 0.9]
+
+
+def test_merge_shard_results_keeps_the_shard_of_each_document():
+    merged = merge_shard_results([[make_doc("a", 0.5)], [make_doc("b", 0.1)]])
+    assert [(shard, doc.paper_id) for _, shard, doc in merged] == [(1, "b"), (0, "a")]
@@ -0,0 +1,27 @@
+import numpy as np
+
+from src.snapshot import read_paper_vectors, truncate_vectors
+
+
+def test_read_paper_vectors_checks_their_dimension():
+    dims = {"vector": 3, "vector_reduced": 2}
+    paper = {
+        "vector": np.arange(3, dtype=np.float32).tobytes(),
+        "vector_reduced": np.ones(2, dtype=np.float32).tobytes()
+    }
+    paper_vectors = read_paper_vectors(paper, dims)
+    assert paper_vectors["vector"].tolist() == [0, 1, 2]
+    assert paper_vectors["vector_reduced"].tolist() == [1, 1]
+    assert read_paper_vectors(dict(paper, vector=np.ones(4, dtype=np.float32).tobytes()), dims) is None
+    assert read_paper_vectors({"vector": paper["vector"]}, dims) is None
+
+
+def test_truncate_vectors(tmp_path):
+    path = str(tmp_path / "vector.npy")
+    np.save(path, np.arange(12, dtype=np.float32).reshape(4, 3))
+    truncate_vectors(path, 3, batch_size=2)
+    vectors = np.load(path)
+    assert vectors.shape == (3, 3)
+    assert vectors.tolist() == [[0, 1, 2], [3, 4, 5], [6, 7, 8]]
+    truncate_vectors(path, 2)
+    assert np.load(path).tolist() == [[0, 1, 2], [3, 4, 5]]
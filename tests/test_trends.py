@@ -0,0 +1,28 @@
+from src.trends import compute_yearly_trend
+
+
+def test_yearly_trend_fills_the_missing_years():
+    trend = compute_yearly_trend({2019: 2, 2021: 1})
+    assert trend["years"] == [2019, 2020, 2021]
+    assert trend["counts"] == [2, 0, 1]
+    assert not trend["normalized"]
+    assert trend["share"] is None
+    # Less than 5 years of history: no forecast
+    assert trend["forecast"] == [] and trend["forecast_years"] == []
+
+
+def test_yearly_trend_share_of_the_publications():
+    trend = compute_yearly_trend({2019: 2, 2020: 3, 2021: 1}, {"2019": 4, "2021": 2})
+    assert trend["normalized"]
+    assert trend["share"] == [0.5, 0.0, 0.5]
+
+
+def test_yearly_trend_of_no_papers():
+    trend = compute_yearly_trend({})
+    assert trend["years"] == [] and trend["counts"] == [] and trend["forecast"] == []
+
+
+def test_yearly_trend_forecast_with_enough_history():
+    trend = compute_yearly_trend({year: year - 2010 for year in range(2011, 2021)})
+    assert trend["forecast_years"] == [2021, 2022]
+    assert len(trend["forecast"]) == 2
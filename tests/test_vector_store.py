@@ -0,0 +1,63 @@
+import json
+import os
+
+import numpy as np
+
+from src.vector_store import MANIFEST_FILE, VectorStore, VectorStoreWriter, read_manifest
+
+
+def write_store(path, n=5, dim=4, chunk_size=2, dtype="float32"):
+    vectors = np.arange(n * dim, dtype=np.float32).reshape(n, dim)
+    records = [{"id": f"2201.{i:05d}", "title": f"paper {i}"} for i in range(n)]
+    with VectorStoreWriter(str(path), dim=dim, dtype=dtype, chunk_size=chunk_size) as writer:
+        writer.extend(records[:3], vectors[:3])
+        writer.append(records[3], vectors[3])
+        writer.extend(records[4:], vectors[4:])
+    return records, vectors
+
+
+def test_writer_splits_the_papers_into_chunks(tmp_path):
+    write_store(tmp_path)
+    manifest = read_manifest(str(tmp_path))
+    assert manifest["count"] == 5
+    assert [chunk["count"] for chunk in manifest["chunks"]] == [2, 2, 1]
+
+
+def test_find_record_and_vector(tmp_path):
+    records, vectors = write_store(tmp_path)
+    with VectorStore(str(tmp_path)) as store:
+        assert len(store) == 5
+        for row, record in enumerate(records):
+            assert store.find(record["id"]) == row
+            assert store.record(row) == record
+            np.testing.assert_array_equal(store.vector(row), vectors[row])
+        assert store.find("unknown") is None
+
+
+def test_vectors_are_views_within_a_chunk(tmp_path):
+    _, vectors = write_store(tmp_path)
+    with VectorStore(str(tmp_path)) as store:
+        within = store.vectors(2, 4)
+        assert isinstance(within, np.memmap)
+        np.testing.assert_array_equal(within, vectors[2:4])
+        np.testing.assert_array_equal(store.vectors(1, 5), vectors[1:5])
+        np.testing.assert_array_equal(store.vectors(), vectors)
+        assert store.vectors(5, 5).shape == (0, 4)
+
+
+def test_float16_store(tmp_path):
+    _, vectors = write_store(tmp_path, dtype="float16")
+    with VectorStore(str(tmp_path)) as store:
+        assert store.dtype == np.float16
+        np.testing.assert_allclose(store.vectors().astype(np.float32), vectors)
+
+
+def test_store_without_id_index_gets_one(tmp_path):
+    records, _ = write_store(tmp_path)
+    manifest = read_manifest(str(tmp_path))
+    del manifest["id_index"], manifest["metadata_offsets"]
+    with open(os.path.join(str(tmp_path), MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+    with VectorStore(str(tmp_path)) as store:
+        assert store.find(records[3]["id"]) == 3
+    assert "id_index" in read_manifest(str(tmp_path))
@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.vector_store import VectorStore, VectorStoreWriter
+from src.vectors import join_vector_store, normalize_categories
+
+
+def test_normalize_categories():
+    assert normalize_categories("cs.LG stat.ML") == "cs.lg,stat.ml"
+    assert normalize_categories("cs.lg, stat.ml") == "cs.lg,stat.ml"
+    assert normalize_categories("cs.LG cs.LG") == "cs.lg"
+    assert normalize_categories("") == ""
+    assert normalize_categories("None") == ""
+    assert normalize_categories("Artificial Intelligence") == "cs.ai"
+
+
+def test_normalize_ambiguous_category_names():
+    # names shared by several codes map to all of them, not to the first one
+    assert normalize_categories("Machine Learning") == "cs.lg,stat.ml"
+    assert normalize_categories("Information Theory") == "cs.it,math.it"
+    assert normalize_categories("Statistics Theory") == "math.st,stat.th"
+
+
+def test_join_vector_store(tmp_path):
+    embeddings_path, joined_path = str(tmp_path / "embeddings"), str(tmp_path / "joined")
+    vectors = np.eye(3, dtype=np.float32)
+    with VectorStoreWriter(embeddings_path, dim=3, chunk_size=2) as writer:
+        writer.extend([{"id": "a", "categories": "cs.LG"}, {"id": "b"}, {"id": "c"}], vectors)
+
+    records = [{"id": "c", "title": "third", "categories": "ignored"}, {"id": "z", "title": "missing"}]
+    assert join_vector_store(embeddings_path, records, joined_path) == 1
+    with VectorStore(joined_path) as joined:
+        assert len(joined) == 1
+        # The embeddings' columns are kept, the records only bring the missing ones
+        assert joined.record(0) == {"id": "c", "title": "third", "categories": "ignored"}
+        np.testing.assert_array_equal(joined.vector(0), vectors[2])
+
+    assert join_vector_store(embeddings_path, [{"id": "a", "categories": "stat.ML"}], joined_path) == 1
+    with VectorStore(joined_path) as joined:
+        assert joined.record(0)["categories"] == "cs.lg"